@@ -0,0 +1,616 @@
+import argparse
+import gc
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from lexer import Lexer, TableLexer, ArrayLexer, MappedLexer, map_file
+from parser import Parser, Expression, Literal, Operator
+from ir import Op, BINARY_OPS
+from vm import VM
+from cfg import split_regions
+from regalloc import REGISTERS
+from pycodegen import PythonProgram, CODE_CACHE
+from progen import ProgramShape, generate_program, generate_sized, parse_size, identifier
+import x86
+import parallel
+from pipeline import merged_assembly
+import client
+
+SAMPLE = """int a = 5;
+int add(int x, int y) {
+    int z = x + y * 2;
+    z = z - (1 + x) / 2;
+    int w;
+    w = z >= 40;
+}
+"""
+
+# nested loops for the execution benchmarks
+LOOP_SAMPLE = """int sum(int n, int k) {
+    int i = 0;
+    int s = 0;
+    while (i < n) {
+        int j = 0;
+        while (j < 8) {
+            s = s + (k * 4 + i) / 2;
+            j = j + 1;
+        }
+        if (s > 1000000) {
+            s = s - 1000000;
+        }
+        i = i + 1;
+    }
+}
+"""
+
+#build a source of roughly size_mb megabytes from copies of SAMPLE, with
+#the global and the function renamed in each copy so no name is declared
+#twice
+def make_source(size_mb):
+    copies = max(1, int(size_mb * 1024 * 1024) // len(SAMPLE))
+    return "".join(SAMPLE.replace("int a ", f"int {identifier('g', copy)} ", 1)
+                         .replace(" add(", f" {identifier('add', copy)}(", 1) for copy in range(copies))
+
+#best of repeat runs, in seconds. The result is freed outside the timed region
+def best_time(func, repeat):
+    best = None
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        del result
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+def scan(cls, source):
+    lexer = cls(source)
+    lexer.scan_tokens()
+    return lexer
+
+#lexer throughput: per-character Lexer against the table-driven TableLexer
+def bench_lexer(args):
+    source = make_source(args.size)
+    megabytes = len(source) / (1024 * 1024)
+
+    reference = Lexer(source)
+    reference.scan_tokens()
+    table = TableLexer(source)
+    table.scan_tokens()
+    if [(t.token_type, t.lexeme, t.line) for t in reference.tokens] != \
+       [(t.token_type, t.lexeme, t.line) for t in table.tokens]:
+        raise SystemExit("TableLexer token stream differs from Lexer")
+    print(f"source: {megabytes:.2f} MB, {len(table.tokens)} tokens")
+    del reference, table
+    for name, cls in (("Lexer", Lexer), ("TableLexer", TableLexer)):
+        seconds = best_time(lambda: scan(cls, source), args.repeat)
+        print(f"{name:<12} {seconds:8.3f} s  {megabytes / seconds:8.2f} MB/s")
+
+#peak traced memory of func(), in bytes
+def peak_memory(func):
+    gc.collect()
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+#lex a generated file read and decoded to text, against lexing a memory
+#map of it; time and peak traced memory both include getting the source
+def bench_mapped(args):
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "source.c")
+        with open(path, "w") as file:
+            file.write(generate_sized(parse_size(args.size), ProgramShape(seed=args.seed)))
+        megabytes = os.path.getsize(path) / (1024 * 1024)
+        print(f"source: {megabytes:.2f} MB")
+
+        def read_text():
+            with open(path) as file:
+                lexer = ArrayLexer(file.read())
+            lexer.scan_tokens()
+            return lexer
+
+        def mapped():
+            lexer = MappedLexer(map_file(path))
+            lexer.scan_tokens()
+            return lexer
+
+        for name, func in (("str", read_text), ("mmap", mapped)):
+            seconds = best_time(func, args.repeat)
+            peak = peak_memory(func)
+            print(f"{name:<6} {seconds:8.3f} s  {megabytes / seconds:8.2f} MB/s  "
+                  f"peak {peak / (1024 * 1024):8.2f} MB")
+
+#peak memory of a list-backed parse against a streamed one
+def bench_stream(args):
+    source = make_source(args.size)
+    megabytes = len(source) / (1024 * 1024)
+    print(f"source: {megabytes:.2f} MB")
+    runs = (
+        ("token list", lambda: Parser(source).parse()),
+        ("streamed", lambda: Parser(io.StringIO(source), stream=True).parse()),
+    )
+    for name, func in runs:
+        peak = peak_memory(func)
+        print(f"{name:<12} peak {peak / (1024 * 1024):8.2f} MB")
+
+#bytes per token held by a Token list against a TokenArray
+def bench_tokens(args):
+    source = make_source(args.size)
+    print(f"source: {len(source) / (1024 * 1024):.2f} MB")
+    for name, cls in (("Token list", TableLexer), ("TokenArray", ArrayLexer)):
+        gc.collect()
+        tracemalloc.start()
+        lexer = scan(cls, source)
+        held = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        count = len(lexer.get_tokens())
+        print(f"{name:<12} {count} tokens  {held / count:8.1f} bytes/token")
+        del lexer
+
+#seeded corpus of programs made of random arithmetic statements
+def make_corpus(programs, seed=0):
+    rng = random.Random(seed)
+    names = ["a", "b", "c", "d"]
+    symbols = ["+", "-", "*", "/", "<", ">="]
+
+    def expression(depth):
+        if depth == 0 or rng.random() < 0.3:
+            return rng.choice(names + ["0", "1", "2", "7"])
+        return f"({expression(depth - 1)} {rng.choice(symbols)} {expression(depth - 1)})"
+
+    corpus = [SAMPLE]
+    for _ in range(programs - 1):
+        body = " ".join(f"{rng.choice(names)} = {expression(3)};" for _ in range(rng.randint(2, 12)))
+        corpus.append(f"int f(int a, int b) {{ int c; int d; c = 1; d = 2; {body} }}")
+    return corpus
+
+#assembly size with and without the peephole pass over a corpus
+def bench_peephole(args):
+    if args.files:
+        corpus = []
+        for path in args.files:
+            with open(path) as file:
+                corpus.append(file.read())
+    else:
+        corpus = make_corpus(args.programs)
+    print(f"corpus: {len(corpus)} programs")
+    for level in args.levels:
+        before = after = 0
+        hits: dict[str, int] = {}
+        for source in corpus:
+            parser = Parser(source)
+            parser.parse()
+            parser.generate()
+            if level > 0:
+                parser.optimize(level)
+            stats = parser.to_assembly(io.StringIO(), header=False, peephole=True)[-1]
+            before += stats.before
+            after += stats.after
+            for name, count in stats.hits.items():
+                hits[name] = hits.get(name, 0) + count
+        saved = before - after
+        print(f"-O{level}  {before:>8} -> {after:>8} instructions  "
+              f"({saved} removed, {100 * saved / max(before, 1):5.1f}%)")
+        for name, count in hits.items():
+            print(f"       {name:<20} {count:>8}")
+
+#TAC of source after the -O level passes
+def compile_tac(source, level):
+    parser = Parser(source)
+    parser.parse()
+    parser.generate()
+    if level > 0:
+        parser.optimize(level)
+    return parser.tac
+
+#executed instructions and VM time of LOOP_SAMPLE at each -O level
+def bench_vm(args):
+    expected = None
+    for level in args.levels:
+        machine = VM(compile_tac(LOOP_SAMPLE, level))
+        values, stats = machine.call("sum", args.n, 3)
+        if expected is None:
+            expected = values
+        elif values != expected:
+            raise SystemExit(f"-O{level} computes {values}, -O{args.levels[0]} computed {expected}")
+        seconds = best_time(lambda: machine.call("sum", args.n, 3), args.repeat)
+        print(f"-O{level}  {stats.instructions:>10} instructions  {seconds:8.3f} s  "
+              f"{stats.instructions / seconds / 1e6:6.2f} M instructions/s")
+
+#LOOP_SAMPLE run by the VM and as compiled Python at each -O level
+def bench_pyexec(args):
+    print(f"{'':4} {'vm':>10} {'python':>10} {'speedup':>8} {'compile':>10}")
+    for level in args.levels:
+        tac = compile_tac(LOOP_SAMPLE, level)
+        machine = VM(tac)
+        CODE_CACHE.clear()
+        start = time.perf_counter()
+        program = PythonProgram(tac)
+        compile_seconds = time.perf_counter() - start
+        expected, _ = machine.call("sum", args.n, 3)
+        values = program.call("sum", args.n, 3)
+        if values != expected:
+            raise SystemExit(f"-O{level}: python computes {values}, the VM computed {expected}")
+        vm_seconds = best_time(lambda: machine.call("sum", args.n, 3), args.repeat)
+        python_seconds = best_time(lambda: program.call("sum", args.n, 3), args.repeat)
+        print(f"-O{level} {vm_seconds:9.3f}s {python_seconds:9.3f}s {vm_seconds / python_seconds:7.1f}x "
+              f"{compile_seconds * 1000:8.2f}ms")
+
+#wall time of running an executable, best of repeat
+def time_binary(command, repeat):
+    return best_time(lambda: subprocess.run(command, capture_output=True, check=True), repeat)
+
+#LOOP_SAMPLE linked natively by the x86 backend against the VM and Python
+#backends; the binary calls sum --calls times, and a run with no calls is
+#subtracted as process startup
+def bench_native(args):
+    print(f"{'':4} {'vm/call':>10} {'python/call':>12} {'native/call':>12} {'vs vm':>8}")
+    with tempfile.TemporaryDirectory() as directory:
+        for level in args.levels:
+            tac = compile_tac(LOOP_SAMPLE, level)
+            source, _ = x86.program_source(tac, results={"sum": "s"}, entry="sum", args=(args.n, 3))
+            binary = os.path.join(directory, f"sum{level}")
+            x86.link(source, binary)
+            machine = VM(tac)
+            program = PythonProgram(tac)
+            expected = machine.call("sum", args.n, 3)[0]["s"]
+            output = subprocess.run([binary], capture_output=True, text=True, check=True).stdout
+            if int(output) != expected:
+                raise SystemExit(f"-O{level}: the binary prints {output.strip()}, the VM computed {expected}")
+            vm_seconds = best_time(lambda: machine.call("sum", args.n, 3), args.repeat)
+            python_seconds = best_time(lambda: program.call("sum", args.n, 3), args.repeat)
+            startup = time_binary([binary, "0"], args.repeat)
+            native_seconds = max(time_binary([binary, str(args.calls)], args.repeat) - startup, 0) / args.calls
+            print(f"-O{level} {vm_seconds * 1000:8.3f}ms {python_seconds * 1000:10.3f}ms "
+                  f"{native_seconds * 1000:10.4f}ms {vm_seconds / max(native_seconds, 1e-9):7.0f}x")
+
+#run every function of generated programs in the VM and as a native
+#executable from the x86 backend, at each -O level and register count,
+#and report the results that disagree
+def bench_differential(args):
+    checks = mismatches = 0
+    with tempfile.TemporaryDirectory() as directory:
+        binary = os.path.join(directory, "check")
+        for seed in range(args.seeds):
+            source = generate_program(ProgramShape(functions=args.functions, seed=seed))
+            for level in args.levels:
+                tac = compile_tac(source, level)
+                machine = VM(tac)
+                for start, end in split_regions(tac):
+                    if tac[start].op != Op.LABEL:
+                        continue
+                    name = tac[start].a.name
+                    result = x86.default_result(tac[start:end])
+                    if result is None:
+                        continue
+                    call_args = tuple(range(3, 3 + sum(1 for instr in tac[start:end] if instr.op == Op.PARAMETER)))
+                    expected = machine.call(name, *call_args)[0][result]
+                    for count in args.registers:
+                        native, _ = x86.program_source(tac, REGISTERS[:count], {name: result}, name, call_args)
+                        x86.link(native, binary)
+                        output = subprocess.run([binary], capture_output=True, text=True, check=True).stdout
+                        checks += 1
+                        if int(output) != expected:
+                            mismatches += 1
+                            print(f"seed {seed} -O{level} {count} registers {name}: {result} is "
+                                  f"{output.strip()} native, {expected} in the VM")
+    print(f"{checks} checks, {mismatches} mismatches")
+    if mismatches:
+        raise SystemExit(1)
+
+# compile stages timed by bench_stages, in pipeline order
+STAGE_NAMES = ("scan_tokens", "parse", "generate", "to_assembly")
+
+#run the compile stages over source, calling observe(stage, func) for each
+def run_stages(source, observe):
+    parser = Parser(source)
+    with open(os.devnull, "w") as devnull:
+        observe("scan_tokens", parser.lex.scan_tokens)
+        observe("parse", parser.parse)
+        observe("generate", parser.generate)
+        observe("to_assembly", lambda: parser.to_assembly(devnull, header=False))
+
+#seconds of each stage, best of repeat full runs
+def stage_times(source, repeat) -> dict[str, float]:
+    best: dict[str, float] = {}
+
+    def observe(stage, func):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best[stage] = min(best.get(stage, elapsed), elapsed)
+
+    for _ in range(repeat):
+        gc.collect()
+        run_stages(source, observe)
+    return best
+
+#bytes each stage allocates on top of what the earlier stages left live
+def stage_peaks(source) -> dict[str, int]:
+    peaks: dict[str, int] = {}
+
+    def observe(stage, func):
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        func()
+        peaks[stage] = tracemalloc.get_traced_memory()[1] - before
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        run_stages(source, observe)
+    finally:
+        tracemalloc.stop()
+    return peaks
+
+#regressions of results against baseline: throughput down or peak memory up
+#by more than threshold, as messages
+def regressions(results, baseline, threshold) -> list[str]:
+    found = []
+    for size, stages in results.items():
+        for stage, now in stages.items():
+            before = baseline.get(size, {}).get(stage)
+            if before is None:
+                continue
+            if now["mb_per_s"] < before["mb_per_s"] * (1 - threshold):
+                found.append(f"{size} {stage}: {now['mb_per_s']:.2f} MB/s, baseline {before['mb_per_s']:.2f}")
+            if "peak_bytes" in now and "peak_bytes" in before and \
+                    now["peak_bytes"] > before["peak_bytes"] * (1 + threshold):
+                found.append(f"{size} {stage}: peak {now['peak_bytes']} bytes, baseline {before['peak_bytes']}")
+    return found
+
+#per-stage throughput and peak memory over generated programs of each size,
+#saved to and checked against a JSON baseline
+def bench_stages(args):
+    shape = ProgramShape(args.functions, args.params, args.locals, args.statements, args.nesting,
+                         args.depth, args.width, args.globals, args.seed)
+    results = {}
+    for size in args.sizes:
+        source = generate_sized(parse_size(size), shape)
+        megabytes = len(source) / (1024 * 1024)
+        times = stage_times(source, args.repeat)
+        peaks = stage_peaks(source) if args.memory else {}
+        results[size] = {}
+        for stage in STAGE_NAMES:
+            entry = {"seconds": times[stage], "mb_per_s": megabytes / max(times[stage], 1e-9)}
+            if stage in peaks:
+                entry["peak_bytes"] = peaks[stage]
+            results[size][stage] = entry
+            peak = f"  peak {peaks[stage] / (1024 * 1024):9.2f} MB" if stage in peaks else ""
+            print(f"{size:>7} {stage:<12} {times[stage]:9.4f} s  {entry['mb_per_s']:9.2f} MB/s{peak}")
+        del source
+
+    failed = []
+    if args.baseline is not None and os.path.exists(args.baseline):
+        with open(args.baseline) as file:
+            failed = regressions(results, json.load(file)["results"], args.threshold)
+    if args.save is not None:
+        with open(args.save, "w") as file:
+            json.dump({"shape": vars(shape), "results": results}, file, indent=2)
+    if failed:
+        raise SystemExit("regressions over {:.0%}:\n  {}".format(args.threshold, "\n  ".join(failed)))
+
+#wall time of a parallel compile of a generated source for each worker count
+def bench_parallel(args):
+    source = generate_sized(parse_size(args.size), ProgramShape(seed=args.seed))
+    print(f"source: {len(source) / (1024 * 1024):.2f} MB, {os.cpu_count()} CPUs")
+    expected = None
+    base = None
+    for workers in args.workers:
+        units = parallel.compile_parallel(source, workers, args.level, keep_tac=False)
+        assembly = merged_assembly(units)
+        if expected is None:
+            expected = assembly
+        elif assembly != expected:
+            raise SystemExit(f"{workers} workers produce different assembly")
+        del units, assembly
+        seconds = best_time(lambda: parallel.compile_parallel(source, workers, args.level, keep_tac=False),
+                            args.repeat)
+        base = base or seconds
+        print(f"{workers:>3} workers {seconds:8.3f} s  speedup {base / seconds:5.2f}x")
+
+#compile --files small generated programs one process per file, with
+#main.py and with client.py against a running daemon, then all of them on
+#one client connection with the daemon's response cache disabled
+def bench_daemon(args):
+    here = os.path.dirname(os.path.abspath(__file__))
+    with tempfile.TemporaryDirectory() as directory:
+        paths = []
+        for number in range(args.files):
+            path = os.path.join(directory, f"p{number}.c")
+            with open(path, "w") as file:
+                file.write(generate_sized(parse_size(args.size), ProgramShape(seed=args.seed + number)))
+            paths.append(path)
+        socket_path = os.path.join(directory, "daemon.sock")
+        server = subprocess.Popen([sys.executable, os.path.join(here, "daemon.py"), "--socket", socket_path,
+                                   "--workers", str(args.workers), "--cache-entries", "0"])
+        try:
+            while not os.path.exists(socket_path):
+                time.sleep(0.01)
+            commands = {"main.py": [sys.executable, os.path.join(here, "main.py")],
+                        "client.py": [sys.executable, os.path.join(here, "client.py"), "--socket", socket_path]}
+            for name, command in commands.items():
+                start = time.perf_counter()
+                for path in paths:
+                    subprocess.run(command + [path, "--emit", "asm", "-O", str(args.level)], check=True)
+                seconds = time.perf_counter() - start
+                print(f"{name:<10} {seconds:8.3f} s  {seconds / args.files * 1000:8.2f} ms/file")
+            start = time.perf_counter()
+            with client.connect(socket_path) as sock:
+                for path in paths:
+                    with open(path) as file:
+                        response = client.request(sock, {"source": file.read(), "emit": ["asm"], "level": args.level})
+                    if not response["ok"]:
+                        raise SystemExit(f"{path}: {response['error']}")
+            seconds = time.perf_counter() - start
+            print(f"{'connection':<10} {seconds:8.3f} s  {seconds / args.files * 1000:8.2f} ms/file")
+        finally:
+            server.terminate()
+            server.wait()
+
+class RecursiveParser(Parser):
+    # the recursive parse_exp and expression lowering the explicit-stack
+    # versions replaced, kept here as the baseline for bench_deep
+
+    def parse_exp(self, min_bp):
+        lhs = self.next()
+        if lhs.token_type.name == "LEFTPARAM":
+            lhs = self.parse_exp(0.0)
+            self.next()
+        else:
+            lhs = Literal(lhs)
+        while True:
+            op = self.peek()
+            if op.token_type.name in ("EOF", "SEMICOLON", "RIGHTPARAM"):
+                break
+            left_bp, right_bp = self.binding_power(op)
+            if left_bp < min_bp:
+                break
+            op = Operator(self.next())
+            lhs = Expression(lhs, op, self.parse_exp(right_bp))
+        return lhs
+
+    def eval_expression(self, node):
+        left_place = self.eval_ir(node.left_exp)
+        right_place = self.eval_ir(node.right_exp)
+        tmp = self.new_temp()
+        self.gen_tac(BINARY_OPS[node.op.operator.lexeme], tmp, left_place, right_place)
+        return tmp
+
+#x = a + a + ... (left-leaning) or x = a + (a + (...)) (right-leaning)
+def chain_source(terms, leaning):
+    if leaning == "left":
+        body = " + ".join(["a"] * terms)
+    else:
+        body = " + (".join(["a"] * terms) + ")" * (terms - 1)
+    return f"int f(int a) {{ a = {body}; }}"
+
+#parse and lower, seconds or None on RecursionError
+def time_chain(cls, source):
+    parser = cls(source)
+    parser.lex.scan_tokens()
+    start = time.perf_counter()
+    try:
+        parser.root = parser.parse_program()
+        parser.generate()
+    except RecursionError:
+        return None
+    return time.perf_counter() - start
+
+#explicit-stack parse_exp/eval_ir against the recursive baseline on long chains
+def bench_deep(args):
+    for leaning in ("left", "right"):
+        for terms in args.terms:
+            source = chain_source(terms, leaning)
+            times = {name: time_chain(cls, source)
+                     for name, cls in (("recursive", RecursiveParser), ("iterative", Parser))}
+            row = "  ".join(f"{name} " + ("RecursionError" if seconds is None else f"{seconds:8.4f} s")
+                            for name, seconds in times.items())
+            print(f"{leaning:<5} {terms:>7} terms  {row}")
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Compiler benchmarks")
+    sub = arg_parser.add_subparsers(dest="bench", required=True)
+
+    lexer_cmd = sub.add_parser("lexer", help="lexer throughput in MB/s")
+    lexer_cmd.add_argument("--size", type=float, default=2.0, help="source size in MB")
+    lexer_cmd.add_argument("--repeat", type=int, default=3)
+    lexer_cmd.set_defaults(func=bench_lexer)
+
+    stream_cmd = sub.add_parser("stream", help="parser peak memory, token list vs streamed")
+    stream_cmd.add_argument("--size", type=float, default=1.0, help="source size in MB")
+    stream_cmd.set_defaults(func=bench_stream)
+
+    tokens_cmd = sub.add_parser("tokens", help="token storage bytes per token")
+    tokens_cmd.add_argument("--size", type=float, default=1.0, help="source size in MB")
+    tokens_cmd.set_defaults(func=bench_tokens)
+
+    mapped_cmd = sub.add_parser("mapped", help="lexing a file as text against a memory map of it")
+    mapped_cmd.add_argument("--size", default="10MB", help="generated source size")
+    mapped_cmd.add_argument("--seed", type=int, default=0)
+    mapped_cmd.add_argument("--repeat", type=int, default=3)
+    mapped_cmd.set_defaults(func=bench_mapped)
+
+    deep_cmd = sub.add_parser("deep", help="parse and lower long operator chains")
+    deep_cmd.add_argument("--terms", type=int, nargs="+", default=[100, 900, 10000, 100000])
+    deep_cmd.set_defaults(func=bench_deep)
+
+    peephole_cmd = sub.add_parser("peephole", help="assembly size reduction of the peephole pass")
+    peephole_cmd.add_argument("files", nargs="*", help="corpus sources (default: generated)")
+    peephole_cmd.add_argument("--programs", type=int, default=500, help="generated corpus size")
+    peephole_cmd.add_argument("--levels", type=int, nargs="+", default=[0, 2], help="TAC -O levels")
+    peephole_cmd.set_defaults(func=bench_peephole)
+
+    vm_cmd = sub.add_parser("vm", help="executed instructions and time in the bytecode VM")
+    vm_cmd.add_argument("--n", type=int, default=20000, help="outer loop trip count")
+    vm_cmd.add_argument("--levels", type=int, nargs="+", default=[0, 1, 2], help="TAC -O levels")
+    vm_cmd.add_argument("--repeat", type=int, default=3)
+    vm_cmd.set_defaults(func=bench_vm)
+
+    pyexec_cmd = sub.add_parser("pyexec", help="bytecode VM against TAC compiled to Python")
+    pyexec_cmd.add_argument("--n", type=int, default=20000, help="outer loop trip count")
+    pyexec_cmd.add_argument("--levels", type=int, nargs="+", default=[0, 2], help="TAC -O levels")
+    pyexec_cmd.add_argument("--repeat", type=int, default=3)
+    pyexec_cmd.set_defaults(func=bench_pyexec)
+
+    native_cmd = sub.add_parser("native", help="x86-64 executables against the VM and Python backends")
+    native_cmd.add_argument("--n", type=int, default=20000, help="outer loop trip count")
+    native_cmd.add_argument("--calls", type=int, default=200, help="calls of sum per binary run")
+    native_cmd.add_argument("--levels", type=int, nargs="+", default=[0, 2], help="TAC -O levels")
+    native_cmd.add_argument("--repeat", type=int, default=3)
+    native_cmd.set_defaults(func=bench_native)
+
+    differential_cmd = sub.add_parser("differential", help="VM against native results on generated programs")
+    differential_cmd.add_argument("--seeds", type=int, default=40)
+    differential_cmd.add_argument("--functions", type=int, default=4)
+    differential_cmd.add_argument("--levels", type=int, nargs="+", default=[0, 1, 2])
+    differential_cmd.add_argument("--registers", type=int, nargs="+", default=[len(REGISTERS), 3])
+    differential_cmd.set_defaults(func=bench_differential)
+
+    stages_cmd = sub.add_parser("stages", help="per-stage throughput and memory against a JSON baseline")
+    stages_cmd.add_argument("--sizes", nargs="+", default=["1KB", "100KB", "1MB"],
+                            help="generated source sizes, 1KB up to 100MB")
+    stages_cmd.add_argument("--repeat", type=int, default=3)
+    stages_cmd.add_argument("--baseline", help="JSON results to compare against")
+    stages_cmd.add_argument("--save", help="write the results as JSON (may be the baseline path)")
+    stages_cmd.add_argument("--threshold", type=float, default=0.2,
+                            help="allowed fractional throughput drop or memory growth (default 0.2)")
+    stages_cmd.add_argument("--no-memory", dest="memory", action="store_false",
+                            help="skip the tracemalloc run")
+    defaults = ProgramShape()
+    for field_name in ("functions", "params", "locals", "statements", "nesting", "depth", "width", "globals", "seed"):
+        stages_cmd.add_argument(f"--{field_name}", type=int, default=getattr(defaults, field_name),
+                                help="generated program shape, see progen.py")
+    stages_cmd.set_defaults(func=bench_stages)
+
+    parallel_cmd = sub.add_parser("parallel", help="parallel compile time against the number of workers")
+    parallel_cmd.add_argument("--size", default="1MB", help="generated source size")
+    parallel_cmd.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parallel_cmd.add_argument("--level", type=int, default=2, help="TAC -O level")
+    parallel_cmd.add_argument("--seed", type=int, default=0)
+    parallel_cmd.add_argument("--repeat", type=int, default=1)
+    parallel_cmd.set_defaults(func=bench_parallel)
+
+    daemon_cmd = sub.add_parser("daemon", help="per-file latency of main.py against the compile daemon")
+    daemon_cmd.add_argument("--files", type=int, default=50)
+    daemon_cmd.add_argument("--size", default="2KB", help="generated source size per file")
+    daemon_cmd.add_argument("--workers", type=int, default=2, help="daemon worker processes")
+    daemon_cmd.add_argument("--level", type=int, default=1, help="-O level")
+    daemon_cmd.add_argument("--seed", type=int, default=0)
+    daemon_cmd.set_defaults(func=bench_daemon)
+
+    args = arg_parser.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+import dataclasses
+import hashlib
+import io
+import os
+import pickle
+import zlib
+from lexer import TokenType, ArrayLexer, TYPE_CODE
+from parser import Parser, Program
+from incremental import compile_region
+
+# Content-addressed on-disk cache for the compile stages. Entries are keyed
+# by a hash of the compiler version and the source text, stored as
+# zlib-compressed pickles, and evicted least recently used first once the
+# directory grows past max_bytes. Whole files cache tokens, AST, TAC and
+# assembly. compile_items caches the AST and TAC of each top-level item on
+# its own, keyed by its text and start line, so editing one function reuses
+# every other cached item that did not move.
+
+STAGES = ("tokens", "ast", "tac", "asm")
+
+#hash of the compiler sources, so a changed compiler never reads stale entries
+def compiler_version():
+    digest = hashlib.sha256()
+    here = os.path.dirname(os.path.abspath(__file__))
+    for name in ("lexer.py", "parser.py", "ir.py", "cfg.py", "optimizer.py", "regalloc.py", "peephole.py", "incremental.py", "cache.py", "symbols.py"):
+        with open(os.path.join(here, name), "rb") as file:
+            digest.update(file.read())
+    return digest.hexdigest()[:16]
+
+COMPILER_VERSION = compiler_version()
+
+def source_key(text):
+    return hashlib.sha256(f"{COMPILER_VERSION}\0{text}".encode()).hexdigest()
+
+#(start, end, line) of each top-level item: a ; or a closing } at brace depth 0
+def split_items(source):
+    lexer = ArrayLexer(source)
+    lexer.scan_tokens()
+    tokens = lexer.get_tokens()
+    types = tokens.types
+    left = TYPE_CODE[TokenType.LEFTBRACE]
+    right = TYPE_CODE[TokenType.RIGHTBRACE]
+    semicolon = TYPE_CODE[TokenType.SEMICOLON]
+
+    items = []
+    depth = 0
+    first = 0
+    for index in range(len(tokens) - 1):
+        code = types[index]
+        if code == left:
+            depth += 1
+        elif code == right:
+            depth -= 1
+        if depth == 0 and (code == semicolon or code == right):
+            end = tokens.starts[index] + tokens.lengths[index]
+            items.append((tokens.starts[first], end, tokens.lines[first]))
+            first = index + 1
+    if first < len(tokens) - 1:
+        items.append((tokens.starts[first], len(source), tokens.lines[first]))
+    return items
+
+# Trees are stored flat: pickle recurses once per nesting level, and the
+# parser builds expression chains far deeper than the recursion limit.
+# flatten_ast lists the nodes in pre-order as (type, fields) records, each
+# child node replaced by a NodeRef to its record.
+
+@dataclasses.dataclass(frozen=True)
+class NodeRef:
+    index: int
+
+def flatten_ast(root) -> list:
+    nodes = [root]
+    records = []
+
+    def ref(value):
+        if isinstance(value, list):
+            return [ref(item) for item in value]
+        if dataclasses.is_dataclass(value):
+            nodes.append(value)
+            return NodeRef(len(nodes) - 1)
+        return value
+
+    # nodes grows while it is walked, so every node is visited once
+    for node in nodes:
+        fields = {field.name: ref(getattr(node, field.name)) for field in dataclasses.fields(node)}
+        records.append((type(node), fields))
+    return records
+
+#the tree flatten_ast stored; children come after their parent, so
+#building from the end always finds them built
+def unflatten_ast(records):
+    built = [None] * len(records)
+
+    def deref(value):
+        if isinstance(value, list):
+            return [deref(item) for item in value]
+        if isinstance(value, NodeRef):
+            return built[value.index]
+        return value
+
+    for index in range(len(records) - 1, -1, -1):
+        node_type, fields = records[index]
+        built[index] = node_type(**{name: deref(value) for name, value in fields.items()})
+    return built[0]
+
+class CompileCache:
+    def __init__(self, directory=".compile_cache", max_bytes=256 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(directory, exist_ok=True)
+        self.size = sum(entry.stat().st_size for entry in os.scandir(directory) if entry.is_file())
+
+    def path(self, key, stage):
+        return os.path.join(self.directory, f"{key}.{stage}")
+
+    #cached value or None, a hit refreshes the entry's LRU position
+    def get(self, key, stage):
+        path = self.path(key, stage)
+        try:
+            with open(path, "rb") as file:
+                data = file.read()
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        os.utime(path)
+        self.hits += 1
+        return pickle.loads(zlib.decompress(data))
+
+    def put(self, key, stage, value):
+        data = zlib.compress(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+        path = self.path(key, stage)
+        try:
+            self.size -= os.path.getsize(path)
+        except FileNotFoundError:
+            pass
+        temp = f"{path}.{os.getpid()}.tmp"
+        with open(temp, "wb") as file:
+            file.write(data)
+        os.replace(temp, path)
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            self.evict()
+
+    #drop least recently used entries until the cache fits in max_bytes
+    def evict(self):
+        entries = [entry for entry in os.scandir(self.directory)
+                   if entry.is_file() and not entry.name.endswith(".tmp")]
+        entries.sort(key=lambda entry: entry.stat().st_mtime)
+        for entry in entries:
+            if self.size <= self.max_bytes:
+                break
+            self.size -= entry.stat().st_size
+            os.remove(entry.path)
+            self.evictions += 1
+
+    #artifact of one stage for the whole source, computing and storing every
+    #stage up to it that is not cached yet
+    def compile(self, source, stage="asm"):
+        if stage not in STAGES:
+            raise ValueError(f"Unknown stage {stage}, expected one of {', '.join(STAGES)}")
+        key = source_key(source)
+        cached = self.get(key, stage)
+        if cached is not None:
+            return unflatten_ast(cached) if stage == "ast" else cached
+
+        parser = Parser(source, compact=True)
+        tokens = self.get(key, "tokens")
+        if tokens is None:
+            parser.lex.scan_tokens()
+            tokens = parser.tokens
+            self.put(key, "tokens", tokens)
+        if stage == "tokens":
+            return tokens
+        parser.lex.tokens = parser.tokens = tokens
+
+        records = self.get(key, "ast")
+        if records is None:
+            root = parser.parse_program()
+            parser.resolve(root)
+            self.put(key, "ast", flatten_ast(root))
+        else:
+            root = unflatten_ast(records)
+        if stage == "ast":
+            return root
+        parser.root = root
+
+        tac = self.get(key, "tac")
+        if tac is None:
+            tac = parser.generate()
+            self.put(key, "tac", tac)
+        if stage == "tac":
+            return tac
+        parser.tac = tac
+
+        asm = assembly_text(parser)
+        self.put(key, "asm", asm)
+        return asm
+
+    #(Program, tac) built item by item, reusing the cached AST and TAC of
+    #every top-level item whose text is unchanged
+    def compile_items(self, source):
+        nodes = []
+        tac = []
+        # every item, cached or not, is resolved against the globals and
+        # functions of the items before it, which may have changed
+        checker = Parser("", compact=True)
+        for start, end, line in split_items(source):
+            # the item's nodes carry line numbers, so an item that moved is
+            # compiled again
+            key = source_key(f"{line}\0{source[start:end]}")
+            cached = self.get(key, "item")
+            if cached is None:
+                compiled = [(item.node, item.tac)
+                            for item in compile_region(source, start, end, line, checker.symbols)]
+            else:
+                compiled = [(unflatten_ast(records), item_tac) for records, item_tac in cached]
+                for node, _ in compiled:
+                    checker.resolve(node)
+            for node, item_tac in compiled:
+                nodes.append(node)
+                tac.extend(item_tac)
+            if cached is None:
+                self.put(key, "item", [(flatten_ast(node), item_tac) for node, item_tac in compiled])
+        return Program(nodes), tac
+
+#pseudo-assembly of parser.tac as text
+def assembly_text(parser):
+    out = io.StringIO()
+    parser.to_assembly(out, header=False)
+    return out.getvalue()
@@ -0,0 +1,141 @@
+from dataclasses import dataclass, field
+from ir import Op, Kind, Operand, uses_of, defined_by
+
+# Basic blocks and the control flow graph of one region of TAC. A region is
+# a function from LABEL to END, or a stretch of top-level code. A block
+# starts at the region start, at a BLOCK label or after a jump, and ends
+# before the next one. Blocks index into the shared TAC list, so a pass that
+# edits the list builds the graph again.
+
+@dataclass
+class Block:
+    start: int
+    end: int
+    successors: list[int] = field(default_factory=list)
+    predecessors: list[int] = field(default_factory=list)
+
+@dataclass
+class Loop:
+    header: int
+    body: set[int]
+
+#(start, end) index ranges of the regions of tac: each LABEL..END function
+#and each stretch of top-level code
+def split_regions(tac: list) -> list[tuple[int, int]]:
+    regions = []
+    start = 0
+    for index, instr in enumerate(tac):
+        if instr.op == Op.LABEL and index > start:
+            regions.append((start, index))
+            start = index
+        elif instr.op == Op.END:
+            regions.append((start, index + 1))
+            start = index + 1
+    if start < len(tac):
+        regions.append((start, len(tac)))
+    return regions
+
+#blocks of tac[start:end] with their edges
+def build_blocks(tac: list, start: int, end: int) -> list[Block]:
+    leaders = [start]
+    for index in range(start, end):
+        instr = tac[index]
+        if instr.op == Op.BLOCK and index != leaders[-1]:
+            leaders.append(index)
+        elif instr.is_jump and index + 1 < end:
+            leaders.append(index + 1)
+    leaders = sorted(set(leaders))
+
+    blocks = [Block(first, last) for first, last in zip(leaders, leaders[1:] + [end])]
+    block_of = {tac[block.start].a: number for number, block in enumerate(blocks)
+                if tac[block.start].op == Op.BLOCK}
+    for number, block in enumerate(blocks):
+        last = tac[block.end - 1]
+        if last.is_jump:
+            block.successors.append(block_of[last.dst])
+        if last.op != Op.JUMP and last.op != Op.END and number + 1 < len(blocks):
+            block.successors.append(number + 1)
+        for successor in block.successors:
+            blocks[successor].predecessors.append(number)
+    return blocks
+
+#blocks reachable from the entry block
+def reachable(blocks: list[Block]) -> set[int]:
+    seen = {0}
+    work = [0]
+    while work:
+        for successor in blocks[work.pop()].successors:
+            if successor not in seen:
+                seen.add(successor)
+                work.append(successor)
+    return seen
+
+#dominator set of each block: every block on all paths from the entry to it.
+#Unreachable blocks are left out of every path and dominate nothing.
+def dominators(blocks: list[Block]) -> list[set[int]]:
+    live = reachable(blocks)
+    dominated = [{0}] + [set(live) for _ in blocks[1:]]
+    changed = True
+    while changed:
+        changed = False
+        for number in range(1, len(blocks)):
+            incoming = [dominated[pred] for pred in blocks[number].predecessors if pred in live]
+            new = set.intersection(*incoming) if incoming else set()
+            new.add(number)
+            if new != dominated[number]:
+                dominated[number] = new
+                changed = True
+    return dominated
+
+#natural loops: for each back edge tail -> header (header dominates tail),
+#the blocks that reach tail without passing through header. Loops sharing a
+#header are merged. Innermost (smallest) loops come first.
+def natural_loops(blocks: list[Block], dominated: list[set[int]]) -> list[Loop]:
+    loops: dict[int, set[int]] = {}
+    for tail, block in enumerate(blocks):
+        for header in block.successors:
+            if header not in dominated[tail]:
+                continue
+            body = loops.setdefault(header, {header})
+            work = [tail]
+            while work:
+                number = work.pop()
+                if number not in body:
+                    body.add(number)
+                    work.extend(blocks[number].predecessors)
+    return sorted((Loop(header, body) for header, body in loops.items()), key=lambda loop: len(loop.body))
+
+#(live_in, live_out) operand sets of each block. exit_live is live after
+#every block that leaves the region. Immediates and labels are never live.
+def liveness(tac: list, blocks: list[Block], exit_live=frozenset()) -> tuple[list[set], list[set]]:
+    gen: list[set] = []
+    kill: list[set] = []
+    for block in blocks:
+        used: set[Operand] = set()
+        defined: set[Operand] = set()
+        for index in range(block.start, block.end):
+            instr = tac[index]
+            for place in uses_of(instr):
+                if place.kind != Kind.IMM and place not in defined:
+                    used.add(place)
+            target = defined_by(instr)
+            if target is not None:
+                defined.add(target)
+        gen.append(used)
+        kill.append(defined)
+
+    live_in = [set(used) for used in gen]
+    live_out = [set() for _ in blocks]
+    changed = True
+    while changed:
+        changed = False
+        for number in reversed(range(len(blocks))):
+            block = blocks[number]
+            out = set(exit_live) if not block.successors else set()
+            for successor in block.successors:
+                out |= live_in[successor]
+            if out != live_out[number]:
+                live_out[number] = out
+                live_in[number] = gen[number] | (out - kill[number])
+                changed = True
+    return live_in, live_out
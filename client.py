@@ -0,0 +1,108 @@
+import argparse
+import json
+import os
+import socket
+import struct
+import sys
+
+# Thin client for the compile daemon (daemon.py). It imports nothing from
+# the compiler, so a call costs interpreter startup plus one round trip:
+# each input's source and options go to the daemon over a Unix domain
+# socket and the artifacts come back as text. Messages are JSON, each
+# preceded by its length as a 4-byte big-endian integer.
+
+DEFAULT_SOCKET = os.environ.get("CC_DAEMON_SOCKET", f"/tmp/cc-daemon-{os.getuid()}.sock")
+STAGES = ("tokens", "ast", "tac", "py", "x86", "asm")
+# same suffixes as main.SUFFIX
+SUFFIX = {"tokens": ".tokens", "ast": ".ast", "tac": ".tac", "py": ".py", "x86": ".x86.s", "asm": ".s"}
+HEADER = struct.Struct(">I")
+
+def send_message(sock: socket.socket, message: dict):
+    data = json.dumps(message).encode()
+    sock.sendall(HEADER.pack(len(data)) + data)
+
+def receive_exactly(sock: socket.socket, size: int):
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1 << 20))
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+#next message, or None when the other side closed the connection
+def receive_message(sock: socket.socket):
+    header = receive_exactly(sock, HEADER.size)
+    if header is None:
+        return None
+    data = receive_exactly(sock, HEADER.unpack(header)[0])
+    if data is None:
+        return None
+    return json.loads(data)
+
+def connect(path: str = DEFAULT_SOCKET) -> socket.socket:
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except OSError as error:
+        sock.close()
+        raise ConnectionError(f"No compile daemon at {path} ({error.strerror}); start it with python daemon.py")
+    return sock
+
+def request(sock: socket.socket, message: dict) -> dict:
+    send_message(sock, message)
+    response = receive_message(sock)
+    if response is None:
+        raise ConnectionError("The compile daemon closed the connection")
+    return response
+
+def main(argv=None) -> int:
+    arg_parser = argparse.ArgumentParser(prog="client.py", description="Compile through the compile daemon")
+    arg_parser.add_argument("inputs", nargs="*", help="source files, - reads stdin")
+    arg_parser.add_argument("--emit", action="append", choices=STAGES, default=[],
+                            help="artifact to write, may be repeated (default: none)")
+    arg_parser.add_argument("--out-dir", help="directory for artifacts (default: next to each input)")
+    arg_parser.add_argument("--ast-format", choices=("text", "jsonl"), default="text")
+    arg_parser.add_argument("-O", dest="level", type=int, nargs="?", const=1, default=0)
+    arg_parser.add_argument("--registers", type=int, help="number of allocatable registers")
+    arg_parser.add_argument("--socket", default=DEFAULT_SOCKET, help=f"daemon socket (default {DEFAULT_SOCKET})")
+    arg_parser.add_argument("--stats", action="store_true", help="print the daemon's counters")
+    arg_parser.add_argument("--shutdown", action="store_true", help="stop the daemon")
+    args = arg_parser.parse_args(argv)
+
+    try:
+        sock = connect(args.socket)
+    except ConnectionError as error:
+        print(error, file=sys.stderr)
+        return 1
+    status = 0
+    with sock:
+        for path in args.inputs:
+            if path == "-":
+                source, stem, directory = sys.stdin.read(), "stdin", args.out_dir or "."
+            else:
+                with open(path) as file:
+                    source = file.read()
+                stem = os.path.splitext(os.path.basename(path))[0]
+                directory = args.out_dir or os.path.dirname(path) or "."
+            message = {"command": "compile", "source": source, "emit": args.emit, "level": args.level,
+                       "ast_format": args.ast_format}
+            if args.registers is not None:
+                message["registers"] = args.registers
+            response = request(sock, message)
+            if not response["ok"]:
+                print(f"{path}: {response['error']}", file=sys.stderr)
+                status = 1
+                continue
+            for stage, text in response["artifacts"].items():
+                with open(os.path.join(directory, stem + SUFFIX[stage]), "w") as out:
+                    out.write(text)
+        if args.stats:
+            print(json.dumps(request(sock, {"command": "stats"})["stats"]))
+        if args.shutdown:
+            request(sock, {"command": "shutdown"})
+    return status
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,196 @@
+import argparse
+import hashlib
+import io
+import json
+import os
+import signal
+import socket
+import socketserver
+import sys
+import threading
+from collections import OrderedDict
+from contextlib import nullcontext
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Callable, Optional
+from parser import Parser
+from pipeline import run_stages
+from regalloc import REGISTERS
+from client import DEFAULT_SOCKET, STAGES, send_message, receive_message
+
+# Long-running compile daemon. It listens on a Unix domain socket and
+# answers client.py, so a build that compiles thousands of small files pays
+# for the compiler's imports once instead of once per file. Every
+# connection gets a thread; compiles run on a pool of worker processes
+# that stay up between requests with the compiler imported and its
+# patterns compiled, and the artifacts of recent requests are kept in an
+# LRU keyed by the source and options, so repeating a compile is a
+# dictionary lookup. The interned names and operands of ir and symbols
+# only ever grow, so a worker is replaced after tasks_per_worker compiles.
+#
+# A request is a JSON object with a command: "compile" (source, emit,
+# level, registers, ast_format), "stats" or "shutdown". A compile answers
+# {"ok": true, "artifacts": {stage: text}} or {"ok": false, "error": ...}.
+
+#artifacts of source for every stage in emit, with the same text
+#main.py writes for them
+def compile_artifacts(source: str, emit, level: int = 0, registers: int = len(REGISTERS),
+                      ast_format: str = "text") -> dict[str, str]:
+    unknown = set(emit) - set(STAGES)
+    if unknown:
+        raise ValueError(f"Unknown stage {', '.join(sorted(unknown))}, expected one of {', '.join(STAGES)}")
+    if not 1 <= registers <= len(REGISTERS):
+        raise ValueError(f"registers must be between 1 and {len(REGISTERS)}")
+    last = max((STAGES.index(stage) for stage in emit), default=len(STAGES) - 1)
+    buffers = {}
+
+    # the buffers outlive the with blocks run_stages writes them in
+    def sink(stage):
+        buffers[stage] = io.StringIO()
+        return nullcontext(buffers[stage])
+
+    run_stages(Parser(source), set(emit), STAGES[:last + 1], sink, level, REGISTERS[:registers], ast_format)
+    return {stage: buffer.getvalue() for stage, buffer in buffers.items()}
+
+#one compile request; runs in a worker process. The parser reports errors
+#with sys.exit, which must not take the worker down.
+def handle_compile(request: dict) -> dict:
+    try:
+        artifacts = compile_artifacts(request["source"], request.get("emit", []), request.get("level", 0),
+                                      request.get("registers", len(REGISTERS)),
+                                      request.get("ast_format", "text"))
+    except SystemExit as error:
+        return {"ok": False, "error": str(error.code)}
+    except Exception as error:
+        # a compiler bug is reported to the client, not raised in the
+        # request thread
+        return {"ok": False, "error": f"{type(error).__name__}: {error}"}
+    return {"ok": True, "artifacts": artifacts}
+
+#key of a compile request: its options and a hash of its source
+def request_key(request: dict) -> str:
+    options = {name: request.get(name) for name in ("emit", "level", "registers", "ast_format")}
+    # the request is untrusted: a malformed field is left for handle_compile
+    # to report, it only has to hash here
+    if isinstance(options["emit"], list):
+        options["emit"] = sorted(options["emit"], key=json.dumps)
+    digest = hashlib.sha256(json.dumps(request.get("source", "")).encode()).hexdigest()
+    return json.dumps(options, sort_keys=True) + digest
+
+#least recently used compile responses, shared by the request threads. An
+#entry is the Future of the compile, so a request that arrives while the
+#same compile is running waits for it instead of starting another one.
+class ResponseCache:
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.entries: OrderedDict[str, Future] = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    #the cached Future for key, or the one submit() starts
+    def lookup(self, key: str, submit: Callable[[], Future]) -> Future:
+        with self.lock:
+            future = self.entries.get(key)
+            if future is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return future
+            self.misses += 1
+            future = submit()
+            if self.max_entries > 0:
+                self.entries[key] = future
+                while len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+            return future
+
+class RequestHandler(socketserver.BaseRequestHandler):
+    # a client may send any number of requests on one connection
+    def handle(self):
+        while True:
+            try:
+                request = receive_message(self.request)
+            except ValueError as error:
+                send_message(self.request, {"ok": False, "error": f"Malformed request: {error}"})
+                return
+            if request is None:
+                return
+            if not isinstance(request, dict):
+                send_message(self.request, {"ok": False, "error": "Malformed request: expected a JSON object"})
+                continue
+            send_message(self.request, self.server.respond(request))
+
+class CompileDaemon(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path: str = DEFAULT_SOCKET, workers: Optional[int] = None, cache_entries: int = 1024,
+                 tasks_per_worker: int = 1000):
+        # a socket file left behind by a daemon that died is reused, a live
+        # daemon is not
+        if os.path.exists(path):
+            probe = socket.socket(socket.AF_UNIX)
+            try:
+                probe.connect(path)
+            except OSError:
+                os.unlink(path)
+            else:
+                raise OSError(f"A compile daemon is already listening on {path}")
+            finally:
+                probe.close()
+        super().__init__(path, RequestHandler)
+        self.path = path
+        self.workers = workers or os.cpu_count() or 1
+        self.executor = ProcessPoolExecutor(max_workers=self.workers, max_tasks_per_child=tasks_per_worker)
+        self.cache = ResponseCache(cache_entries)
+        self.requests = 0
+
+    def respond(self, request: dict) -> dict:
+        command = request.get("command", "compile")
+        if command == "stats":
+            return {"ok": True, "stats": self.stats()}
+        if command == "shutdown":
+            # shutdown waits for serve_forever, which runs on another thread
+            threading.Thread(target=self.shutdown).start()
+            return {"ok": True}
+        if command != "compile":
+            return {"ok": False, "error": f"Unknown command {command}"}
+        with self.cache.lock:
+            self.requests += 1
+        key = request_key(request)
+        # failures are cached too; they only depend on the key as well
+        future = self.cache.lookup(key, lambda: self.executor.submit(handle_compile, request))
+        return future.result()
+
+    def stats(self) -> dict:
+        return {"requests": self.requests, "workers": self.workers, "cached": len(self.cache.entries),
+                "hits": self.cache.hits, "misses": self.cache.misses}
+
+    def server_close(self):
+        super().server_close()
+        self.executor.shutdown()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+def main():
+    arg_parser = argparse.ArgumentParser(prog="daemon.py", description="Serve compiles on a Unix domain socket")
+    arg_parser.add_argument("--socket", default=DEFAULT_SOCKET, help=f"socket path (default {DEFAULT_SOCKET})")
+    arg_parser.add_argument("--workers", type=int, help="compile processes (default: one per CPU)")
+    arg_parser.add_argument("--cache-entries", type=int, default=1024,
+                            help="compile responses kept in memory, 0 to disable (default 1024)")
+    arg_parser.add_argument("--tasks-per-worker", type=int, default=1000,
+                            help="compiles before a worker process is replaced (default 1000)")
+    args = arg_parser.parse_args()
+
+    try:
+        server = CompileDaemon(args.socket, args.workers, args.cache_entries, args.tasks_per_worker)
+    except OSError as error:
+        sys.exit(str(error))
+    # SIGTERM closes the server like ^C, which also stops the workers
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    with server:
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+if __name__ == "__main__":
+    main()
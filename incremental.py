@@ -0,0 +1,148 @@
+from __future__ import annotations
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass
+from typing import Optional, Union
+from lexer import Token, TokenType
+from parser import Parser, Program, Function, Statement, Variable, token_symbol
+from symbols import SymbolKind, SymbolTable
+
+# Incremental compilation for editor use. A CompileResult keeps every
+# top-level item of Program.programs with its source span and its own TAC.
+# recompile() applies one text edit: only the items touching the edit are
+# re-lexed, re-parsed and lowered again, every other item is reused with its
+# span shifted. Temps and labels are numbered per item, starting at t0 and
+# L0, so reused TAC never has to be renumbered. Tokens inside reused AST
+# nodes keep the line they had when the item was last parsed. Recompiled
+# items are resolved against the globals and functions the items before
+# them declare; the items after the edit are only resolved again when the
+# edit changed what the recompiled items declare.
+
+@dataclass
+class Item:
+    start: int
+    end: int
+    line: int
+    node: Union[Function, Statement]
+    tac: list
+
+@dataclass
+class CompileResult:
+    source: str
+    items: list[Item]
+    reparsed: int
+
+    @property
+    def program(self) -> Program:
+        return Program([item.node for item in self.items])
+
+    @property
+    def tac(self) -> list:
+        tac = []
+        for item in self.items:
+            tac.extend(item.tac)
+        return tac
+
+#(name token, kind) of the global or function a top-level item declares
+def item_declaration(node) -> Optional[tuple[Token, SymbolKind]]:
+    if isinstance(node, Function):
+        return node.declaration.ident, SymbolKind.FUNCTION
+    if isinstance(node, Statement) and isinstance(node.statement, Variable):
+        return node.statement.declaration.ident, SymbolKind.VARIABLE
+    return None
+
+#names and kinds declared by items, in order
+def declared_names(items) -> list:
+    names = []
+    for item in items:
+        declaration = item_declaration(item.node)
+        if declaration is not None:
+            names.append((declaration[0].lexeme, declaration[1]))
+    return names
+
+#global scope holding what items, which were resolved already, declare
+def global_scope(items) -> SymbolTable:
+    symbols = SymbolTable()
+    for item in items:
+        declaration = item_declaration(item.node)
+        if declaration is not None:
+            token, kind = declaration
+            symbols.declare(token_symbol(token), kind, token.line)
+    return symbols
+
+#lex, parse and resolve source[start:end] into items, with line being the
+#line at start; symbols holds the globals declared before start and gets
+#those of the items added
+def compile_region(source, start, end, line, symbols: Optional[SymbolTable] = None) -> list[Item]:
+    parser = Parser(source, compact=True)
+    parser.lex.current = start
+    parser.lex.line = line
+    parser.lex.scan_tokens(end)
+    tokens = parser.tokens
+    if symbols is not None:
+        parser.symbols = symbols
+
+    items = []
+    while parser.peek().token_type != TokenType.EOF:
+        first = parser.current + 1
+        node = parser.parse_item()
+        last = parser.current
+        parser.resolve(node)
+
+        parser.tac = []
+        parser.temp_count = 0
+        parser.label_count = 0
+        parser.eval_ir(node)
+
+        items.append(Item(tokens.starts[first], tokens.starts[last] + tokens.lengths[last],
+                          tokens.lines[first], node, parser.tac))
+    return items
+
+#compile a whole source from scratch
+def compile_source(source) -> CompileResult:
+    items = compile_region(source, 0, len(source), 1)
+    return CompileResult(source, items, len(items))
+
+#apply the edit source[start:end] = text to a previous result
+def recompile(previous: CompileResult, start, end, text) -> CompileResult:
+    old = previous.source
+    items = previous.items
+    if not 0 <= start <= end <= len(old):
+        raise ValueError(f"Edit range {start}:{end} outside of source of length {len(old)}")
+
+    source = old[:start] + text + old[end:]
+    delta = len(text) - (end - start)
+    line_delta = text.count("\n") - old.count("\n", start, end)
+
+    # items from lo to hi (inclusive) touch the edit and are compiled again
+    starts = [item.start for item in items]
+    ends = [item.end for item in items]
+    lo = bisect_right(starts, start) - 1
+    hi = bisect_left(ends, end)
+    lo, hi = min(lo, hi), max(lo, hi)
+
+    while True:
+        region_start = items[lo].start if lo >= 0 else 0
+        region_line = items[lo].line if lo >= 0 else 1
+        region_end = items[hi].end + delta if hi < len(items) else len(source)
+        symbols = global_scope(items[:max(lo, 0)])
+        try:
+            fresh = compile_region(source, region_start, region_end, region_line, symbols)
+            break
+        except SystemExit:
+            # the edit may leave an item open (e.g. a removed "}"), so let the
+            # region swallow the next item and try again. At the end of the
+            # source the error is real.
+            if hi >= len(items):
+                raise
+            hi += 1
+
+    kept_after = [Item(item.start + delta, item.end + delta, item.line + line_delta, item.node, item.tac)
+                  for item in items[hi + 1:]]
+    # a global the edit added, removed or renamed may clash with or be used
+    # by a later item
+    if declared_names(items[max(lo, 0):hi + 1]) != declared_names(fresh):
+        checker = Parser("", compact=True)
+        checker.symbols = symbols
+        for item in kept_after:
+            checker.resolve(item.node)
+    return CompileResult(source, items[:max(lo, 0)] + fresh + kept_after, len(fresh))
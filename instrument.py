@@ -0,0 +1,93 @@
+import cProfile
+import json
+import os
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass, field, asdict
+from typing import Callable, Optional, TextIO
+
+# Per-stage instrumentation of a compile. The Parser wraps lexing,
+# parse_program, eval_ir, the optimizer and code generation in
+# instrument.stage(name, counts), and records wall time, the counts the
+# stage reports (tokens, AST nodes, TAC instructions, temps), optionally the
+# peak traced memory above what was live when the stage started and, with a
+# profile directory, a cProfile dump per stage. tracemalloc slows every
+# allocation down several times, so memory is off by default and a stage
+# timed with it on is marked as such in the output. The default DISABLED
+# instance hands out one shared null context, so an uninstrumented compile
+# pays a method call and a with statement per stage and nothing else.
+
+@dataclass
+class StageRecord:
+    name: str
+    seconds: float
+    counts: dict[str, int] = field(default_factory=dict)
+    peak_bytes: Optional[int] = None
+    profile: Optional[str] = None
+    # the stage ran under tracemalloc, so seconds is inflated
+    traced: bool = False
+
+class Instrumentation:
+    def __init__(self, enabled=True, memory=False, profile_dir: Optional[str] = None):
+        self.enabled = enabled
+        self.memory = memory
+        self.profile_dir = profile_dir
+        self.records: list[StageRecord] = []
+        self.null = nullcontext()
+
+    #context manager around one stage; counts is called after the stage
+    #finishes and only when enabled, so it may walk the stage's output
+    def stage(self, name: str, counts: Optional[Callable[[], dict]] = None):
+        if not self.enabled:
+            return self.null
+        return self.record(name, counts)
+
+    @contextmanager
+    def record(self, name: str, counts: Optional[Callable[[], dict]]):
+        # tracing started here has its peak reset and is stopped here; the
+        # peak of a session started by a caller is never reset. That caller
+        # keeps its session and its peak, so the stage's peak is only known
+        # when the stage raised the session's peak.
+        started = self.memory and not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start()
+        if self.memory:
+            before, session_peak = tracemalloc.get_traced_memory()
+            if started:
+                tracemalloc.reset_peak()
+        profiler = cProfile.Profile() if self.profile_dir is not None else None
+        if profiler is not None:
+            profiler.enable()
+        start = time.perf_counter()
+        finished = False
+        try:
+            yield
+            finished = True
+        finally:
+            seconds = time.perf_counter() - start
+            if profiler is not None:
+                profiler.disable()
+            record = StageRecord(name, seconds, traced=self.memory)
+            if self.memory:
+                peak = tracemalloc.get_traced_memory()[1]
+                if started or peak > session_peak:
+                    record.peak_bytes = peak - before
+                if started:
+                    tracemalloc.stop()
+            if profiler is not None:
+                os.makedirs(self.profile_dir, exist_ok=True)
+                record.profile = os.path.join(self.profile_dir, f"{len(self.records):02d}-{name}.prof")
+                profiler.dump_stats(record.profile)
+            if counts is not None and finished:
+                record.counts = counts()
+            self.records.append(record)
+
+    def to_json(self) -> list[dict]:
+        return [asdict(record) for record in self.records]
+
+    def write(self, stream: TextIO, **extra):
+        json.dump({**extra, "stages": self.to_json()}, stream)
+        stream.write("\n")
+
+DISABLED = Instrumentation(enabled=False)
@@ -0,0 +1,222 @@
+from enum import IntEnum
+from typing import Optional
+from symbols import NAMES, NAME_IDS, intern_name
+
+# Typed three-address code. An Instr is a slotted (op, dst, a, b) record
+# with an explicit opcode. Operands carry their kind (temp, variable,
+# immediate, label) from creation, and names are interned to integer ids
+# (see symbols), so passes compare and hash operands without parsing strings again.
+
+class Op(IntEnum):
+    LABEL = 0
+    END = 1
+    PARAMETER = 2
+    DECLARE = 3
+    COPY = 4
+    ADD = 5
+    SUB = 6
+    MUL = 7
+    DIV = 8
+    EQ = 9
+    LT = 10
+    LE = 11
+    GT = 12
+    GE = 13
+    SHL = 14
+    SHR = 15
+    BLOCK = 16
+    JUMP = 17
+    JEQ = 18
+    JNE = 19
+    JLT = 20
+    JLE = 21
+    JGT = 22
+    JGE = 23
+
+class Kind(IntEnum):
+    TEMP = 0
+    VAR = 1
+    IMM = 2
+    LABEL = 3
+
+# source operator lexeme <-> binary opcode
+BINARY_OPS = {
+    "+": Op.ADD, "-": Op.SUB, "*": Op.MUL, "/": Op.DIV,
+    "==": Op.EQ, "<": Op.LT, "<=": Op.LE, ">": Op.GT, ">=": Op.GE,
+    "<<": Op.SHL, ">>": Op.SHR,
+}
+SYMBOL = {op: symbol for symbol, op in BINARY_OPS.items()}
+
+# conditional jumps: the comparison each one tests, the branch taken for a
+# comparison, and the branch with the opposite outcome
+BRANCH_TEST = {Op.JEQ: Op.EQ, Op.JLT: Op.LT, Op.JLE: Op.LE, Op.JGT: Op.GT, Op.JGE: Op.GE}
+BRANCH_FOR = {test: branch for branch, test in BRANCH_TEST.items()}
+NEGATED = {Op.JEQ: Op.JNE, Op.JNE: Op.JEQ, Op.JLT: Op.JGE, Op.JGE: Op.JLT,
+           Op.JLE: Op.JGT, Op.JGT: Op.JLE}
+BRANCH_SYMBOL = {**{branch: SYMBOL[test] for branch, test in BRANCH_TEST.items()}, Op.JNE: "!="}
+
+class Operand:
+    # One shared object per (kind, id): operands compare and hash by
+    # identity. For IMM the id is the value itself, otherwise a name id.
+    __slots__ = ("kind", "id")
+
+    def __init__(self, kind: Kind, id: int):
+        self.kind = kind
+        self.id = id
+
+    @property
+    def name(self) -> str:
+        return str(self.id) if self.kind == Kind.IMM else NAMES[self.id]
+
+    @property
+    def is_imm(self) -> bool:
+        return self.kind == Kind.IMM
+
+    def __str__(self):
+        return self.name
+
+    def __repr__(self):
+        return f"Operand({self.kind.name}, {self.name})"
+
+    # pickled by name so ids from another process are interned again
+    def __reduce__(self):
+        if self.kind == Kind.IMM:
+            return (imm, (self.id,))
+        return (operand, (self.kind, self.name))
+
+OPERANDS: dict[tuple[Kind, int], Operand] = {}
+
+def operand(kind: Kind, name: str) -> Operand:
+    return named(kind, intern_name(name))
+
+#operand of an already interned name, e.g. the symbol id of a token
+def named(kind: Kind, name_id: int) -> Operand:
+    key = (kind, name_id)
+    found = OPERANDS.get(key)
+    if found is None:
+        found = OPERANDS[key] = Operand(kind, name_id)
+    return found
+
+def temp(name: str) -> Operand:
+    return operand(Kind.TEMP, name)
+
+def var(name: str) -> Operand:
+    return operand(Kind.VAR, name)
+
+def label(name: str) -> Operand:
+    return operand(Kind.LABEL, name)
+
+def imm(value: int) -> Operand:
+    key = (Kind.IMM, value)
+    found = OPERANDS.get(key)
+    if found is None:
+        found = OPERANDS[key] = Operand(Kind.IMM, value)
+    return found
+
+class Instr:
+    # Jumps keep their target label in dst: JUMP goes to dst, a conditional
+    # jump compares a with b and goes to dst when the test holds.
+    __slots__ = ("op", "dst", "a", "b")
+
+    def __init__(self, op: Op, dst: Optional[Operand] = None,
+                 a: Optional[Operand] = None, b: Optional[Operand] = None):
+        self.op = op
+        self.dst = dst
+        self.a = a
+        self.b = b
+
+    @property
+    def is_binary(self) -> bool:
+        return Op.ADD <= self.op <= Op.SHR
+
+    @property
+    def is_branch(self) -> bool:
+        return Op.JEQ <= self.op <= Op.JGE
+
+    @property
+    def is_jump(self) -> bool:
+        return Op.JUMP <= self.op <= Op.JGE
+
+    def __eq__(self, other):
+        return (isinstance(other, Instr) and self.op == other.op and self.dst is other.dst
+                and self.a is other.a and self.b is other.b)
+
+    def __hash__(self):
+        return hash((self.op, id(self.dst), id(self.a), id(self.b)))
+
+    def __reduce__(self):
+        return (Instr, (self.op, self.dst, self.a, self.b))
+
+    # same text dump_tac printed for the old (target, arg1, op, arg2) tuples
+    def __str__(self):
+        match self.op:
+            case Op.LABEL | Op.END | Op.PARAMETER | Op.DECLARE:
+                return f"{self.op.name} {self.a}"
+            case Op.COPY:
+                return f"{self.dst} = {self.a}"
+            case Op.BLOCK:
+                return f"{self.a}:"
+            case Op.JUMP:
+                return f"GOTO {self.dst}"
+            case _ if self.is_branch:
+                return f"IF {self.a} {BRANCH_SYMBOL[self.op]} {self.b} GOTO {self.dst}"
+            case _:
+                return f"{self.dst} = {self.a} {SYMBOL[self.op]} {self.b}"
+
+    def __repr__(self):
+        return f"Instr({self})"
+
+#operands instr reads, immediates included
+def uses_of(instr: Instr) -> tuple:
+    if instr.op == Op.COPY:
+        return (instr.a,)
+    if instr.is_binary or instr.is_branch:
+        return (instr.a, instr.b)
+    return ()
+
+#operand instr writes: the destination of a copy or binary op, the
+#variable of a PARAMETER or DECLARE, otherwise None
+def defined_by(instr: Instr) -> Optional[Operand]:
+    if instr.op == Op.COPY or instr.is_binary:
+        return instr.dst
+    if instr.op == Op.PARAMETER or instr.op == Op.DECLARE:
+        return instr.a
+    return None
+
+# Integer semantics of the binary opcodes: 64-bit two's complement, division
+# truncating toward zero as in C, comparisons giving 1 or 0.
+WORD_BITS = 64
+WORD_MASK = (1 << WORD_BITS) - 1
+SIGN_BIT = 1 << (WORD_BITS - 1)
+
+def wrap(value: int) -> int:
+    value &= WORD_MASK
+    return value - (1 << WORD_BITS) if value & SIGN_BIT else value
+
+#value of a op b, None when it is undefined (division by zero, bad shift)
+def evaluate(op: Op, a: int, b: int) -> Optional[int]:
+    match op:
+        case Op.ADD: return wrap(a + b)
+        case Op.SUB: return wrap(a - b)
+        case Op.MUL: return wrap(a * b)
+        case Op.DIV:
+            if b == 0:
+                return None
+            quotient = abs(a) // abs(b)
+            return wrap(quotient if (a < 0) == (b < 0) else -quotient)
+        case Op.EQ: return int(a == b)
+        case Op.LT: return int(a < b)
+        case Op.LE: return int(a <= b)
+        case Op.GT: return int(a > b)
+        case Op.GE: return int(a >= b)
+        case Op.SHL:
+            return wrap(a << b) if 0 <= b < WORD_BITS else None
+        case Op.SHR:
+            return a >> b if 0 <= b < WORD_BITS else None
+    return None
+
+#whether the conditional jump op is taken for operands a and b
+def branch_taken(op: Op, a: int, b: int) -> bool:
+    if op == Op.JNE:
+        return a != b
+    return bool(evaluate(BRANCH_TEST[op], a, b))
@@ -1,5 +1,10 @@
+from array import array
 from enum import Enum, auto
+import mmap
+import os
+import re
 import sys
+from symbols import NAMES, NAME_IDS, intern_name
 
 class TokenType(Enum):
     #keywords
@@ -59,15 +64,103 @@ class TokenClass(Enum):
     EOF = auto()
 
 class Token:
-    def __init__(self, token_type, token_class, lexeme, line):
+    __slots__ = ("token_type", "token_class", "lexeme", "line", "symbol")
+
+    def __init__(self, token_type, token_class, lexeme, line, symbol=None):
         self.token_type = token_type
         self.token_class = token_class
         self.lexeme = lexeme
         self.line = line
+        # interned id of an identifier (see symbols), None for other tokens
+        self.symbol = symbol
     
     def __str__(self):
         return f"Token({self.token_type}, {self.token_class}, '{self.lexeme}')"
 
+    # symbol ids belong to one process, an identifier is pickled by name
+    def __reduce__(self):
+        if self.symbol is not None:
+            return (identifier_token, (self.lexeme, self.line))
+        return (Token, (self.token_type, self.token_class, self.lexeme, self.line))
+
+#IDENTIFIER token for lexeme, interned; the lexeme is the shared name string
+def identifier_token(lexeme, line) -> Token:
+    symbol = intern_name(lexeme)
+    return Token(TokenType.IDENTIFIER, TokenClass.IDENTIFIER, NAMES[symbol], line, symbol)
+
+# keyword lexeme -> token type
+KEYWORDS = {
+    "if": TokenType.IF,
+    "else": TokenType.ELSE,
+    "while": TokenType.WHILE,
+    "break": TokenType.BREAK,
+    "continue": TokenType.CONTINUE,
+    "int": TokenType.INT,
+    "float": TokenType.FLOAT,
+    "return": TokenType.RETURN,
+    "char": TokenType.CHAR,
+    "void": TokenType.VOID,
+    "main": TokenType.MAIN,
+}
+
+# operator/delimiter lexeme -> (token type, token class)
+PUNCTUATION = {
+    ';': (TokenType.SEMICOLON, TokenClass.DELIMITER),
+    ',': (TokenType.COMMA, TokenClass.DELIMITER),
+    ':': (TokenType.COLON, TokenClass.DELIMITER),
+    '(': (TokenType.LEFTPARAM, TokenClass.DELIMITER),
+    ')': (TokenType.RIGHTPARAM, TokenClass.DELIMITER),
+    '{': (TokenType.LEFTBRACE, TokenClass.DELIMITER),
+    '}': (TokenType.RIGHTBRACE, TokenClass.DELIMITER),
+    '[': (TokenType.LEFTBRKT, TokenClass.DELIMITER),
+    ']': (TokenType.RIGHTBRKT, TokenClass.DELIMITER),
+    '*': (TokenType.STAR, TokenClass.OPERATOR),
+    '^': (TokenType.CARROT, TokenClass.OPERATOR),
+    '?': (TokenType.QUESTION, TokenClass.OPERATOR),
+    '&': (TokenType.AT, TokenClass.OPERATOR),
+    '+': (TokenType.PLUS, TokenClass.OPERATOR),
+    '++': (TokenType.PLUS_PLUS, TokenClass.OPERATOR),
+    '+=': (TokenType.PLUS_EQUAL, TokenClass.OPERATOR),
+    '-': (TokenType.MINUS, TokenClass.OPERATOR),
+    '--': (TokenType.MINUS_MINUS, TokenClass.OPERATOR),
+    '/': (TokenType.SLASH, TokenClass.OPERATOR),
+    '//': (TokenType.SLASH_SLASH, TokenClass.OPERATOR),
+    '>': (TokenType.GREATER, TokenClass.OPERATOR),
+    '>=': (TokenType.GREATER_EQUAL, TokenClass.OPERATOR),
+    '>>': (TokenType.SHIFT_RIGHT, TokenClass.OPERATOR),
+    '<': (TokenType.LESSER, TokenClass.OPERATOR),
+    '<=': (TokenType.LESSER_EQUAL, TokenClass.OPERATOR),
+    '<<': (TokenType.SHIFT_LEFT, TokenClass.OPERATOR),
+    '=': (TokenType.EQUAL, TokenClass.OPERATOR),
+    '==': (TokenType.EQUAL_EQUAL, TokenClass.OPERATOR),
+}
+
+# master pattern, one alternative per token kind after skipping blanks.
+# "//" and the two-character operators come before their one-character
+# prefixes so the longest lexeme wins, matching the lookahead in scan_token.
+# A comment still produces a SLASH_SLASH token and drops the rest of the
+# line. A newline group also swallows the indentation that follows it.
+# Anything else falls through to the ERROR group. WORD is every \w character
+# but digits and _, which also takes numeric characters such as ½ and Ⅻ
+# that str.isalpha rejects, so an identifier is checked with non_letter.
+TOKEN_PATTERN = re.compile(r"""
+    [ \t]*
+    (?:
+        (?P<PUNCT>\+\+|\+=|--|==|>=|>>|<=|<<|//[^\n]*|[;,:(){}\[\]*^?&+\-/<>=])
+       |(?P<WORD>[^\W\d_]+)
+       |(?P<NUMBER>\d+)
+       |(?P<NEWLINE>\n[\n \t]*)
+       |(?P<ERROR>[^ \t\n])
+    )
+""", re.VERBOSE)
+
+#the first character of a WORD match that Lexer would not take as a
+#letter, or None when the whole match is letters
+def non_letter(lexeme: str):
+    if lexeme.isalpha():
+        return None
+    return next(char for char in lexeme if not char.isalpha())
+
 class Lexer:
     def __init__(self, source):
         self.source = source
@@ -169,8 +262,11 @@ class Lexer:
                         self.current += 1
                         alpha.append(self.source[self.current])
                     alpha_keyword = self.handle_keyword(''.join(alpha))
-                    alpha_class = TokenClass.IDENTIFIER if (alpha_keyword == TokenType.IDENTIFIER) else TokenClass.KEYWORD
-                    self.add_token(alpha_keyword, alpha_class , ''.join(alpha))
+                    if alpha_keyword == TokenType.IDENTIFIER:
+                        self.tokens.append(identifier_token(''.join(alpha), self.line))
+                        self.current += 1
+                    else:
+                        self.add_token(alpha_keyword, TokenClass.KEYWORD, ''.join(alpha))
                 else:
                     sys.exit("Invalid Token: {}".format(lex));
 
@@ -196,9 +292,9 @@ class Lexer:
             case _ : return TokenType.IDENTIFIER
 
     #print token
-    def print_token(self):
+    def print_token(self, stream=None):
         for token in self.tokens:
-            print(token)
+            print(token, file=stream)
 
     #get tokens
     def get_tokens(self):
@@ -206,4 +302,343 @@ class Lexer:
     
     #get line
     def get_line(self):
-        return self.line
\ No newline at end of file
+        return self.line
+
+class TableLexer(Lexer):
+    # Same token stream as Lexer, but driven by TOKEN_PATTERN and the
+    # KEYWORDS/PUNCTUATION tables instead of one scan_token call per character.
+
+    #scan_tokens
+    def scan_tokens(self):
+        self.tokens.extend(self.iter_tokens(self.source, len(self.source)))
+        self.tokens.append(Token(TokenType.EOF, TokenClass.EOF, "", self.line))
+
+    #yield the tokens of text[self.current:end], advancing current and line
+    def iter_tokens(self, text, end):
+        punctuation = PUNCTUATION
+        keywords = KEYWORDS
+        name_ids = NAME_IDS
+        names = NAMES
+        line = self.line
+
+        for match in TOKEN_PATTERN.finditer(text, self.current, end):
+            kind = match.lastgroup
+            if kind == "PUNCT":
+                lexeme = match.group(kind)
+                if lexeme.startswith("//"):
+                    lexeme = "//"
+                token_type, token_class = punctuation[lexeme]
+                yield Token(token_type, token_class, lexeme, line)
+            elif kind == "WORD":
+                lexeme = match.group(kind)
+                token_type = keywords.get(lexeme)
+                if token_type is None:
+                    # identifier_token, inlined
+                    symbol = name_ids.get(lexeme)
+                    if symbol is None:
+                        invalid = non_letter(lexeme)
+                        if invalid is not None:
+                            self.line = line
+                            sys.exit("Invalid Token: {}".format(invalid))
+                        symbol = intern_name(lexeme)
+                    yield Token(TokenType.IDENTIFIER, TokenClass.IDENTIFIER, names[symbol], line, symbol)
+                else:
+                    yield Token(token_type, TokenClass.KEYWORD, lexeme, line)
+            elif kind == "NUMBER":
+                yield Token(TokenType.NUMBER, TokenClass.LITERAL, int(match.group(kind)), line)
+            elif kind == "NEWLINE":
+                line += match.group(kind).count("\n")
+            else:
+                self.line = line
+                sys.exit("Invalid Token: {}".format(match.group(kind)))
+
+        self.current = end
+        self.line = line
+
+# characters StreamLexer may cut a chunk after
+STREAM_BOUNDARIES = (" ", "\t", "\n", ";", "{", "}")
+
+class StreamLexer(TableLexer):
+    # TableLexer over a text file object. The file is read in chunks and
+    # tokens are yielded lazily by iter_stream, so only the current chunk,
+    # the tail of the previous one and whatever the consumer keeps are alive
+    # at once. The tail is bounded by the longest token, except for a //
+    # comment, which is held until its line ends.
+
+    def __init__(self, file, chunk_size=1 << 16):
+        super().__init__("")
+        self.file = file
+        self.chunk_size = chunk_size
+
+    #scan_tokens
+    def scan_tokens(self):
+        self.tokens.extend(self.iter_stream())
+
+    #yield every token of the file, ending with EOF
+    def iter_stream(self):
+        buffer = ""
+        while True:
+            chunk = self.file.read(self.chunk_size)
+            buffer = buffer[self.current:] + chunk
+            self.current = 0
+            if not chunk:
+                yield from self.iter_tokens(buffer, len(buffer))
+                break
+            # blanks, newlines, ;, { and } are never inside or at the start of
+            # a longer token, so everything up to the last of them can be
+            # scanned now and the tail waits for the next chunk. A // comment
+            # runs to the end of its line, so one still open cuts before it.
+            end = max(buffer.rfind(boundary) for boundary in STREAM_BOUNDARIES) + 1
+            comment = buffer.find("//", buffer.rfind("\n") + 1)
+            if comment != -1 and comment < end:
+                end = comment
+            if end > 0:
+                yield from self.iter_tokens(buffer, end)
+        self.source = ""
+        yield Token(TokenType.EOF, TokenClass.EOF, "", self.line)
+
+
+# small integer codes for the TokenArray columns
+TOKEN_TYPES = list(TokenType)
+TOKEN_CLASSES = list(TokenClass)
+TYPE_CODE = {token_type: code for code, token_type in enumerate(TOKEN_TYPES)}
+CLASS_CODE = {token_class: code for code, token_class in enumerate(TOKEN_CLASSES)}
+
+class TokenArray:
+    # Struct-of-arrays token storage: one array column per field instead of
+    # one Token object per lexeme. Lexemes are sliced from the source on
+    # access and indexing returns a fresh Token, so the parser can use it
+    # wherever it uses a token list. Identifiers keep their symbol id, -1
+    # for other tokens. Offsets are 32-bit, sources must stay below 4 GiB.
+
+    def __init__(self, source):
+        self.source = source
+        self.types = array('B')
+        self.classes = array('B')
+        self.starts = array('I')
+        self.lengths = array('I')
+        self.lines = array('I')
+        self.symbols = array('i')
+
+    def append(self, type_code, class_code, start, length, line, symbol=-1):
+        self.types.append(type_code)
+        self.classes.append(class_code)
+        self.starts.append(start)
+        self.lengths.append(length)
+        self.lines.append(line)
+        self.symbols.append(symbol)
+
+    #lexeme of token index, NUMBER lexemes are ints like in Token
+    def lexeme(self, index):
+        symbol = self.symbols[index]
+        if symbol >= 0:
+            return NAMES[symbol]
+        text = self.text(self.starts[index], self.lengths[index])
+        if TOKEN_TYPES[self.types[index]] == TokenType.NUMBER:
+            return int(text)
+        return text
+
+    #source text of length characters at start
+    def text(self, start, length) -> str:
+        return self.source[start:start + length]
+
+    def __len__(self):
+        return len(self.types)
+
+    def __getitem__(self, index):
+        symbol = self.symbols[index]
+        return Token(TOKEN_TYPES[self.types[index]], TOKEN_CLASSES[self.classes[index]],
+                     self.lexeme(index), self.lines[index], symbol if symbol >= 0 else None)
+
+    def __iter__(self):
+        for index in range(len(self.types)):
+            yield self[index]
+
+    # symbol ids belong to one process: they are pickled as -1/0 flags and
+    # interned again from the source when loaded
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["symbols"] = array('i', (min(symbol, 0) for symbol in self.symbols))
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        symbols = self.symbols
+        for index, symbol in enumerate(symbols):
+            if symbol == 0:
+                symbols[index] = intern_name(self.text(self.starts[index], self.lengths[index]))
+
+    #bytes held by the columns, not counting the source
+    def nbytes(self):
+        return sum(column.itemsize * len(column) for column in
+                   (self.types, self.classes, self.starts, self.lengths, self.lines, self.symbols))
+
+class ArrayLexer(TableLexer):
+    # TableLexer that records tokens into a TokenArray. scan_tokens can stop
+    # at end so a region of the source is lexed on its own, the EOF token is
+    # then placed at end.
+
+    def __init__(self, source):
+        super().__init__(source)
+        self.tokens = TokenArray(source)
+
+    #scan_tokens
+    def scan_tokens(self, end=None):
+        if end is None:
+            end = len(self.source)
+        tokens = self.tokens
+        punctuation = {lexeme: (TYPE_CODE[token_type], CLASS_CODE[token_class])
+                       for lexeme, (token_type, token_class) in PUNCTUATION.items()}
+        keywords = {lexeme: TYPE_CODE[token_type] for lexeme, token_type in KEYWORDS.items()}
+        identifier = TYPE_CODE[TokenType.IDENTIFIER]
+        identifier_class = CLASS_CODE[TokenClass.IDENTIFIER]
+        keyword_class = CLASS_CODE[TokenClass.KEYWORD]
+        number = TYPE_CODE[TokenType.NUMBER]
+        literal_class = CLASS_CODE[TokenClass.LITERAL]
+        line = self.line
+
+        for match in TOKEN_PATTERN.finditer(self.source, self.current, end):
+            kind = match.lastgroup
+            start, stop = match.span(kind)
+            if kind == "PUNCT":
+                lexeme = match.group(kind)
+                if lexeme.startswith("//"):
+                    lexeme = "//"
+                    stop = start + 2
+                type_code, class_code = punctuation[lexeme]
+                tokens.append(type_code, class_code, start, stop - start, line)
+            elif kind == "WORD":
+                lexeme = match.group(kind)
+                type_code = keywords.get(lexeme)
+                if type_code is None:
+                    symbol = NAME_IDS.get(lexeme)
+                    if symbol is None:
+                        invalid = non_letter(lexeme)
+                        if invalid is not None:
+                            self.line = line
+                            sys.exit("Invalid Token: {}".format(invalid))
+                        symbol = intern_name(lexeme)
+                    tokens.append(identifier, identifier_class, start, stop - start, line, symbol)
+                else:
+                    tokens.append(type_code, keyword_class, start, stop - start, line)
+            elif kind == "NUMBER":
+                tokens.append(number, literal_class, start, stop - start, line)
+            elif kind == "NEWLINE":
+                line += match.group(kind).count("\n")
+            else:
+                self.line = line
+                sys.exit("Invalid Token: {}".format(match.group(kind)))
+
+        self.current = end
+        self.line = line
+        tokens.append(TYPE_CODE[TokenType.EOF], CLASS_CODE[TokenClass.EOF], end, 0, line)
+
+# bytes version of TOKEN_PATTERN for MappedLexer. Words are ASCII letters
+# only, and a NEWLINE is one newline with the blanks after it, so lines are
+# counted without looking at the matched bytes.
+BYTE_TOKEN_PATTERN = re.compile(rb"""
+    [ \t]*
+    (?:
+        (?P<PUNCT>\+\+|\+=|--|==|>=|>>|<=|<<|//[^\n]*|[;,:(){}\[\]*^?&+\-/<>=])
+       |(?P<WORD>[A-Za-z]+)
+       |(?P<NUMBER>[0-9]+)
+       |(?P<NEWLINE>\n[ \t]*)
+       |(?P<ERROR>[^ \t\n])
+    )
+""", re.VERBOSE)
+
+# byte lookup tables for the punctuation: (type code, class code) of a
+# one-byte lexeme indexed by the byte, and of a two-byte lexeme by
+# first * 256 + second
+SINGLE_PUNCTUATION = [None] * 256
+DOUBLE_PUNCTUATION = {}
+for lexeme, (token_type, token_class) in PUNCTUATION.items():
+    codes = (TYPE_CODE[token_type], CLASS_CODE[token_class])
+    if len(lexeme) == 1:
+        SINGLE_PUNCTUATION[ord(lexeme)] = codes
+    else:
+        DOUBLE_PUNCTUATION[ord(lexeme[0]) * 256 + ord(lexeme[1])] = codes
+
+#read-only memory map of the file at path; an empty file, which cannot be
+#mapped, gives empty bytes
+def map_file(path):
+    with open(path, "rb") as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+class ByteTokenArray(TokenArray):
+    # TokenArray over a bytes-like source (bytes or an mmap): offsets are in
+    # bytes and lexemes are decoded only when a token is built. Pickling
+    # copies the source into bytes.
+
+    def text(self, start, length) -> str:
+        return self.source[start:start + length].decode()
+
+    def __getstate__(self):
+        state = super().__getstate__()
+        state["source"] = bytes(self.source)
+        return state
+
+class MappedLexer(ArrayLexer):
+    # ArrayLexer over a bytes-like source, usually map_file of a large
+    # input. The source is never decoded as a whole: the bytes pattern runs
+    # over the mapping, punctuation is typed from the byte tables, and only
+    # words are sliced, to look up keywords and intern identifiers.
+
+    def __init__(self, source):
+        super().__init__(source)
+        self.tokens = ByteTokenArray(source)
+
+    #scan_tokens
+    def scan_tokens(self, end=None):
+        source = self.source
+        if end is None:
+            end = len(source)
+        tokens = self.tokens
+        single = SINGLE_PUNCTUATION
+        double = DOUBLE_PUNCTUATION
+        keywords = {lexeme.encode(): TYPE_CODE[token_type] for lexeme, token_type in KEYWORDS.items()}
+        # symbol ids of the identifiers seen so far, by their bytes
+        symbols = {}
+        slash_slash = double[ord("/") * 256 + ord("/")]
+        identifier = TYPE_CODE[TokenType.IDENTIFIER]
+        identifier_class = CLASS_CODE[TokenClass.IDENTIFIER]
+        keyword_class = CLASS_CODE[TokenClass.KEYWORD]
+        number = TYPE_CODE[TokenType.NUMBER]
+        literal_class = CLASS_CODE[TokenClass.LITERAL]
+        line = self.line
+
+        for match in BYTE_TOKEN_PATTERN.finditer(source, self.current, end):
+            kind = match.lastgroup
+            start, stop = match.span(kind)
+            if kind == "PUNCT":
+                if stop - start == 1:
+                    type_code, class_code = single[source[start]]
+                elif source[start + 1] == 0x2F and source[start] == 0x2F:
+                    type_code, class_code = slash_slash
+                    stop = start + 2
+                else:
+                    type_code, class_code = double[source[start] * 256 + source[start + 1]]
+                tokens.append(type_code, class_code, start, stop - start, line)
+            elif kind == "WORD":
+                word = source[start:stop]
+                type_code = keywords.get(word)
+                if type_code is not None:
+                    tokens.append(type_code, keyword_class, start, stop - start, line)
+                    continue
+                symbol = symbols.get(word)
+                if symbol is None:
+                    symbol = symbols[word] = intern_name(word.decode())
+                tokens.append(identifier, identifier_class, start, stop - start, line, symbol)
+            elif kind == "NUMBER":
+                tokens.append(number, literal_class, start, stop - start, line)
+            elif kind == "NEWLINE":
+                line += 1
+            else:
+                self.line = line
+                sys.exit("Invalid Token: {}".format(match.group(kind).decode(errors="replace")))
+
+        self.current = end
+        self.line = line
+        tokens.append(TYPE_CODE[TokenType.EOF], CLASS_CODE[TokenClass.EOF], end, 0, line)
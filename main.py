@@ -1,26 +1,47 @@
-from lexer import Lexer
+from lexer import Lexer, map_file
 from parser import Parser
+from regalloc import REGISTERS
+from vm import VM, VMError
+from pycodegen import PythonProgram
+import x86
+from instrument import Instrumentation, DISABLED
+import parallel
+from pipeline import run_stages
+import argparse
+import io
+import mmap
+import os
 import sys
 
+# pipeline stages in order, and the file suffix of each artifact
+#"py", "x86" and "asm" are alternative backends that all follow the tac stage
+STAGES = ("tokens", "ast", "tac", "py", "x86", "asm")
+SUFFIX = {"tokens": ".tokens", "ast": ".ast", "tac": ".tac", "py": ".py", "x86": ".x86.s", "asm": ".s"}
+# bytes buffered by each artifact sink before it hits the file
+SINK_BUFFER = 1 << 20
+
 def main():
+    if len(sys.argv) > 1:
+        sys.exit(run_batch(sys.argv[1:]))
+
     while True:
             command = []
             print("Enter code (Ctrl+Z when done):")
-            
+
             try:
                 while True:
                     line = input("> ")
                     command.append(line)
             except EOFError:
                 pass
-            
+
             code = "\n".join(command)
-            
+
             if not code.strip():  # Exit if empty input
                 print("Exiting...")
                 break
-            
-            ast = Parser(code)
+
+            ast = Parser(code, debug=True)
             ast.parse()
             print("===== AST =====")
             ast.print_ast()
@@ -30,6 +51,165 @@ def main():
 
             ast.to_assembly()
 
+#batch driver: compile files (or - for stdin) up to the last --emit stage
+def run_batch(argv) -> int:
+    arg_parser = argparse.ArgumentParser(prog="main.py", description="Compile C subset sources")
+    arg_parser.add_argument("inputs", nargs="+", help="source files, - reads stdin")
+    arg_parser.add_argument("--emit", action="append", choices=STAGES, default=[],
+                            help="artifact to write, may be repeated (default: none)")
+    arg_parser.add_argument("--out-dir", help="directory for artifacts (default: next to each input)")
+    arg_parser.add_argument("-o", "--output", help="path for the single emitted artifact, - for stdout")
+    arg_parser.add_argument("--ast-format", choices=("text", "jsonl"), default="text")
+    arg_parser.add_argument("-O", dest="level", type=int, nargs="?", const=1, default=0,
+                            help="optimization level (default 0, -O alone means 1); "
+                                 "1 and up also run the assembly peephole pass")
+    arg_parser.add_argument("--registers", type=int, default=len(REGISTERS),
+                            help=f"number of allocatable registers (default and maximum {len(REGISTERS)})")
+    arg_parser.add_argument("--run", metavar="FUNCTION",
+                            help="execute FUNCTION and print its variables")
+    arg_parser.add_argument("--backend", choices=("vm", "python"), default="vm",
+                            help="how --run executes: bytecode VM or compiled Python (default vm)")
+    arg_parser.add_argument("--args", type=int, nargs="*", default=[],
+                            help="integer arguments for --run and --link")
+    arg_parser.add_argument("--link", metavar="FUNCTION",
+                            help="build an x86-64 executable that calls FUNCTION with --args and prints the result")
+    arg_parser.add_argument("--result", metavar="VARIABLE",
+                            help="variable the --link function returns (default: the last one assigned)")
+    arg_parser.add_argument("--instrument", metavar="FILE",
+                            help="append per-stage time, counts and peak memory as one JSON line per input "
+                                 "to FILE, - for stderr")
+    arg_parser.add_argument("--memory", action="store_true",
+                            help="with --instrument, also trace peak memory per stage; stage times taken "
+                                 "under tracing are several times too high and marked traced")
+    arg_parser.add_argument("--profile", metavar="DIR",
+                            help="with --instrument, also write a cProfile dump of every stage to DIR")
+    arg_parser.add_argument("--jobs", type=int, default=1,
+                            help="compile the functions of each input on N worker processes, 0 for one per CPU "
+                                 "(not with --emit tokens or ast)")
+    arg_parser.add_argument("--mmap", action="store_true",
+                            help="lex each input from a memory map of the file, without decoding it to text "
+                                 "(ASCII identifiers only, not with --jobs)")
+    arg_parser.add_argument("--stats", action="store_true",
+                            help="report optimization and register allocation statistics on stderr")
+    args = arg_parser.parse_args(argv)
+
+    emit = set(args.emit)
+    if not 1 <= args.registers <= len(REGISTERS):
+        arg_parser.error(f"--registers must be between 1 and {len(REGISTERS)}")
+    if args.out_dir is not None:
+        os.makedirs(args.out_dir, exist_ok=True)
+    if args.output is not None and (len(emit) != 1 or len(args.inputs) != 1):
+        arg_parser.error("-o needs exactly one input and one --emit stage")
+
+    # nothing after the last requested stage runs; with no --emit the
+    # sources are still compiled through assembly to report errors
+    last = max((STAGES.index(stage) for stage in emit), default=len(STAGES) - 1)
+    if args.run is not None:
+        last = max(last, STAGES.index("tac"))
+    if args.link is not None:
+        last = max(last, STAGES.index("x86"))
+    if args.profile is not None and args.instrument is None:
+        arg_parser.error("--profile needs --instrument")
+    if args.memory and args.instrument is None:
+        arg_parser.error("--memory needs --instrument")
+    if args.mmap and args.jobs != 1:
+        arg_parser.error("--mmap cannot be combined with --jobs")
+    for path in args.inputs:
+        if args.instrument is None:
+            compile_file(path, emit, STAGES[:last + 1], args)
+            continue
+        profile_dir = None
+        if args.profile is not None:
+            profile_dir = os.path.join(args.profile, "stdin" if path == "-" else os.path.basename(path))
+        instrument = Instrumentation(memory=args.memory, profile_dir=profile_dir)
+        compile_file(path, emit, STAGES[:last + 1], args, instrument)
+        if args.instrument == "-":
+            instrument.write(sys.stderr, file=path)
+        else:
+            with open(args.instrument, "a") as out:
+                instrument.write(out, file=path)
+    return 0
+
+def compile_file(path, emit, stages, args, instrument: Instrumentation = DISABLED):
+    if path == "-":
+        source = sys.stdin.buffer.read() if args.mmap else sys.stdin.read()
+        stem = "stdin"
+        directory = args.out_dir or "."
+    elif args.mmap:
+        source = map_file(path)
+        stem = os.path.splitext(os.path.basename(path))[0]
+        directory = args.out_dir or os.path.dirname(path) or "."
+    else:
+        with open(path) as file:
+            source = file.read()
+        stem = os.path.splitext(os.path.basename(path))[0]
+        directory = args.out_dir or os.path.dirname(path) or "."
+    try:
+        compile_source(source, path, stem, directory, emit, stages, args, instrument)
+    finally:
+        # tokens copy their lexemes out of the map, so nothing refers to it
+        # once the file is compiled
+        if isinstance(source, mmap.mmap):
+            source.close()
+
+#run the stages of one loaded source and write its artifacts
+def compile_source(source, path, stem, directory, emit, stages, args, instrument: Instrumentation):
+    def sink(stage):
+        target = args.output
+        if target == "-":
+            return open(sys.stdout.fileno(), "w", buffering=SINK_BUFFER, closefd=False)
+        if target is None:
+            target = os.path.join(directory, stem + SUFFIX[stage])
+        return open(target, "w", buffering=SINK_BUFFER)
+
+    parser = Parser(source, instrument=instrument, mapped=args.mmap)
+    registers = REGISTERS[:args.registers]
+    results = {args.link: args.result} if args.link is not None and args.result else None
+    units = None
+    if args.jobs != 1 and "tac" in stages and not emit & {"tokens", "ast"}:
+        # functions are parsed, lowered, optimized and compiled to assembly
+        # on worker processes; the TAC only comes back when a later stage
+        # needs it
+        keep_tac = bool(emit & {"tac", "py", "x86"}) or args.run is not None or args.link is not None
+        with instrument.stage("parallel", lambda: {"units": len(units)}):
+            units = parallel.compile_parallel(source, args.jobs or None, args.level, registers, keep_tac=keep_tac)
+
+    def on_tac(parser):
+        if args.run is not None:
+            run_function(parser.tac, args)
+        if args.link is not None:
+            link_function(parser, path, directory, stem, registers, results, args)
+
+    passes, allocations = run_stages(parser, emit, stages, sink, args.level, registers, args.ast_format,
+                                     units, results, on_tac)
+    if args.stats:
+        for stats in passes + allocations:
+            print(f"{path}: {stats}", file=sys.stderr)
+
+#--link: the executable linked from the x86-64 source of the program
+def link_function(parser, path, directory, stem, registers, results, args):
+    buffer = io.StringIO()
+    try:
+        parser.to_x86(buffer, header=False, registers=registers, results=results,
+                      entry=args.link, args=args.args)
+        x86.link(buffer.getvalue(), os.path.join(directory, stem))
+    except (ValueError, x86.ToolchainError) as error:
+        sys.exit(f"{path}: {error}")
+
+#--run: execute a function of the compiled TAC in the VM or as Python
+def run_function(tac, args):
+    stats = None
+    try:
+        if args.backend == "python":
+            values = PythonProgram(tac).call(args.run, *args.args)
+        else:
+            values, stats = VM(tac).call(args.run, *args.args)
+    except VMError as error:
+        sys.exit(str(error))
+    for name, value in values.items():
+        print(f"{name} = {value}")
+    if args.stats and stats is not None:
+        print(stats, file=sys.stderr)
 
 if __name__=="__main__":
-    main()
\ No newline at end of file
+    main()
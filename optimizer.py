@@ -0,0 +1,492 @@
+from dataclasses import dataclass
+from itertools import count
+from ir import Op, Kind, Operand, Instr, NAMES, temp, imm, evaluate, branch_taken, uses_of, defined_by
+from cfg import split_regions, build_blocks, reachable, dominators, natural_loops, liveness
+
+# TAC optimization passes, run between Parser.generate() and to_assembly().
+# Each pass takes a TAC list and returns a new one. optimize() runs every
+# pass enabled at the requested -O level and reports how many instructions
+# each one removed.
+
+@dataclass
+class PassStats:
+    name: str
+    before: int
+    after: int
+
+    @property
+    def removed(self) -> int:
+        return self.before - self.after
+
+    def __str__(self):
+        change = f"{self.removed} removed" if self.removed >= 0 else f"{-self.removed} added"
+        return f"{self.name}: {self.before} -> {self.after} instructions ({change})"
+
+# opcodes the local passes must not carry facts across: function bounds,
+# jump targets and unconditional jumps
+BOUNDARY = {Op.LABEL, Op.END, Op.BLOCK, Op.JUMP}
+
+#fold literal arithmetic, propagate known constants through copies and
+#drop the temps that are no longer read
+def fold_constants(tac: list) -> list:
+    known: dict[Operand, Operand] = {}
+    folded = []
+    for instr in tac:
+        op = instr.op
+        if op in BOUNDARY:
+            known.clear()
+            folded.append(instr)
+            continue
+        if instr.is_branch:
+            a = known.get(instr.a, instr.a)
+            b = known.get(instr.b, instr.b)
+            if a.kind == Kind.IMM and b.kind == Kind.IMM:
+                # decided at compile time: always taken or dropped
+                if branch_taken(op, a.id, b.id):
+                    folded.append(Instr(Op.JUMP, instr.dst))
+                    known.clear()
+                continue
+            folded.append(instr if a is instr.a and b is instr.b else Instr(op, instr.dst, a, b))
+            continue
+        if op == Op.PARAMETER or op == Op.DECLARE:
+            known.pop(instr.a, None)
+            folded.append(instr)
+            continue
+
+        a = known.get(instr.a, instr.a)
+        if op == Op.COPY:
+            if a.kind == Kind.IMM:
+                known[instr.dst] = a
+            else:
+                known.pop(instr.dst, None)
+            folded.append(instr if a is instr.a else Instr(Op.COPY, instr.dst, a))
+            continue
+
+        b = known.get(instr.b, instr.b)
+        if a.kind == Kind.IMM and b.kind == Kind.IMM:
+            value = evaluate(op, a.id, b.id)
+            if value is not None:
+                known[instr.dst] = imm(value)
+                folded.append(Instr(Op.COPY, instr.dst, imm(value)))
+                continue
+        known.pop(instr.dst, None)
+        folded.append(instr if a is instr.a and b is instr.b else Instr(op, instr.dst, a, b))
+    return remove_dead_temps(folded)
+
+#drop instructions that define a temp nobody reads. Walking backwards, a
+#removed instruction releases its own operands, so whole dead chains go in
+#one pass.
+def remove_dead_temps(tac: list) -> list:
+    uses: dict[Operand, int] = {}
+    for instr in tac:
+        for place in uses_of(instr):
+            if place.kind == Kind.TEMP:
+                uses[place] = uses.get(place, 0) + 1
+
+    kept = []
+    for instr in reversed(tac):
+        dst = instr.dst
+        if dst is not None and dst.kind == Kind.TEMP and not uses.get(dst):
+            for place in (instr.a, instr.b):
+                if place is not None and place.kind == Kind.TEMP:
+                    uses[place] -= 1
+            continue
+        kept.append(instr)
+    kept.reverse()
+    return kept
+
+# opcodes whose operands can be swapped, and comparisons rewritten to their
+# mirror so a > b and b < a share a value number
+COMMUTATIVE = {Op.ADD, Op.MUL, Op.EQ}
+MIRRORED = {Op.GT: Op.LT, Op.GE: Op.LE}
+
+#local value numbering: a binary op whose value is already held by an
+#operand is not computed again. A temp holding the value replaces the
+#redundant temp in later uses and the instruction is dropped; a variable
+#holding it turns the instruction into a copy. Facts are reset at
+#function boundaries and updated whenever an operand is reassigned.
+def eliminate_common_subexpressions(tac: list) -> list:
+    out = []
+    value_of: dict[Operand, int] = {}
+    holders: dict[int, list[Operand]] = {}
+    table: dict[tuple, int] = {}
+    alias: dict[Operand, Operand] = {}
+    aliased_by: dict[Operand, list[Operand]] = {}
+    numbers = count()
+
+    def value(place: Operand) -> int:
+        number = value_of.get(place)
+        if number is None:
+            number = value_of[place] = next(numbers)
+            holders[number] = [place]
+        return number
+
+    #place is about to get a new value: settle everything tied to the old one
+    def kill(place: Operand):
+        for other in aliased_by.pop(place, ()):
+            if alias.get(other) is place:
+                # a redundant temp still reads the old value, keep it in a copy
+                out.append(Instr(Op.COPY, other, place))
+                del alias[other]
+        alias.pop(place, None)
+        number = value_of.pop(place, None)
+        if number is not None:
+            holders[number].remove(place)
+
+    def assign(place: Operand, number: int):
+        kill(place)
+        value_of[place] = number
+        holders.setdefault(number, []).append(place)
+
+    for instr in tac:
+        op = instr.op
+        if op in BOUNDARY:
+            value_of.clear()
+            holders.clear()
+            table.clear()
+            alias.clear()
+            aliased_by.clear()
+            out.append(instr)
+            continue
+        if instr.is_branch:
+            a = alias.get(instr.a, instr.a)
+            b = alias.get(instr.b, instr.b)
+            out.append(instr if a is instr.a and b is instr.b else Instr(op, instr.dst, a, b))
+            continue
+        if op == Op.PARAMETER or op == Op.DECLARE:
+            kill(instr.a)
+            out.append(instr)
+            continue
+
+        a = alias.get(instr.a, instr.a)
+        if op == Op.COPY:
+            number = value(a)
+            assign(instr.dst, number)
+            out.append(instr if a is instr.a else Instr(Op.COPY, instr.dst, a))
+            continue
+
+        b = alias.get(instr.b, instr.b)
+        key_op, left, right = op, value(a), value(b)
+        if key_op in MIRRORED:
+            key_op, left, right = MIRRORED[key_op], right, left
+        if key_op in COMMUTATIVE and right < left:
+            left, right = right, left
+        key = (key_op, left, right)
+
+        number = table.get(key)
+        held = holders.get(number, ()) if number is not None else ()
+        dst = instr.dst
+        temp_holder = next((place for place in held if place.kind == Kind.TEMP), None)
+        if temp_holder is not None and dst.kind == Kind.TEMP and dst is not temp_holder:
+            kill(dst)
+            alias[dst] = temp_holder
+            aliased_by.setdefault(temp_holder, []).append(dst)
+            continue
+        if held:
+            source = temp_holder or held[0]
+            if source is not dst:
+                assign(dst, number)
+                out.append(Instr(Op.COPY, dst, source))
+            continue
+
+        number = next(numbers)
+        table[key] = number
+        assign(dst, number)
+        out.append(instr if a is instr.a and b is instr.b else Instr(op, dst, a, b))
+    return out
+
+#t = a op b; x = t  ->  x = a op b, when the copy is the only read of t
+def coalesce_copies(tac: list) -> list:
+    reads: dict[Operand, int] = {}
+    for instr in tac:
+        for place in uses_of(instr):
+            if place.kind == Kind.TEMP:
+                reads[place] = reads.get(place, 0) + 1
+
+    out = []
+    for instr in tac:
+        if instr.op == Op.COPY and instr.a.kind == Kind.TEMP and reads[instr.a] == 1 and out:
+            previous = out[-1]
+            if previous.dst is instr.a and (previous.op == Op.COPY or previous.is_binary):
+                out[-1] = Instr(previous.op, instr.dst, previous.a, previous.b)
+                continue
+        out.append(instr)
+    return out
+
+#forward copy propagation: after x = y, later reads of x read y until
+#either side is assigned again
+def propagate_copies(tac: list) -> list:
+    copies: dict[Operand, Operand] = {}
+    copied_from: dict[Operand, set] = {}
+
+    def kill(place: Operand):
+        source = copies.pop(place, None)
+        if source is not None:
+            copied_from[source].discard(place)
+        for target in copied_from.pop(place, ()):
+            copies.pop(target, None)
+
+    out = []
+    for instr in tac:
+        op = instr.op
+        if op in BOUNDARY:
+            copies.clear()
+            copied_from.clear()
+            out.append(instr)
+            continue
+        if op == Op.PARAMETER or op == Op.DECLARE:
+            kill(instr.a)
+            out.append(instr)
+            continue
+
+        a = copies.get(instr.a, instr.a)
+        b = copies.get(instr.b, instr.b) if instr.b is not None else None
+        if instr.is_branch:
+            out.append(instr if a is instr.a and b is instr.b else Instr(op, instr.dst, a, b))
+            continue
+        dst = instr.dst
+        kill(dst)
+        if op == Op.COPY:
+            if a is dst:
+                continue
+            copies[dst] = a
+            copied_from.setdefault(a, set()).add(dst)
+        out.append(instr if a is instr.a and b is instr.b else Instr(op, dst, a, b))
+    return out
+
+#liveness-based dead code elimination over the control flow graph of each
+#region. Variables are the observable results, so every variable is live
+#when the region is left; temps are live only when read later. Unreachable
+#blocks and instructions whose result is dead are removed, until nothing
+#else can go.
+def eliminate_dead_code(tac: list) -> list:
+    out = []
+    for start, end in split_regions(tac):
+        region = tac[start:end]
+        while True:
+            kept = sweep_region(region)
+            if len(kept) == len(region):
+                break
+            region = kept
+        out.extend(region)
+    return out
+
+#one round of eliminate_dead_code over a single region
+def sweep_region(region: list) -> list:
+    blocks = build_blocks(region, 0, len(region))
+    observable = {place for instr in region for place in (instr.dst, instr.a, instr.b)
+                  if place is not None and place.kind == Kind.VAR}
+    live_in, live_out = liveness(region, blocks, observable)
+    live_blocks = reachable(blocks)
+
+    kept = []
+    for number, block in enumerate(blocks):
+        if number not in live_blocks:
+            # the function's own LABEL and END stay, even after an endless loop
+            kept.extend(instr for instr in region[block.start:block.end]
+                        if instr.op == Op.LABEL or instr.op == Op.END)
+            continue
+        live = set(live_out[number])
+        block_kept = []
+        for instr in reversed(region[block.start:block.end]):
+            if instr.op == Op.COPY or instr.is_binary:
+                if instr.dst not in live:
+                    continue
+                live.discard(instr.dst)
+            elif instr.op == Op.PARAMETER or instr.op == Op.DECLARE:
+                live.discard(instr.a)
+            for place in uses_of(instr):
+                if place.kind != Kind.IMM:
+                    live.add(place)
+            block_kept.append(instr)
+        block_kept.reverse()
+        kept.extend(block_kept)
+    return kept
+
+#loop-invariant code motion: a temp computed in a while loop from operands
+#the loop never assigns (or from other invariant temps) is computed once,
+#in front of the loop header, instead of on every iteration
+def hoist_loop_invariants(tac: list) -> list:
+    out = []
+    for start, end in split_regions(tac):
+        region = tac[start:end]
+        while True:
+            hoisted = hoist_from_one_loop(region)
+            if hoisted is None:
+                break
+            region = hoisted
+        out.extend(region)
+    return out
+
+#region with the invariants of its innermost loop that has any hoisted, or
+#None when no loop has invariants left
+def hoist_from_one_loop(region: list):
+    blocks = build_blocks(region, 0, len(region))
+    definitions: dict[Operand, int] = {}
+    for instr in region:
+        target = defined_by(instr)
+        if target is not None:
+            definitions[target] = definitions.get(target, 0) + 1
+
+    for loop in natural_loops(blocks, dominators(blocks)):
+        header = blocks[loop.header]
+        # the code in front of the header runs once per entry to the loop only
+        # if the header is entered from outside by falling into it
+        outside = [pred for pred in header.predecessors if pred not in loop.body]
+        if outside != [loop.header - 1] or region[header.start - 1].is_jump:
+            continue
+
+        indices = [index for number in sorted(loop.body)
+                   for index in range(blocks[number].start, blocks[number].end)]
+        assigned = {defined_by(region[index]) for index in indices} - {None}
+        invariant: list[int] = []
+        invariant_temps: set[Operand] = set()
+        changed = True
+        while changed:
+            changed = False
+            for index in indices:
+                instr = region[index]
+                if index in invariant or not (instr.op == Op.COPY or instr.is_binary):
+                    continue
+                dst = instr.dst
+                if dst.kind != Kind.TEMP or definitions[dst] != 1:
+                    continue
+                # hoisted code runs even when the loop body would not, so it
+                # must not be able to divide by zero
+                if instr.op == Op.DIV and not (instr.b.is_imm and instr.b.id != 0):
+                    continue
+                if all(place.is_imm or place not in assigned or place in invariant_temps
+                       for place in uses_of(instr)):
+                    invariant.append(index)
+                    invariant_temps.add(dst)
+                    changed = True
+        if invariant:
+            # keep the order they had in the loop, which respects their dependences
+            invariant.sort()
+            moved = set(invariant)
+            hoisted = [region[index] for index in invariant]
+            rest = [instr for index, instr in enumerate(region) if index not in moved]
+            position = header.start - sum(1 for index in invariant if index < header.start)
+            return rest[:position] + hoisted + rest[position:]
+    return None
+
+# approximate x86-64 latency in cycles of each opcode, used to decide when a
+# strength reduction is worth it (64-bit idiv is the slow one)
+CYCLES = {
+    Op.COPY: 1, Op.ADD: 1, Op.SUB: 1, Op.SHL: 1, Op.SHR: 1,
+    Op.EQ: 1, Op.LT: 1, Op.LE: 1, Op.GT: 1, Op.GE: 1,
+    Op.MUL: 3, Op.DIV: 40,
+}
+
+#k when value == 2**k
+def log2_exact(value: int):
+    if value > 0 and value & (value - 1) == 0:
+        return value.bit_length() - 1
+    return None
+
+#x * c as shifts, adds and subtracts: c = 2**k, 2**j + 2**k or 2**j - 2**k,
+#negated for negative c. new_temp() names the intermediate results.
+def multiply_sequence(dst: Operand, x: Operand, c: int, new_temp) -> list:
+    if c == 0:
+        return [Instr(Op.COPY, dst, imm(0))]
+    magnitude = abs(c)
+    result = dst if c > 0 else new_temp()
+    sequence = []
+    k = log2_exact(magnitude)
+    if k == 0:
+        result = x
+    elif k is not None:
+        sequence.append(Instr(Op.SHL, result, x, imm(k)))
+    else:
+        low = magnitude & -magnitude
+        high = magnitude - low
+        if log2_exact(high) is not None:
+            op, high_shift, low_shift = Op.ADD, log2_exact(high), log2_exact(low)
+        elif log2_exact(magnitude + low) is not None:
+            op, high_shift, low_shift = Op.SUB, log2_exact(magnitude + low), log2_exact(low)
+        else:
+            return None
+        parts = []
+        for shift in (high_shift, low_shift):
+            if shift == 0:
+                parts.append(x)
+            else:
+                part = new_temp()
+                sequence.append(Instr(Op.SHL, part, x, imm(shift)))
+                parts.append(part)
+        sequence.append(Instr(op, result, parts[0], parts[1]))
+    if c < 0:
+        sequence.append(Instr(Op.SUB, dst, imm(0), result))
+    elif result is not dst:
+        sequence.append(Instr(Op.COPY, dst, result))
+    return sequence
+
+#x / c for c = +-2**k with C truncation: negative x is biased by 2**k - 1
+#before the arithmetic shift, computed as ((x < 0) << k) - (x < 0)
+def divide_sequence(dst: Operand, x: Operand, c: int, new_temp) -> list:
+    k = log2_exact(abs(c))
+    if k is None:
+        return None
+    result = dst if c > 0 else new_temp()
+    if k == 0:
+        sequence = [Instr(Op.COPY, result, x)]
+    else:
+        sign, scaled, bias, biased = new_temp(), new_temp(), new_temp(), new_temp()
+        sequence = [
+            Instr(Op.LT, sign, x, imm(0)),
+            Instr(Op.SHL, scaled, sign, imm(k)),
+            Instr(Op.SUB, bias, scaled, sign),
+            Instr(Op.ADD, biased, x, bias),
+            Instr(Op.SHR, result, biased, imm(k)),
+        ]
+    if c < 0:
+        sequence.append(Instr(Op.SUB, dst, imm(0), result))
+    return sequence
+
+#replace multiplies and divides by a constant with cheaper shift sequences
+#when CYCLES says the sequence is faster
+def reduce_strength(tac: list) -> list:
+    # fresh temps continue the numbering of the temps already in tac
+    numbers = count(1 + max((int(NAMES[place.id][1:]) for instr in tac for place in (instr.dst, instr.a, instr.b)
+                             if place is not None and place.kind == Kind.TEMP and NAMES[place.id][1:].isdigit()),
+                            default=-1))
+
+    def new_temp() -> Operand:
+        return temp(f"t{next(numbers)}")
+
+    out = []
+    for instr in tac:
+        sequence = None
+        if instr.op == Op.MUL:
+            if instr.b.is_imm:
+                sequence = multiply_sequence(instr.dst, instr.a, instr.b.id, new_temp)
+            elif instr.a.is_imm:
+                sequence = multiply_sequence(instr.dst, instr.b, instr.a.id, new_temp)
+        elif instr.op == Op.DIV and instr.b.is_imm:
+            sequence = divide_sequence(instr.dst, instr.a, instr.b.id, new_temp)
+        if sequence is not None and sum(CYCLES[step.op] for step in sequence) < CYCLES[instr.op]:
+            out.extend(sequence)
+        else:
+            out.append(instr)
+    return out
+
+# (minimum -O level, name, pass) in the order they run
+PASSES = [
+    (1, "constant folding", fold_constants),
+    (2, "common subexpression elimination", eliminate_common_subexpressions),
+    (2, "strength reduction", reduce_strength),
+    (2, "loop-invariant code motion", hoist_loop_invariants),
+    (2, "copy coalescing", coalesce_copies),
+    (2, "copy propagation", propagate_copies),
+    (2, "dead code elimination", eliminate_dead_code),
+]
+
+def optimize(tac: list, level: int = 1) -> tuple[list, list[PassStats]]:
+    stats = []
+    for min_level, name, run in PASSES:
+        if level < min_level:
+            continue
+        before = len(tac)
+        tac = run(tac)
+        stats.append(PassStats(name, before, len(tac)))
+    return tac, stats
@@ -0,0 +1,152 @@
+import io
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from itertools import repeat
+from typing import Optional
+from lexer import TokenType
+from parser import Parser, Function
+from pipeline import optimize_tac, write_assembly
+from symbols import SymbolKind, intern_name
+import regalloc
+
+# Parallel compile of the functions of one source. The parent only finds
+# the top-level items by matching braces and semicolons, then cuts the
+# source into chunks at item boundaries and hands each chunk to a worker
+# process. A worker parses its chunk and lowers, optimizes and emits
+# assembly for every unit in it: a function, or a run of consecutive
+# top-level statements. Every unit numbers its temps and labels from t0 and
+# L0, and units share no state, so the results only depend on the source.
+# Executor.map keeps the chunks in source order and the units are merged in
+# that order, so the output is the same for any number of workers. A
+# worker checks the scopes of its chunk against the globals and functions
+# the items before the chunk declare, which the parent reads off the start
+# of each item.
+
+# braces, semicolons and // comments, the only text the splitter needs
+ITEM_SYNTAX = re.compile(r"//[^\n]*|[{};]")
+# the type and name a top-level item starts with when it declares a global
+# or a function
+DECLARATION = re.compile(r"(?:\s|//[^\n]*)*(?:int|float|char|void)\s+([^\W\d_]+)")
+
+@dataclass
+class Unit:
+    tac: list
+    assembly: str
+    passes: list = field(default_factory=list)
+    allocations: list = field(default_factory=list)
+
+#(start, end, line, is_function) of every top-level item of source
+def split_items(source: str) -> list[tuple[int, int, int, bool]]:
+    items = []
+    depth = 0
+    start = 0
+    line = 1
+    counted = 0
+    braces = False
+    for match in ITEM_SYNTAX.finditer(source):
+        char = match.group()
+        if char[0] == "/":
+            continue
+        if char == "{":
+            depth += 1
+            braces = True
+            continue
+        if char == "}":
+            depth -= 1
+        if depth == 0:
+            end = match.end()
+            items.append((start, end, line, braces))
+            line += source.count("\n", counted, end)
+            start = counted = end
+            braces = False
+    if source[start:].strip():
+        items.append((start, len(source), line, braces))
+    return items
+
+#(end, (name, line, is_function)) of the globals and functions declared
+#by items, with end the offset where the declaring item ends
+def declarations(source: str, items) -> list[tuple[int, tuple[str, int, bool]]]:
+    declared = []
+    for start, end, line, is_function in items:
+        match = DECLARATION.match(source, start, end)
+        if match is not None:
+            line += source.count("\n", start, match.start(1))
+            declared.append((end, (match.group(1), line, is_function)))
+    return declared
+
+#(start, end, line) of about count chunks of similar size. A chunk only
+#ends before or after a function, so a run of top-level statements stays
+#in one unit.
+def make_chunks(source: str, count: int, items=None) -> list[tuple[int, int, int]]:
+    if items is None:
+        items = split_items(source)
+    if not items:
+        return []
+    target = max(len(source) // max(count, 1), 1)
+    chunks = []
+    start, line = 0, 1
+    for number, (_, end, _, is_function) in enumerate(items):
+        following = items[number + 1] if number + 1 < len(items) else None
+        if following is None:
+            chunks.append((start, len(source), line))
+        elif end - start >= target and (is_function or following[3]):
+            chunks.append((start, end, line))
+            start, line = end, following[2]
+    return chunks
+
+#parse text and compile every unit in it, with declared the globals and
+#functions of the items before it; runs in a worker process
+def compile_chunk(text: str, line: int, declared: list, level: int, registers, keep_tac: bool) -> list[Unit]:
+    parser = Parser(text, compact=True)
+    parser.lex.line = line
+    parser.lex.scan_tokens()
+    for name, declared_line, is_function in declared:
+        parser.symbols.declare(intern_name(name), SymbolKind.FUNCTION if is_function else SymbolKind.VARIABLE,
+                               declared_line)
+
+    units: list[list] = []
+    function_unit = True
+    while parser.peek().token_type != TokenType.EOF:
+        node = parser.parse_item()
+        parser.resolve(node)
+        is_function = isinstance(node, Function)
+        if is_function or function_unit:
+            units.append([])
+        units[-1].append(node)
+        function_unit = is_function
+
+    compiled = []
+    for nodes in units:
+        parser.tac = []
+        parser.temp_count = 0
+        parser.label_count = 0
+        for node in nodes:
+            parser.eval_ir(node)
+        passes = optimize_tac(parser, level)
+        out = io.StringIO()
+        allocations = write_assembly(parser, out, registers, level)
+        compiled.append(Unit(parser.tac if keep_tac else [], out.getvalue(), passes, allocations))
+    return compiled
+
+#compile source in worker processes (default: one per CPU); returns the
+#units in source order
+def compile_parallel(source: str, workers: Optional[int] = None, level: int = 0,
+                     registers=regalloc.REGISTERS, keep_tac=True,
+                     chunks_per_worker=4) -> list[Unit]:
+    workers = workers or os.cpu_count() or 1
+    items = split_items(source)
+    chunks = make_chunks(source, workers * chunks_per_worker, items)
+    texts = [source[start:end] for start, end, _ in chunks]
+    lines = [line for _, _, line in chunks]
+    declared = declarations(source, items)
+    # declarations before each chunk
+    before = [[entry for end, entry in declared if end <= start] for start, _, _ in chunks]
+    args = (texts, lines, before, repeat(level), repeat(registers), repeat(keep_tac))
+    if workers == 1:
+        results = map(compile_chunk, *args)
+        return [unit for units in results for unit in units]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(compile_chunk, *args)
+        return [unit for units in results for unit in units]
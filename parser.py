@@ -1,8 +1,19 @@
 from __future__ import annotations
 from dataclasses import dataclass
-from lexer import Token, TokenType, TokenClass, Lexer
-from typing import Union, Optional
+from lexer import Token, TokenType, TokenClass, Lexer, TableLexer, StreamLexer, ArrayLexer, MappedLexer
+from typing import Union, Optional, TextIO
+import io
+import json
 import sys
+import optimizer
+import regalloc
+from cfg import build_blocks, liveness
+import pycodegen
+import x86
+from peephole import AsmInstr, optimize as peephole_optimize
+from instrument import Instrumentation, DISABLED
+from ir import Op, Kind, Operand, Instr, BINARY_OPS, SYMBOL, BRANCH_FOR, NEGATED, temp, label, imm, named
+from symbols import SymbolTable, SymbolKind, intern_name
 
 # @dataclass
 # class TreeNode:
@@ -38,6 +49,24 @@ class Identifier:
     def __str__(self):
         return f"{self.ident}"
 
+# The _format methods below do not recurse. Each node lists its output as
+# _parts: plain strings plus (child, level) pairs, and format_node expands
+# the pairs with an explicit stack. Deeply nested trees print without
+# hitting the recursion limit.
+
+def iter_format(node, level: int = 0):
+    stack = [(node, level)]
+    while stack:
+        part = stack.pop()
+        if isinstance(part, str):
+            yield part
+        else:
+            child, child_level = part
+            stack.extend(reversed(child._parts(child_level)))
+
+def format_node(node, level: int = 0) -> str:
+    return "".join(iter_format(node, level))
+
 @dataclass
 class Expression:
     left_exp: E 
@@ -48,26 +77,29 @@ class Expression:
         return self._format(0)
     
     def _format(self, level: int) -> str:
+        return format_node(self, level)
+
+    def _parts(self, level: int) -> list:
         indent = "\t" * level
         child_indent = "\t" * (level + 1)
         
         if isinstance(self.left_exp, Expression):
-            left_str = f"{child_indent}LEFT EXPRESSION:\n{self.left_exp._format(level + 1)}"
+            left_parts = [f"{child_indent}LEFT EXPRESSION:\n", (self.left_exp, level + 1)]
         else:
-            left_str = f"{child_indent}LEFT EXPRESSION: {self.left_exp}"
+            left_parts = [f"{child_indent}LEFT EXPRESSION: {self.left_exp}"]
         
         if isinstance(self.right_exp, Expression):
-            right_str = f"{child_indent}RIGHT EXPRESSION:\n{self.right_exp._format(level + 1)}"
+            right_parts = [f"{child_indent}RIGHT EXPRESSION:\n", (self.right_exp, level + 1)]
         else:
-            right_str = f"{child_indent}RIGHT EXPRESSION: {self.right_exp}"
+            right_parts = [f"{child_indent}RIGHT EXPRESSION: {self.right_exp}"]
         
-        return (
-            f"{indent}[\n"
-            f"{left_str}\n"
-            f"{child_indent}OPERATOR: {self.op}\n"
-            f"{right_str}\n"
-            f"{indent}]"
-        )
+        return [
+            f"{indent}[\n",
+            *left_parts,
+            f"\n{child_indent}OPERATOR: {self.op}\n",
+            *right_parts,
+            f"\n{indent}]",
+        ]
 
 @dataclass
 class Declaration:
@@ -78,16 +110,26 @@ class Declaration:
         return self._format(0)
     
     def _format(self, level: int) -> str:
+        return format_node(self, level)
+
+    def _parts(self, level: int) -> list:
         indent = "\t" * level
         child_indent = "\t" * (level + 1)
         
-        return (
+        return [
             f"{indent}DECLARATION:\n"
             f"{indent}[\n"
             f"{child_indent}TYPE: {self.d_type}\n"
             f"{child_indent}IDENTIFIER: {self.ident}\n"
             f"{indent}]"
-        )
+        ]
+
+# parts of an initializer: a nested expression or a single operand
+def init_parts(init, level: int) -> list:
+    child_indent = "\t" * (level + 1)
+    if isinstance(init, Expression):
+        return [f"\n{child_indent}EXPRESSION:\n", (init, level + 1)]
+    return [f"\n{child_indent}EXPRESSION: {init}"]
 
 @dataclass
 class Assignment:
@@ -98,21 +140,19 @@ class Assignment:
         return self._format(0)
     
     def _format(self, level: int) -> str:
+        return format_node(self, level)
+
+    def _parts(self, level: int) -> list:
         indent = "\t" * level
         child_indent = "\t" * (level + 1)
         
-        if isinstance(self.init, Expression):
-            init_str = f"\n{child_indent}EXPRESSION:\n{self.init._format(level + 1)}"
-        else:
-            init_str = f"\n{child_indent}EXPRESSION: {self.init}"
-        
-        return (
+        return [
             f"{indent}ASSIGNMENT:\n"
             f"{indent}[\n"
-            f"{child_indent}IDENTIFIER: {self.ident}\n"
-            f"{init_str}\n"
-            f"{indent}]"
-        )
+            f"{child_indent}IDENTIFIER: {self.ident}\n",
+            *init_parts(self.init, level),
+            f"\n{indent}]",
+        ]
 
 @dataclass
 class Variable:
@@ -123,26 +163,19 @@ class Variable:
         return self._format(0)
     
     def _format(self, level: int) -> str:
-        indent = "\t" * level
-        child_indent = "\t" * (level + 1)
+        return format_node(self, level)
 
-        dec_str = self.declaration._format(level + 1)
-        
-        if self.init is not None:
-            if isinstance(self.init, Expression):
-                init_str = f"\n{child_indent}EXPRESSION:\n{self.init._format(level + 1)}"
-            else:
-                init_str = f"\n{child_indent}EXPRESSION: {self.init}"
-        else:
-            init_str = "" 
+    def _parts(self, level: int) -> list:
+        indent = "\t" * level
+        init = init_parts(self.init, level) if self.init is not None else []
         
-        return (
+        return [
             f"{indent}VARIABLE:\n"
-            f"{indent}[\n"
-            f"{dec_str}"
-            f"{init_str}\n"
-            f"{indent}]"
-        )
+            f"{indent}[\n",
+            (self.declaration, level + 1),
+            *init,
+            f"\n{indent}]",
+        ]
 
 @dataclass
 class Function:
@@ -154,46 +187,147 @@ class Function:
         return self._format(0)
     
     def _format(self, level: int) -> str:
+        return format_node(self, level)
+
+    def _parts(self, level: int) -> list:
         indent = "\t" * level
         child_indent = "\t" * (level + 1)
         
-        func_decl_str = self.declaration._format(level + 1)
-        
         if self.parameters:
-            params_list = []
-            for param in self.parameters:
-                params_list.append(param._format(level + 2))
-            params_str = f"{child_indent}PARAMETERS:\n{child_indent}[\n" + ",\n".join(params_list) + f"\n{child_indent}]"
+            params = [f"{child_indent}PARAMETERS:\n{child_indent}[\n"]
+            for index, param in enumerate(self.parameters):
+                if index:
+                    params.append(",\n")
+                params.append((param, level + 2))
+            params.append(f"\n{child_indent}]")
         else:
-            params_str = f"{child_indent}PARAMETERS: []"
-        
-        block_str = self.statement_block._format(level + 1)
+            params = [f"{child_indent}PARAMETERS: []"]
         
-        return (
+        return [
             f"{indent}FUNCTION:\n"
-            f"{indent}[\n"
-            f"{func_decl_str}\n"
-            f"{params_str}\n"
-            f"{block_str}\n"
-            f"{indent}]"
-        )
+            f"{indent}[\n",
+            (self.declaration, level + 1),
+            "\n",
+            *params,
+            "\n",
+            (self.statement_block, level + 1),
+            f"\n{indent}]",
+        ]
     
+# parts of a condition: a nested expression or a single operand
+def condition_parts(condition, level: int) -> list:
+    child_indent = "\t" * (level + 1)
+    if isinstance(condition, Expression):
+        return [f"{child_indent}CONDITION:\n", (condition, level + 1)]
+    return [f"{child_indent}CONDITION: {condition}"]
+
+@dataclass
+class If:
+    keyword: Token
+    condition: E
+    then_block: StatementBlock
+    else_block: Optional[StatementBlock] = None
+
+    def __str__(self):
+        return self._format(0)
+    
+    def _format(self, level: int) -> str:
+        return format_node(self, level)
+
+    def _parts(self, level: int) -> list:
+        indent = "\t" * level
+        else_parts = ["\n", (self.else_block, level + 1)] if self.else_block is not None else []
+        
+        return [
+            f"{indent}IF:\n"
+            f"{indent}[\n",
+            *condition_parts(self.condition, level),
+            "\n",
+            (self.then_block, level + 1),
+            *else_parts,
+            f"\n{indent}]",
+        ]
+
+@dataclass
+class While:
+    keyword: Token
+    condition: E
+    body: StatementBlock
+
+    def __str__(self):
+        return self._format(0)
+    
+    def _format(self, level: int) -> str:
+        return format_node(self, level)
+
+    def _parts(self, level: int) -> list:
+        indent = "\t" * level
+        
+        return [
+            f"{indent}WHILE:\n"
+            f"{indent}[\n",
+            *condition_parts(self.condition, level),
+            "\n",
+            (self.body, level + 1),
+            f"\n{indent}]",
+        ]
+
+@dataclass
+class Break:
+    keyword: Token
+
+    def __str__(self):
+        return self._format(0)
+    
+    def _format(self, level: int) -> str:
+        return format_node(self, level)
+
+    def _parts(self, level: int) -> list:
+        indent = "\t" * level
+        return [f"{indent}BREAK"]
+
+@dataclass
+class Continue:
+    keyword: Token
+
+    def __str__(self):
+        return self._format(0)
+    
+    def _format(self, level: int) -> str:
+        return format_node(self, level)
+
+    def _parts(self, level: int) -> list:
+        indent = "\t" * level
+        return [f"{indent}CONTINUE"]
+
 @dataclass
 class Statement:
-    statement: Union[Variable, Assignment]
+    statement: Union[Variable, Assignment, If, While, Break, Continue]
 
     def __str__(self):
         return self._format(0)
     
     def _format(self, level: int) -> str:
+        return format_node(self, level)
+
+    def _parts(self, level: int) -> list:
         indent = "\t" * level
         
-        return (
+        return [
             f"{indent}STATEMENT:\n"
-            f"{indent}[\n"
-            f"{self.statement._format(level + 1)}\n"
-            f"{indent}]"
-        )
+            f"{indent}[\n",
+            (self.statement, level + 1),
+            f"\n{indent}]",
+        ]
+
+# children at level joined by newlines, as "\n".join would
+def joined_parts(children, level: int) -> list:
+    parts = []
+    for index, child in enumerate(children):
+        if index:
+            parts.append("\n")
+        parts.append((child, level))
+    return parts
 
 @dataclass
 class StatementBlock:
@@ -203,16 +337,17 @@ class StatementBlock:
         return self._format(0)
     
     def _format(self, level: int) -> str:
+        return format_node(self, level)
+
+    def _parts(self, level: int) -> list:
         indent = "\t" * level
         
-        items_str = "\n".join(stmt._format(level + 1) for stmt in self.statement)
-        
-        return (
+        return [
             f"{indent}STATEMENT_BLOCK:\n"
-            f"{indent}[\n"
-            f"{items_str}\n"
-            f"{indent}]"
-        )
+            f"{indent}[\n",
+            *joined_parts(self.statement, level + 1),
+            f"\n{indent}]",
+        ]
 
 @dataclass
 class Program: 
@@ -222,40 +357,239 @@ class Program:
         return self._format(0)
     
     def _format(self, level: int) -> str:
+        return format_node(self, level)
+
+    def _parts(self, level: int) -> list:
         indent = "\t" * level
         
         if not self.programs:
-            return f"{indent}PROGRAM: []"
+            return [f"{indent}PROGRAM: []"]
         
-        items_str = "\n".join(item._format(level + 1) for item in self.programs)
-        
-        return (
+        return [
             f"{indent}PROGRAM:\n"
-            f"{indent}[\n"
-            f"{items_str}\n"
-            f"{indent}]"
-        )
+            f"{indent}[\n",
+            *joined_parts(self.programs, level + 1),
+            f"\n{indent}]",
+        ]
 
 E = Union[Literal, Expression] 
 S = Union[Declaration, Expression]
 data_type = {TokenType.INT, TokenType.FLOAT, TokenType.CHAR, TokenType.VOID}
 condition_operator = {TokenType.EQUAL_EQUAL, TokenType.GREATER, TokenType.GREATER_EQUAL,
                       TokenType.LESSER, TokenType.LESSER_EQUAL}
+# operator -> (left, right) binding power for parse_exp
+BINDING_POWER = {
+    TokenType.EQUAL: (1.0, 1.1),
+    TokenType.EQUAL_EQUAL: (8.0, 8.1),
+    TokenType.LESSER: (9.0, 9.1),
+    TokenType.LESSER_EQUAL: (9.0, 9.1),
+    TokenType.GREATER: (9.0, 9.1),
+    TokenType.GREATER_EQUAL: (9.0, 9.1),
+    TokenType.PLUS: (11.0, 11.1),
+    TokenType.MINUS: (11.0, 11.1),
+    TokenType.STAR: (12.0, 12.1),
+    TokenType.SLASH: (12.0, 12.1),
+}
+# opcodes with a pseudo-assembly mnemonic, the rest print their symbol
+ASM_OPS = {Op.ADD: "add", Op.SUB: "sub", Op.MUL: "mul", Op.DIV: "div", Op.SHL: "shl", Op.SHR: "sar"}
+# conditional jump mnemonic of each branch opcode
+JUMP_OPS = {Op.JEQ: "je", Op.JNE: "jne", Op.JLT: "jl", Op.JLE: "jle", Op.JGT: "jg", Op.JGE: "jge"}
+# tokens that end an expression
+expression_end = {TokenType.EOF, TokenType.SEMICOLON, TokenType.RIGHTPARAM}
+
+# parts buffered by write_ast before each write to the stream
+WRITE_BATCH = 4096
+
+# Streaming AST output. "text" writes the same dump as str(node) part by
+# part; "jsonl" writes one JSON object per node in pre-order, each with an
+# id, its parent's id and its role in the parent. Only the walk stack and
+# one batch of parts are held in memory, whatever the size of the tree.
+def write_ast(node, stream: TextIO, format: str = "text"):
+    if format == "text":
+        parts = iter_format(node)
+    elif format == "jsonl":
+        parts = iter_json(node)
+    else:
+        raise ValueError(f"Unknown AST format {format}, expected text or jsonl")
+
+    batch = []
+    for part in parts:
+        batch.append(part)
+        if len(batch) >= WRITE_BATCH:
+            stream.write("".join(batch))
+            batch.clear()
+    stream.write("".join(batch))
+
+def iter_json(node):
+    stack = [(node, None, None)]
+    next_id = 0
+    while stack:
+        node, parent, role = stack.pop()
+        node_id = next_id
+        next_id += 1
+        record = {"id": node_id, "parent": parent, "role": role, "node": type(node).__name__}
+        record.update(node_fields(node))
+        yield json.dumps(record) + "\n"
+        for child_role, child in reversed(node_children(node)):
+            stack.append((child, node_id, child_role))
+
+#scalar attributes of an AST node for its JSON record
+def node_fields(node) -> dict:
+    if isinstance(node, Declaration):
+        return {"type": node.d_type.lexeme, "ident": node.ident.lexeme, "line": node.ident.line}
+    elif isinstance(node, Assignment):
+        return {"ident": node.ident.lexeme, "line": node.ident.line}
+    elif isinstance(node, Expression):
+        return {"op": node.op.operator.lexeme, "line": node.op.operator.line}
+    elif isinstance(node, Literal):
+        token = node.literal
+        return {"token": token.token_type.name, "value": token.lexeme, "line": token.line}
+    elif isinstance(node, Identifier):
+        return {"token": node.ident.token_type.name, "value": node.ident.lexeme, "line": node.ident.line}
+    elif isinstance(node, (If, While, Break, Continue)):
+        return {"line": node.keyword.line}
+    return {}
+
+#(role, child) pairs of an AST node, in source order
+def node_children(node) -> list:
+    if isinstance(node, Program):
+        return [("item", item) for item in node.programs]
+    elif isinstance(node, Function):
+        return ([("declaration", node.declaration)]
+                + [("parameter", param) for param in node.parameters]
+                + [("body", node.statement_block)])
+    elif isinstance(node, StatementBlock):
+        return [("statement", stmt) for stmt in node.statement]
+    elif isinstance(node, Statement):
+        return [("statement", node.statement)]
+    elif isinstance(node, Variable):
+        children = [("declaration", node.declaration)]
+        if node.init is not None:
+            children.append(("init", node.init))
+        return children
+    elif isinstance(node, Assignment):
+        return [("init", node.init)]
+    elif isinstance(node, Expression):
+        return [("left", node.left_exp), ("right", node.right_exp)]
+    elif isinstance(node, If):
+        children = [("condition", node.condition), ("then", node.then_block)]
+        if node.else_block is not None:
+            children.append(("else", node.else_block))
+        return children
+    elif isinstance(node, While):
+        return [("condition", node.condition), ("body", node.body)]
+    return []
+
+#number of nodes in the tree under node
+def count_nodes(node) -> int:
+    count = 0
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        count += 1
+        stack.extend(child for _, child in node_children(node))
+    return count
+
+# tokens the parser looks ahead: peek_dec needs the third upcoming one
+LOOKAHEAD = 3
+
+class TokenWindow:
+    # Ring buffer over a token iterator. Only the next LOOKAHEAD tokens are
+    # held, so a streamed parse keeps O(lookahead) tokens instead of all of them.
+
+    def __init__(self, tokens, size=LOOKAHEAD + 1):
+        self.source = iter(tokens)
+        self.ring: list[Optional[Token]] = [None] * size
+        self.head = 0
+        self.count = 0
+        self.last: Optional[Token] = None
+        self.consumed: Optional[Token] = None
+
+    #pull tokens until n are buffered, False once the iterator is exhausted
+    def fill(self, n) -> bool:
+        ring = self.ring
+        while self.count < n:
+            token = next(self.source, None)
+            if token is None:
+                return False
+            ring[(self.head + self.count) % len(ring)] = token
+            self.count += 1
+            self.last = token
+        return True
+
+    #n-th upcoming token, the final (EOF) token when past the end
+    def peek(self, n=1) -> Token:
+        if self.count < n and not self.fill(n):
+            return self.last
+        return self.ring[(self.head + n - 1) % len(self.ring)]
+
+    def next(self) -> Token:
+        if self.count == 0 and not self.fill(1):
+            sys.exit(f"Parser reach beyond the end of tokens on line: {self.consumed.line} at {self.consumed.lexeme}")
+        token = self.ring[self.head]
+        self.ring[self.head] = None
+        self.head = (self.head + 1) % len(self.ring)
+        self.count -= 1
+        self.consumed = token
+        return token
+
+#symbol id of a name token; main is a keyword and is interned here
+#an identifier operand, the only thing = may assign to
+def is_variable(node) -> bool:
+    return isinstance(node, Literal) and node.literal.token_class == TokenClass.IDENTIFIER
+
+def token_symbol(token: Token) -> int:
+    if token.symbol is not None:
+        return token.symbol
+    return intern_name(token.lexeme)
 
 class Parser:
-    def __init__(self, line):
+    def __init__(self, line, stream=False, compact=False, debug=False,
+                 instrument: Instrumentation = DISABLED, mapped=False):
         self.root: Optional[StatementBlock] = None
-        self.lex = Lexer(line)
+        self.debug = debug
+        self.instrument = instrument
+        self.window: Optional[TokenWindow] = None
+        if stream:
+            # line is a text file object, tokens are pulled lazily while parsing
+            self.lex = StreamLexer(line)
+            self.window = TokenWindow(self.lex.iter_stream())
+        elif mapped:
+            # line is bytes or an mmap (see lexer.map_file), scanned without
+            # decoding into a TokenArray of byte offsets
+            self.lex = MappedLexer(line)
+        elif compact:
+            # tokens live in a TokenArray, Token objects are built on access
+            self.lex = ArrayLexer(line)
+        else:
+            self.lex = TableLexer(line)
         self.tokens = self.lex.get_tokens()
         self.current = -1
         self.temp_count = 0
+        self.label_count = 0
+        # (continue, break) labels of the enclosing while loops
+        self.loops: list[tuple[Operand, Operand]] = []
         self.tac = []
+        # scopes checked by resolve; function_depth is the depth of the
+        # scope of the function being resolved, None outside of functions
+        self.symbols = SymbolTable()
+        self.function_depth: Optional[int] = None
         
+    def scan_tokens(self):
+        with self.instrument.stage("lex", lambda: {"tokens": len(self.tokens)}):
+            self.lex.scan_tokens()
+
     def parse(self):
-        self.lex.scan_tokens()
-        print("===== TOKENS =====")
-        self.lex.print_token()
-        self.root = self.parse_program()
+        # tokens may already be scanned by a caller that wanted them first
+        if self.window is None and not self.tokens:
+            self.scan_tokens()
+            if self.debug:
+                print("===== TOKENS =====")
+                self.lex.print_token()
+        with self.instrument.stage("parse_program", lambda: {"nodes": count_nodes(self.root)}):
+            self.root = self.parse_program()
+        with self.instrument.stage("resolve", lambda: {"symbols": self.symbols.declared}):
+            self.resolve(self.root)
 
         next_token = self.peek()
         if next_token.token_type != TokenType.EOF and next_token.token_type != TokenType.SEMICOLON:
@@ -268,24 +602,38 @@ class Parser:
             if next_token.token_type == TokenType.EOF:
                 break
 
-            next_dec = self.peek_dec()
-            print(f"debug: {next_dec}")
-            if next_dec.token_type == TokenType.LEFTPARAM:
-                func = self.parse_function()
-                program.append(func)
-            elif next_dec.token_type == TokenType.EQUAL or next_dec.token_type == TokenType.SEMICOLON:
-                var = self.parse_statement()                
-                program.append(var)
-            else:
-                sys.exit(f"Not a function nor variable declaration on line {next_token.line}: {next_token.lexeme}")
+            if self.debug:
+                print(f"debug: {self.peek_dec()}")
+            program.append(self.parse_item())
         return Program(program)
 
+    def parse_item(self) -> Union[Function, Statement]:
+        next_token = self.peek()
+        next_dec = self.peek_dec()
+        if next_dec.token_type == TokenType.LEFTPARAM:
+            return self.parse_function()
+        elif next_dec.token_type == TokenType.EQUAL or next_dec.token_type == TokenType.SEMICOLON:
+            return self.parse_statement()
+        else:
+            sys.exit(f"Not a function nor variable declaration on line {next_token.line}: {next_token.lexeme}")
+
     def parse_statement(self) -> Statement:
         start = self.peek()
+        if start.token_type == TokenType.IF:
+            return Statement(self.parse_if())
+        elif start.token_type == TokenType.WHILE:
+            return Statement(self.parse_while())
+
         if start.token_class == TokenClass.IDENTIFIER:
             statement = self.parse_assignment()
         elif start.token_class == TokenClass.KEYWORD and start.token_type in data_type:
             statement = self.parse_variable()
+        elif start.token_type == TokenType.BREAK:
+            statement = Break(self.next())
+        elif start.token_type == TokenType.CONTINUE:
+            statement = Continue(self.next())
+        else:
+            sys.exit(f"Not a statement on line {start.line}: {start.lexeme}")
 
         semicolon = self.peek();
         if semicolon.token_type != TokenType.SEMICOLON:
@@ -315,6 +663,39 @@ class Parser:
 
         return StatementBlock(statements)
 
+    #( expression ) after if and while
+    def parse_condition(self) -> E:
+        delim = self.peek()
+        if delim.token_type != TokenType.LEFTPARAM:
+            sys.exit(f"Condition need to start with ( on line {delim.line}: Got {delim.lexeme}")
+        self.next()
+        condition = self.parse_exp(0.0)
+        delim = self.peek()
+        if delim.token_type != TokenType.RIGHTPARAM:
+            sys.exit(f"Condition need to end with ) on line {delim.line}: Got {delim.lexeme}")
+        self.next()
+        return condition
+
+    #if (condition) { ... } [else { ... } | else if ...]
+    def parse_if(self) -> If:
+        keyword = self.next()
+        condition = self.parse_condition()
+        then_block = self.parse_statement_block()
+        else_block = None
+        if self.peek().token_type == TokenType.ELSE:
+            self.next()
+            if self.peek().token_type == TokenType.IF:
+                else_block = StatementBlock([Statement(self.parse_if())])
+            else:
+                else_block = self.parse_statement_block()
+        return If(keyword, condition, then_block, else_block)
+
+    def parse_while(self) -> While:
+        keyword = self.next()
+        condition = self.parse_condition()
+        body = self.parse_statement_block()
+        return While(keyword, condition, body)
+
     def parse_function(self) -> Function:
         dec = self.parse_declare()
         delim = self.peek()
@@ -376,97 +757,198 @@ class Parser:
         return Declaration(d_type, ident);  
 
     def parse_exp(self, min_bp) -> Expression:
-        lhs = self.next()
-        
-        if lhs.token_type == TokenType.LEFTPARAM:
-            lhs = self.parse_exp(0.0)
-            right_paren = self.next()
-            if right_paren.token_type != TokenType.RIGHTPARAM:
-                sys.exit(f"Expected ')' on line {right_paren.line}")
-        elif lhs.token_class != TokenClass.LITERAL and lhs.token_class != TokenClass.IDENTIFIER:
-            sys.exit(f"Invalid literal on line ({lhs.line}): {lhs.lexeme}")
-        else:
-            lhs = Literal(lhs)
+        # Pratt parser driven by an explicit stack instead of recursion. A
+        # frame (lhs, op, min_bp) is an operator waiting for its right operand,
+        # a frame (None, None, min_bp) is an open parenthesis.
+        stack = []
+        while True:
+            lhs = self.next()
 
-        while True: 
-            op = self.peek()
-            if op.token_type == TokenType.EOF:
-                break
-            if op.token_type == TokenType.SEMICOLON:
-                break
-            if op.token_type == TokenType.RIGHTPARAM:
-                break
-            if op.token_class != TokenClass.OPERATOR:
-                sys.exit(f"Invalid operator on line ({op.line}): {op.lexeme}")
-            left_bp, right_bp = self.binding_power(op)
-            if left_bp < min_bp:
-                break
-            op = self.next()
-            op = Operator(op)
-            rhs = self.parse_exp(right_bp)
-            lhs = Expression(lhs, op, rhs)
-        return lhs  
+            if lhs.token_type == TokenType.LEFTPARAM:
+                stack.append((None, None, min_bp))
+                min_bp = 0.0
+                continue
+            elif lhs.token_class != TokenClass.LITERAL and lhs.token_class != TokenClass.IDENTIFIER:
+                sys.exit(f"Invalid literal on line ({lhs.line}): {lhs.lexeme}")
+            else:
+                lhs = Literal(lhs)
+
+            while True:
+                op = self.peek()
+                if op.token_type not in expression_end:
+                    if op.token_class != TokenClass.OPERATOR:
+                        sys.exit(f"Invalid operator on line ({op.line}): {op.lexeme}")
+                    left_bp, right_bp = self.binding_power(op)
+                    if left_bp >= min_bp:
+                        op = self.next()
+                        stack.append((lhs, Operator(op), min_bp))
+                        min_bp = right_bp
+                        break
+
+                # the operand at the top is complete, hand it to the frame below
+                if not stack:
+                    return lhs
+                left, op, min_bp = stack.pop()
+                if op is None:
+                    right_paren = self.next()
+                    if right_paren.token_type != TokenType.RIGHTPARAM:
+                        sys.exit(f"Expected ')' on line {right_paren.line}")
+                else:
+                    lhs = Expression(left, op, lhs)
       
     def binding_power(self, token):
-        match token.token_type:
-            case TokenType.EQUAL:
-                return (1.0, 1.1)
-            case TokenType.EQUAL_EQUAL:
-                return (8.0, 8.1)
-            case TokenType.LESSER | TokenType.LESSER_EQUAL | TokenType.GREATER | TokenType.GREATER_EQUAL:
-                return (9.0, 9.1)
-            case TokenType.PLUS | TokenType.MINUS:
-                return (11.0, 11.1)
-            case TokenType.STAR | TokenType.SLASH:
-                return (12.0, 12.1)
-            case _:
-                sys.exit(f"Invalid token on line ({token.line}): {token.lexeme}")
+        power = BINDING_POWER.get(token.token_type)
+        if power is None:
+            sys.exit(f"Invalid token on line ({token.line}): {token.lexeme}")
+        return power
 
     def next(self):
+        if self.window is not None:
+            return self.window.next()
         self.current += 1
         if self.current >= len(self.tokens):
             sys.exit(f"Parser reach beyond the end of tokens on line: {self.tokens[self.current-1].line} at {self.tokens[self.current-1].lexeme}")
         return self.tokens[self.current]
     
     def peek(self):
+        if self.window is not None:
+            return self.window.peek()
         if self.current + 1 < len(self.tokens):
             return self.tokens[self.current + 1]
         return self.tokens[-1]
     
     def peek_dec(self):
+        if self.window is not None:
+            return self.window.peek(LOOKAHEAD)
         if self.current + 3 < len(self.tokens):
             return self.tokens[self.current + 3]
         return self.tokens[-1]
     
-    def print_ast(self):
-        print(self.root)
+    def print_ast(self, stream: Optional[TextIO] = None, format: str = "text"):
+        stream = stream if stream is not None else sys.stdout
+        if self.root is None:
+            print(self.root, file=stream)
+            return
+        write_ast(self.root, stream, format)
+        if format == "text":
+            stream.write("\n")
+
+    #check the scopes of node: every name is declared before it is used and
+    #at most once per scope. Functions and statement blocks open scopes, and
+    #a function's parameters share the scope of its body as in C.
+    def resolve(self, node):
+        if isinstance(node, Program):
+            for item in node.programs:
+                self.resolve(item)
 
-    def new_temp(self) -> str:
-        tmp = f"t{self.temp_count}"
+        elif isinstance(node, Function):
+            self.declare(node.declaration.ident, SymbolKind.FUNCTION)
+            self.symbols.push()
+            self.function_depth = self.symbols.depth
+            for param in node.parameters:
+                self.declare(param.ident, SymbolKind.PARAMETER)
+            for stmt in node.statement_block.statement:
+                self.resolve(stmt)
+            self.symbols.pop()
+            self.function_depth = None
+
+        elif isinstance(node, StatementBlock):
+            self.symbols.push()
+            for stmt in node.statement:
+                self.resolve(stmt)
+            self.symbols.pop()
+
+        elif isinstance(node, Statement):
+            self.resolve(node.statement)
+
+        elif isinstance(node, Variable):
+            # the initializer is checked first, it cannot see the new name
+            if node.init is not None:
+                self.resolve_uses(node.init)
+            self.declare(node.declaration.ident, SymbolKind.VARIABLE)
+
+        elif isinstance(node, Assignment):
+            self.resolve_use(node.ident)
+            self.resolve_uses(node.init)
+
+        elif isinstance(node, If):
+            self.resolve_uses(node.condition)
+            self.resolve(node.then_block)
+            if node.else_block is not None:
+                self.resolve(node.else_block)
+
+        elif isinstance(node, While):
+            self.resolve_uses(node.condition)
+            self.resolve(node.body)
+
+    def declare(self, token: Token, kind: SymbolKind):
+        name_id = token_symbol(token)
+        previous = self.symbols.lookup(name_id)
+        if previous is not None:
+            if previous.depth == self.symbols.depth:
+                sys.exit(f"Redeclaration of {token.lexeme} on line {token.line}, "
+                         f"first declared on line {previous.line}")
+            # the variables of a function share one namespace in the TAC, so
+            # only the function's own scope may hide a global
+            if previous.depth != 0 or self.symbols.depth != self.function_depth:
+                sys.exit(f"Declaration of {token.lexeme} on line {token.line} "
+                         f"hides the one on line {previous.line}")
+        self.symbols.declare(name_id, kind, token.line)
+
+    def resolve_use(self, token: Token):
+        symbol = self.symbols.lookup(token_symbol(token))
+        if symbol is None:
+            sys.exit(f"Use of undeclared {token.lexeme} on line {token.line}")
+        if symbol.kind == SymbolKind.FUNCTION:
+            sys.exit(f"Function {token.lexeme} used as a variable on line {token.line}")
+
+    #every identifier in an expression, walked with an explicit stack
+    def resolve_uses(self, node):
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, Expression):
+                operator = node.op.operator
+                if operator.token_type == TokenType.EQUAL and not is_variable(node.left_exp):
+                    sys.exit(f"Left-hand side of assignment must be a variable on line {operator.line}")
+                stack.append(node.right_exp)
+                stack.append(node.left_exp)
+            elif is_variable(node):
+                self.resolve_use(node.literal)
+            elif isinstance(node, Identifier):
+                self.resolve_use(node.ident)
+
+    def new_temp(self) -> Operand:
+        tmp = temp(f"t{self.temp_count}")
         self.temp_count += 1
         return tmp
 
-    def gen_tac(self, target: str, arg1: str, op: str, arg2: Optional[str]):
-        self.tac.append((target, arg1, op, arg2))
+    def new_label(self) -> Operand:
+        block = label(f"L{self.label_count}")
+        self.label_count += 1
+        return block
+
+    def gen_tac(self, op: Op, dst: Optional[Operand] = None,
+                a: Optional[Operand] = None, b: Optional[Operand] = None):
+        self.tac.append(Instr(op, dst, a, b))
 
-    def eval_ir(self, node) -> str:
+    def eval_ir(self, node) -> Optional[Operand]:
         if isinstance(node, Program):
             for program in node.programs:
                 self.eval_ir(program)
-            return ""
+            return None
         
         elif isinstance(node, Function):
-            function_name = node.declaration.ident.lexeme
+            function_name = named(Kind.LABEL, token_symbol(node.declaration.ident))
 
-            self.gen_tac("LABEL",function_name, "", None)
+            self.gen_tac(Op.LABEL, a=function_name)
 
             for param in node.parameters:
-                param_name = param.ident.lexeme
-                self.gen_tac("PARAMETER", param_name, "", None)
+                self.gen_tac(Op.PARAMETER, a=named(Kind.VAR, token_symbol(param.ident)))
 
             self.eval_ir(node.statement_block)
 
-            self.gen_tac("END", function_name, "", None)
+            self.gen_tac(Op.END, a=function_name)
             return function_name
         
         elif isinstance(node, StatementBlock):
@@ -477,128 +959,261 @@ class Parser:
             self.eval_ir(node.statement)
 
         elif isinstance(node, Assignment):
-            var_name = node.ident.lexeme
+            var_place = named(Kind.VAR, token_symbol(node.ident))
             init = self.eval_ir(node.init)
-            self.gen_tac(var_name, init, "=", None)
-            return var_name
+            self.gen_tac(Op.COPY, var_place, init)
+            return var_place
         
         elif isinstance(node, Variable):
-            var_name = node.declaration.ident.lexeme
+            var_place = named(Kind.VAR, token_symbol(node.declaration.ident))
             if node.init is not None:
                 init = self.eval_ir(node.init)
-                self.gen_tac(var_name, init, "=", None)
+                self.gen_tac(Op.COPY, var_place, init)
             else:
-                self.gen_tac("DECLARE", var_name, "", None)
-            return var_name
+                self.gen_tac(Op.DECLARE, a=var_place)
+            return var_place
         
-        elif isinstance(node, Expression):
-            left_place = self.eval_ir(node.left_exp)
-            right_place = self.eval_ir(node.right_exp)
-            op = node.op.operator.lexeme
-            
-            if node.op.operator.token_type == TokenType.EQUAL:
-                if not isinstance(node.left_exp, Literal):
-                    sys.exit("Left-hand side of assignment must be a variable")
-                var_name = node.left_exp.token.lexeme
-                self.gen_tac(var_name, right_place, "=", None)
-                return var_name
+        elif isinstance(node, If):
+            else_label = self.new_label()
+            self.eval_condition(node.condition, else_label)
+            self.eval_ir(node.then_block)
+            if node.else_block is None:
+                self.gen_tac(Op.BLOCK, a=else_label)
             else:
-                tmp = self.new_temp()
-                self.gen_tac(tmp, left_place, op, right_place)
-                return tmp
+                end_label = self.new_label()
+                self.gen_tac(Op.JUMP, end_label)
+                self.gen_tac(Op.BLOCK, a=else_label)
+                self.eval_ir(node.else_block)
+                self.gen_tac(Op.BLOCK, a=end_label)
+
+        elif isinstance(node, While):
+            head_label = self.new_label()
+            end_label = self.new_label()
+            self.gen_tac(Op.BLOCK, a=head_label)
+            self.eval_condition(node.condition, end_label)
+            self.loops.append((head_label, end_label))
+            self.eval_ir(node.body)
+            self.loops.pop()
+            self.gen_tac(Op.JUMP, head_label)
+            self.gen_tac(Op.BLOCK, a=end_label)
+
+        elif isinstance(node, (Break, Continue)):
+            if not self.loops:
+                sys.exit(f"{node.keyword.lexeme} outside of a loop on line {node.keyword.line}")
+            continue_label, break_label = self.loops[-1]
+            self.gen_tac(Op.JUMP, break_label if isinstance(node, Break) else continue_label)
+
+        elif isinstance(node, Expression):
+            return self.eval_expression(node)
             
         elif isinstance(node, Literal):
-            return str(node.literal.lexeme)
+            return self.literal_place(node.literal)
         
         elif isinstance(node, Identifier):
-            return str(node.ident.lexeme)
+            return self.literal_place(node.ident)
         
         else:
             raise RuntimeError("Unknown AST node type")
 
+    #operand for a leaf token: numbers are immediates, anything else a variable
+    def literal_place(self, token: Token) -> Operand:
+        if token.token_type == TokenType.NUMBER:
+            return imm(token.lexeme)
+        return named(Kind.VAR, token_symbol(token))
+
+    #jump to false_label unless condition holds. A comparison from
+    #condition_operator becomes one conditional jump, any other value is
+    #compared with zero.
+    def eval_condition(self, condition, false_label: Operand):
+        if isinstance(condition, Expression) and condition.op.operator.token_type in condition_operator:
+            left = self.eval_ir(condition.left_exp)
+            right = self.eval_ir(condition.right_exp)
+            branch = BRANCH_FOR[BINARY_OPS[condition.op.operator.lexeme]]
+            self.gen_tac(NEGATED[branch], false_label, left, right)
+        else:
+            value = self.eval_ir(condition)
+            self.gen_tac(Op.JEQ, false_label, value, imm(0))
+
+    def eval_expression(self, node: Expression) -> Operand:
+        # post-order walk with an explicit stack: left operand, right operand,
+        # then the node, so temps are numbered as the recursive walk would
+        places = []
+        stack = [(node, False)]
+        while stack:
+            node, ready = stack.pop()
+            if isinstance(node, Literal):
+                places.append(self.literal_place(node.literal))
+            elif not isinstance(node, Expression):
+                places.append(self.eval_ir(node))
+            elif not ready:
+                stack.append((node, True))
+                stack.append((node.right_exp, False))
+                stack.append((node.left_exp, False))
+            else:
+                right_place = places.pop()
+                left_place = places.pop()
+                operator = node.op.operator
+
+                if operator.token_type == TokenType.EQUAL:
+                    if not is_variable(node.left_exp):
+                        sys.exit("Left-hand side of assignment must be a variable")
+                    var_place = named(Kind.VAR, token_symbol(node.left_exp.literal))
+                    self.gen_tac(Op.COPY, var_place, right_place)
+                    places.append(var_place)
+                else:
+                    op = BINARY_OPS.get(operator.lexeme)
+                    if op is None:
+                        sys.exit(f"Unsupported operator on line ({operator.line}): {operator.lexeme}")
+                    tmp = self.new_temp()
+                    self.gen_tac(op, tmp, left_place, right_place)
+                    places.append(tmp)
+        return places.pop()
+
     def generate(self):
         if self.root is None:
             sys.exit("No AST to generate from")
-        self.eval_ir(self.root)
+        with self.instrument.stage("eval_ir", lambda: {"tac": len(self.tac), "temps": self.temp_count,
+                                                       "labels": self.label_count}):
+            self.eval_ir(self.root)
         return self.tac
 
-    def dump_tac(self):
-        print("=== Three-Address Code ===")
-        for tgt, a1, op, a2 in self.tac:
-            if tgt in ("LABEL", "END", "PARAMETER", "DECLARE"):
-                print(f"{tgt} {a1}")
-            elif a2 is None:
-                print(f"{tgt} = {a1}")
-            else:
-                print(f"{tgt} = {a1} {op} {a2}")
+    #run the TAC optimization passes of the given -O level over self.tac
+    def optimize(self, level=1) -> list:
+        with self.instrument.stage("optimize", lambda: {"tac": len(self.tac)}):
+            self.tac, stats = optimizer.optimize(self.tac, level)
+        return stats
 
-    def to_assembly(self):  
-        print("\n=== Pseudo-Assembly ===")
-        reg_map: dict[str,str] = {}
-        next_reg_num = 1
-        
-        def reg_for(place: str) -> str:
-            nonlocal next_reg_num
-            if place not in reg_map:
-                reg_map[place] = f"r{next_reg_num}"
-                next_reg_num += 1
-            return reg_map[place]
-        
-        def is_immediate(value: str) -> bool:
-            """Check if value is a numeric literal"""
-            try:
-                int(value)
-                return True
-            except ValueError:
-                return False
+    def dump_tac(self, stream: Optional[TextIO] = None, header=True):
+        if header:
+            print("=== Three-Address Code ===", file=stream)
+        for instr in self.tac:
+            print(instr, file=stream)
 
-        for tgt, a1, op, a2 in self.tac:
-            match tgt:
-                case "LABEL":
-                    print(f"\n{a1}: ")
-                    print(f"    push rbp")
-                    print(f"    mov rbp, rsp")
-                    continue
-                case "END":
-                    print(f"    mov rsp, rbp")
-                    print(f"    pop rbp")
-                    print(f"    ret")
-                    continue
-                case "PARAMETER":
-                    # rdst = reg_for(a1)
-                    # print(f"    # Parameter: {a1} -> {rdst}")
-                    continue
-                    
-                case "DECLARE":
-                    # rdst = reg_for(a1)
-                    # print(f"    # Declare: {a1} -> {rdst}")
-                    continue
-
-            if a2 is None:
-                if op == "=":
-                    rdst = reg_for(tgt)
-                    if is_immediate(a1):
-                        print(f"    mov {rdst}, #{a1}")
-                    else:
-                        rsrc = reg_for(a1)
-                        print(f"    mov {rdst}, {rsrc}")
-                else:
-                    rsrc = reg_for(a1)
-                    rdst = reg_for(tgt)
-                    print(f"    {op} {rdst}, {rsrc}")
-            else:
-                rdst = reg_for(tgt)
-                if is_immediate(a1):
-                    r1 = f"#{a1}"
-                else:
-                    r1 = reg_for(a1)
-                    
-                if is_immediate(a2):
-                    r2 = f"#{a2}"
-                else:
-                    r2 = reg_for(a2)
-                
-                op_map = {'+': 'add', '-': 'sub', '*': 'mul', '/': 'div'}
-                asm_op = op_map.get(op, op)
-                
-                print(f"    {asm_op} {rdst}, {r1}, {r2}")
\ No newline at end of file
+    #emit pseudo-assembly for self.tac with registers from a linear scan
+    #allocator, optionally cleaned up by the peephole pass. Returns the
+    #allocation statistics of every region, then the peephole statistics.
+    #Variables have a program-wide memory cell [name], zero until stored: a
+    #top-level region stores its variables there when it ends, and a value
+    #live on entry to a region (a global) is loaded from it, as in the VM.
+    def to_assembly(self, stream: Optional[TextIO] = None, header=True,
+                    registers=regalloc.REGISTERS, peephole=False) -> list:
+        if header:
+            print("\n=== Pseudo-Assembly ===", file=stream)
+        listing = []
+        with self.instrument.stage("codegen", lambda: {"instructions": len(listing)}):
+            emit = listing.append
+            stats = []
+            for start, end in regalloc.split_regions(self.tac):
+                top_level = self.tac[start].op != Op.LABEL
+                variables = {place: None for instr in self.tac[start:end] for place in (instr.dst, instr.a, instr.b)
+                             if place is not None and place.kind == Kind.VAR}
+                exit_live = frozenset(variables) if top_level else frozenset()
+                locations, region_stats = regalloc.allocate(self.tac, start, end, registers, exit_live)
+                stats.append(region_stats)
+                frame_size = region_stats.frame_size
+                live_in, _ = liveness(self.tac, build_blocks(self.tac, start, end), exit_live)
+                entry = sorted(live_in[0], key=regalloc.place_order)
+
+                # move between a location and a memory cell, through scratch
+                # when both are in memory
+                def move(target: str, source: str):
+                    if target[0] == "[" and source[0] == "[":
+                        emit(AsmInstr("mov", regalloc.SCRATCH[0], source))
+                        source = regalloc.SCRATCH[0]
+                    emit(AsmInstr("mov", target, source))
+
+                def load_entry():
+                    for place in entry:
+                        move(locations[place], f"[{place.name}]")
+
+                # a spilled source is loaded into a scratch register first
+                def source_for(place: Operand, scratch: str) -> str:
+                    if place.kind == Kind.IMM:
+                        return f"#{place.id}"
+                    location = locations[place]
+                    if location[0] == "[":
+                        emit(AsmInstr("mov", scratch, location))
+                        return scratch
+                    return location
+
+                if top_level:
+                    load_entry()
+                for instr in self.tac[start:end]:
+                    match instr.op:
+                        case Op.LABEL:
+                            emit(AsmInstr("label", str(instr.a)))
+                            emit(AsmInstr("push", "rbp"))
+                            emit(AsmInstr("mov", "rbp", "rsp"))
+                            if frame_size:
+                                emit(AsmInstr("sub", "rsp", str(frame_size)))
+                            load_entry()
+                        case Op.END:
+                            emit(AsmInstr("mov", "rsp", "rbp"))
+                            emit(AsmInstr("pop", "rbp"))
+                            emit(AsmInstr("ret"))
+                        case Op.PARAMETER | Op.DECLARE:
+                            continue
+                        case Op.BLOCK:
+                            emit(AsmInstr("block", str(instr.a)))
+                        case Op.JUMP:
+                            emit(AsmInstr("jmp", str(instr.dst)))
+                        case _ if instr.is_branch:
+                            r1 = source_for(instr.a, regalloc.SCRATCH[0])
+                            r2 = source_for(instr.b, regalloc.SCRATCH[1])
+                            emit(AsmInstr("cmp", r1, r2))
+                            emit(AsmInstr(JUMP_OPS[instr.op], str(instr.dst)))
+                        case Op.COPY:
+                            rdst = locations[instr.dst]
+                            # memory to memory moves go through a scratch register
+                            src = instr.a
+                            if rdst[0] == "[" and not src.is_imm and locations[src][0] == "[":
+                                r1 = source_for(src, regalloc.SCRATCH[0])
+                            elif src.is_imm:
+                                r1 = f"#{src.id}"
+                            else:
+                                r1 = locations[src]
+                            emit(AsmInstr("mov", rdst, r1))
+                        case _:
+                            rdst = locations[instr.dst]
+                            r1 = source_for(instr.a, regalloc.SCRATCH[0])
+                            r2 = source_for(instr.b, regalloc.SCRATCH[1])
+                            asm_op = ASM_OPS.get(instr.op) or SYMBOL[instr.op]
+                            if rdst[0] == "[":
+                                emit(AsmInstr(asm_op, regalloc.SCRATCH[0], r1, r2))
+                                emit(AsmInstr("mov", rdst, regalloc.SCRATCH[0]))
+                            else:
+                                emit(AsmInstr(asm_op, rdst, r1, r2))
+                if top_level:
+                    for place in variables:
+                        move(f"[{place.name}]", locations[place])
+
+            if peephole:
+                listing, peephole_stats = peephole_optimize(listing)
+                stats.append(peephole_stats)
+            for asm in listing:
+                print(asm, file=stream)
+            return stats
+
+    #print the TAC translated to a Python module (see pycodegen)
+    def to_python(self, stream: Optional[TextIO] = None, header=True) -> str:
+        if header:
+            print("\n=== Python ===", file=stream)
+        # bound before the stage, so its counts never see an unbound local
+        output = io.StringIO()
+        with self.instrument.stage("codegen_python", lambda: {"lines": output.getvalue().count("\n")}):
+            output.write(pycodegen.module_source(self.tac))
+            print(output.getvalue(), end="", file=stream)
+        return output.getvalue()
+
+    #print the TAC as x86-64 GNU as source (see x86); with an entry function
+    #the source has a _start that calls it, ready for x86.link
+    def to_x86(self, stream: Optional[TextIO] = None, header=True, registers=regalloc.REGISTERS,
+               results: Optional[dict[str, str]] = None, entry: Optional[str] = None, args=()) -> list:
+        if header:
+            print("\n=== x86-64 ===", file=stream)
+        output = io.StringIO()
+        with self.instrument.stage("codegen_x86", lambda: {"lines": output.getvalue().count("\n")}):
+            source, stats = x86.program_source(self.tac, registers, results, entry, args)
+            output.write(source)
+            print(source, end="", file=stream)
+        return stats
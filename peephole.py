@@ -0,0 +1,136 @@
+from dataclasses import dataclass, field
+
+# Peephole optimization of the pseudo-assembly built by to_assembly. A rule
+# looks at a window of consecutive instructions and returns the instructions
+# to put in their place, or None when it does not apply. RULES is the rule
+# table: the pass slides every rule over the listing, steps back after each
+# rewrite so the new instructions meet their neighbours, and stops at a
+# fixed point.
+
+class AsmInstr:
+    __slots__ = ("op", "args")
+
+    def __init__(self, op: str, *args: str):
+        self.op = op
+        self.args = args
+
+    # a label prints the way to_assembly always printed function labels
+    def __str__(self):
+        if self.op == "label":
+            return f"\n{self.args[0]}: "
+        if self.op == "block":
+            return f"{self.args[0]}:"
+        return f"    {self.op} {', '.join(self.args)}" if self.args else f"    {self.op}"
+
+    def __repr__(self):
+        return f"AsmInstr({str(self).strip()})"
+
+# instructions that do not follow the dst, src[, src] form and end a window
+OPAQUE = {"label", "block", "push", "pop", "ret", "cmp",
+          "jmp", "je", "jne", "jl", "jle", "jg", "jge"}
+
+#operand written by instr, or None
+def written(instr: AsmInstr):
+    if instr.op in OPAQUE or not instr.args:
+        return None
+    return instr.args[0]
+
+#operands read by instr; two operand arithmetic also reads its destination
+def read(instr: AsmInstr) -> tuple:
+    if instr.op in OPAQUE:
+        return instr.args
+    if instr.op == "mov" or len(instr.args) == 3:
+        return instr.args[1:]
+    return instr.args
+
+#mov r, r
+def self_move(window):
+    instr = window[0]
+    if instr.op == "mov" and instr.args[0] == instr.args[1]:
+        return []
+    return None
+
+#x op y, #0 / x op y, #1 identities that reduce to a move
+def identity(window):
+    instr = window[0]
+    if len(instr.args) != 3:
+        return None
+    dst, left, right = instr.args
+    op = instr.op
+    if op in ("add", "sub") and right == "#0" or op == "mul" and right == "#1" or op == "div" and right == "#1":
+        return [AsmInstr("mov", dst, left)]
+    if op in ("add", "mul") and left == ("#0" if op == "add" else "#1"):
+        return [AsmInstr("mov", dst, right)]
+    return None
+
+#mul x, y, #0
+def multiply_zero(window):
+    instr = window[0]
+    if instr.op == "mul" and len(instr.args) == 3 and "#0" in instr.args[1:]:
+        return [AsmInstr("mov", instr.args[0], "#0")]
+    return None
+
+#mov x, y followed by an instruction that writes x without reading it
+def overwritten_move(window):
+    first, second = window
+    if first.op != "mov":
+        return None
+    dst = first.args[0]
+    if written(second) == dst and dst not in read(second):
+        return [second]
+    return None
+
+#mov x, y; mov y, x
+def move_back(window):
+    first, second = window
+    if first.op == "mov" and second.op == "mov" and first.args == second.args[::-1]:
+        return [first]
+    return None
+
+# (window size, name, rule)
+RULES = [
+    (1, "self move", self_move),
+    (1, "identity", identity),
+    (1, "multiply by zero", multiply_zero),
+    (2, "overwritten move", overwritten_move),
+    (2, "move back", move_back),
+]
+
+@dataclass
+class PeepholeStats:
+    before: int
+    after: int
+    rounds: int
+    hits: dict[str, int] = field(default_factory=dict)
+
+    def __str__(self):
+        applied = ", ".join(f"{name} {count}" for name, count in self.hits.items() if count)
+        return (f"peephole: {self.before} -> {self.after} instructions "
+                f"({self.before - self.after} removed, {self.rounds} rounds{': ' + applied if applied else ''})")
+
+def optimize(listing: list, rules=RULES) -> tuple[list, PeepholeStats]:
+    stats = PeepholeStats(len(listing), len(listing), 0, {name: 0 for _, name, _ in rules})
+    widest = max(size for size, _, _ in rules)
+    changed = True
+    while changed:
+        changed = False
+        stats.rounds += 1
+        index = 0
+        while index < len(listing):
+            for size, name, rule in rules:
+                window = listing[index:index + size]
+                if len(window) < size or any(instr.op in OPAQUE for instr in window):
+                    continue
+                replacement = rule(window)
+                if replacement is None:
+                    continue
+                listing[index:index + size] = replacement
+                stats.hits[name] += 1
+                changed = True
+                # step back so rewritten instructions are seen by wider windows
+                index = max(0, index - widest + 1)
+                break
+            else:
+                index += 1
+    stats.after = len(listing)
+    return listing, stats
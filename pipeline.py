@@ -0,0 +1,80 @@
+import os
+from typing import Callable, Optional
+from parser import Parser
+from regalloc import REGISTERS
+
+# The stage pipeline every driver runs: main.py, the compile daemon and the
+# parallel workers. run_stages takes a Parser over the source, runs it up to
+# the last of stages and writes each stage in emit to the stream sink(stage)
+# opens. A compile split across processes by parallel.compile_parallel
+# passes its units instead, which replace the front end and the assembly.
+# optimize_tac and write_assembly are the per-unit back end the workers
+# share with it; the peephole pass runs from level 1 on.
+
+def optimize_tac(parser: Parser, level: int) -> list:
+    return parser.optimize(level) if level > 0 else []
+
+def write_assembly(parser: Parser, out, registers, level: int) -> list:
+    return parser.to_assembly(out, header=False, registers=registers, peephole=level > 0)
+
+def merged_tac(units) -> list:
+    return [instr for unit in units for instr in unit.tac]
+
+def merged_assembly(units) -> str:
+    return "".join(unit.assembly for unit in units)
+
+#run parser up to the last of stages, writing every stage in emit; returns
+#the optimization pass and register allocation statistics. on_tac sees the
+#final TAC before the backends run, results are the x86 return variables.
+def run_stages(parser: Parser, emit, stages, sink, level: int = 0, registers=REGISTERS,
+               ast_format: str = "text", units: Optional[list] = None,
+               results: Optional[dict[str, str]] = None,
+               on_tac: Optional[Callable[[Parser], None]] = None) -> tuple[list, list]:
+    passes = []
+    allocations = []
+    if units is not None:
+        parser.tac = merged_tac(units)
+        passes = [stats for unit in units for stats in unit.passes]
+    else:
+        parser.scan_tokens()
+        if "tokens" in emit:
+            with sink("tokens") as out:
+                parser.lex.print_token(out)
+        if "ast" not in stages:
+            return passes, allocations
+
+        parser.parse()
+        if "ast" in emit:
+            with sink("ast") as out:
+                parser.print_ast(out, ast_format)
+        if "tac" not in stages:
+            return passes, allocations
+
+        parser.generate()
+        passes = optimize_tac(parser, level)
+    if "tac" in emit:
+        with sink("tac") as out:
+            parser.dump_tac(out, header=False)
+    if on_tac is not None:
+        on_tac(parser)
+    if "py" in emit:
+        with sink("py") as out:
+            parser.to_python(out, header=False)
+    if "x86" in emit:
+        with sink("x86") as out:
+            parser.to_x86(out, header=False, registers=registers, results=results)
+    if "asm" not in stages:
+        return passes, allocations
+
+    if units is not None:
+        allocations = [stats for unit in units for stats in unit.allocations]
+        if "asm" in emit:
+            with sink("asm") as out:
+                out.write(merged_assembly(units))
+    elif "asm" in emit:
+        with sink("asm") as out:
+            allocations = write_assembly(parser, out, registers, level)
+    else:
+        with open(os.devnull, "w") as out:
+            allocations = write_assembly(parser, out, registers, level)
+    return passes, allocations
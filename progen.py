@@ -0,0 +1,150 @@
+import argparse
+import random
+import sys
+from dataclasses import dataclass
+from lexer import KEYWORDS
+
+# Synthetic program generator for the benchmarks. Programs stay inside the
+# subset the compiler accepts: a few globals, then functions whose bodies
+# declare their locals up front and mix assignments, if/else and counted
+# while loops. Expressions only read names already in scope and divide by
+# non-zero literals, and every loop counts up to a small bound, so generated
+# programs also run to completion in the VM.
+
+SYMBOLS = ["+", "-", "*", "/", "<", "<=", ">", ">=", "=="]
+
+@dataclass
+class ProgramShape:
+    functions: int = 10
+    params: int = 2
+    locals: int = 4
+    # statements in each block, and how deep if/while blocks nest
+    statements: int = 6
+    nesting: int = 2
+    # expression tree depth and the operands joined at each level
+    depth: int = 3
+    width: int = 2
+    globals: int = 2
+    seed: int = 0
+
+#identifier made of letters only: prefix plus number in base 26
+def identifier(prefix: str, number: int) -> str:
+    suffix = ""
+    while True:
+        suffix = chr(ord("a") + number % 26) + suffix
+        number //= 26
+        if number == 0:
+            break
+    name = prefix + suffix
+    return name + "x" if name in KEYWORDS else name
+
+class ProgramGenerator:
+    def __init__(self, shape: ProgramShape):
+        self.shape = shape
+        self.rng = random.Random(shape.seed)
+        self.global_names = [identifier("g", number) for number in range(shape.globals)]
+        self.function_count = 0
+
+    def expression(self, names: list, depth: int) -> str:
+        rng = self.rng
+        if depth == 0 or rng.random() < 0.2:
+            return rng.choice(names) if rng.random() < 0.7 else str(rng.randint(0, 9))
+        text = self.expression(names, depth - 1)
+        for _ in range(max(self.shape.width, 2) - 1):
+            symbol = rng.choice(SYMBOLS)
+            right = str(rng.randint(1, 9)) if symbol == "/" else self.expression(names, depth - 1)
+            text = f"{text} {symbol} {right}"
+        return f"({text})"
+
+    def block(self, names: list, targets: list, counters: list, level: int, indent: str) -> list:
+        rng = self.rng
+        lines = []
+        for _ in range(self.shape.statements):
+            roll = rng.random()
+            if level < self.shape.nesting and roll < 0.15:
+                lines.append(f"{indent}if ({self.expression(names, 1)} < {self.expression(names, 1)}) {{")
+                lines.extend(self.block(names, targets, counters, level + 1, indent + "    "))
+                if rng.random() < 0.5:
+                    lines.append(f"{indent}}} else {{")
+                    lines.extend(self.block(names, targets, counters, level + 1, indent + "    "))
+                lines.append(f"{indent}}}")
+            elif level < self.shape.nesting and roll < 0.3:
+                counter = counters[level]
+                lines.append(f"{indent}{counter} = 0;")
+                lines.append(f"{indent}while ({counter} < {rng.randint(2, 8)}) {{")
+                lines.append(f"{indent}    {counter} = {counter} + 1;")
+                lines.extend(self.block(names, targets, counters, level + 1, indent + "    "))
+                lines.append(f"{indent}}}")
+            else:
+                lines.append(f"{indent}{rng.choice(targets)} = {self.expression(names, self.shape.depth)};")
+        return lines
+
+    def function(self) -> str:
+        shape = self.shape
+        name = identifier("f", self.function_count)
+        self.function_count += 1
+        params = [identifier("p", number) for number in range(shape.params)]
+        local_names = [identifier("v", number) for number in range(max(shape.locals, 1))]
+        counters = [identifier("n", number) for number in range(shape.nesting)]
+        lines = [f"int {name}({', '.join(f'int {param}' for param in params)}) {{"]
+        for number, local in enumerate(local_names):
+            lines.append(f"    int {local} = {number + 1};")
+        for counter in counters:
+            lines.append(f"    int {counter};")
+        names = params + local_names + self.global_names
+        lines.extend(self.block(names, local_names, counters, 0, "    "))
+        lines.append("}")
+        return "\n".join(lines) + "\n"
+
+    def header(self) -> str:
+        return "".join(f"int {name} = {number + 3};\n" for number, name in enumerate(self.global_names))
+
+    #the globals and shape.functions functions
+    def program(self) -> str:
+        return self.header() + "".join(self.function() for _ in range(self.shape.functions))
+
+    #the globals and as many functions as it takes to reach size bytes
+    def sized(self, size: int) -> str:
+        parts = [self.header()]
+        total = len(parts[0])
+        while total < size:
+            parts.append(self.function())
+            total += len(parts[-1])
+        return "".join(parts)
+
+def generate_program(shape: ProgramShape) -> str:
+    return ProgramGenerator(shape).program()
+
+def generate_sized(size: int, shape: ProgramShape = ProgramShape()) -> str:
+    return ProgramGenerator(shape).sized(size)
+
+#size with an optional KB/MB/GB suffix, in bytes
+def parse_size(text: str) -> int:
+    units = {"KB": 1 << 10, "MB": 1 << 20, "GB": 1 << 30}
+    upper = text.upper()
+    for unit, scale in units.items():
+        if upper.endswith(unit):
+            return int(float(upper[:-len(unit)]) * scale)
+    return int(upper)
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Generate C subset programs")
+    defaults = ProgramShape()
+    for field_name in ("functions", "params", "locals", "statements", "nesting", "depth", "width", "globals", "seed"):
+        arg_parser.add_argument(f"--{field_name}", type=int, default=getattr(defaults, field_name))
+    arg_parser.add_argument("--size", type=parse_size, help="keep adding functions up to SIZE bytes (e.g. 10MB)")
+    arg_parser.add_argument("-o", "--output", help="output file (default: stdout)")
+    args = arg_parser.parse_args()
+
+    shape = ProgramShape(args.functions, args.params, args.locals, args.statements, args.nesting,
+                         args.depth, args.width, args.globals, args.seed)
+    generator = ProgramGenerator(shape)
+    source = generator.sized(args.size) if args.size is not None else generator.program()
+    if args.output is None:
+        sys.stdout.write(source)
+    else:
+        with open(args.output, "w") as file:
+            file.write(source)
+
+if __name__ == "__main__":
+    main()
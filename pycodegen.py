@@ -0,0 +1,176 @@
+import hashlib
+from types import CodeType
+from typing import Optional
+from ir import Op, Kind, Operand, Instr, SYMBOL, BRANCH_SYMBOL, WORD_BITS, wrap
+from cfg import split_regions
+from vm import VMError, TOP_LEVEL, WORD_MIN, WORD_MAX
+
+# Python backend: each function of the TAC becomes a Python function whose
+# variables and temps are locals, so CPython's fast locals hold every value.
+# Straight-line functions are emitted as straight-line code. With jumps,
+# every jump target is a state of a while loop that dispatches on the
+# current state; code that falls through stays inline. The module source is
+# compiled once with compile() and the code object is cached by source hash.
+# Semantics match the VM: 64-bit wrapping arithmetic, C division, variables
+# returned when the function ends, top-level variables as globals.
+
+# compiled module code by sha256 of its source
+CODE_CACHE: dict[str, CodeType] = {}
+
+INDENT = "    "
+
+#C division with the VM's error, used by the generated code
+def divide(left: int, right: int) -> int:
+    if right == 0:
+        raise VMError("Division by zero")
+    quotient = abs(left) // abs(right)
+    return wrap(quotient if (left < 0) == (right < 0) else -quotient)
+
+def shift(op: str, left: int, right: int) -> int:
+    if not 0 <= right < WORD_BITS:
+        raise VMError(f"Shift by {right}")
+    return wrap(left << right) if op == "<<" else left >> right
+
+RUNTIME = {"divide": divide, "shift": shift, "wrap": wrap}
+
+#Python name of a TAC operand, or the literal of an immediate
+def python_name(place: Operand) -> str:
+    match place.kind:
+        case Kind.IMM:
+            return str(place.id)
+        case Kind.TEMP:
+            return f"_{place.name}"
+        case _:
+            return f"v_{place.name}"
+
+def function_name(name: str) -> str:
+    return "top_level" if name == TOP_LEVEL else f"fn_{name}"
+
+#lines of Python for one COPY or binary instruction
+def instruction_lines(instr: Instr) -> list[str]:
+    dst = python_name(instr.dst)
+    a = python_name(instr.a)
+    if instr.op == Op.COPY:
+        return [f"{dst} = {a}"]
+    b = python_name(instr.b)
+    match instr.op:
+        case Op.ADD | Op.SUB | Op.MUL:
+            return [f"{dst} = {a} {SYMBOL[instr.op]} {b}",
+                    f"if not {WORD_MIN} <= {dst} <= {WORD_MAX}: {dst} = wrap({dst})"]
+        case Op.DIV:
+            return [f"{dst} = divide({a}, {b})"]
+        case Op.SHL | Op.SHR:
+            return [f"{dst} = shift({SYMBOL[instr.op]!r}, {a}, {b})"]
+        case Op.EQ:
+            return [f"{dst} = 1 if {a} == {b} else 0"]
+        case _:
+            return [f"{dst} = 1 if {a} {SYMBOL[instr.op]} {b} else 0"]
+
+#Python source of one region of TAC as a function
+def function_source(tac: list, name: str) -> str:
+    params = [python_name(instr.a) for instr in tac if instr.op == Op.PARAMETER]
+    # in order of first appearance, so results list like the VM's
+    places = dict.fromkeys(place for instr in tac for place in (instr.a, instr.b, instr.dst)
+                           if place is not None and place.kind in (Kind.TEMP, Kind.VAR))
+    variables = [place for place in places if place.kind == Kind.VAR]
+    temps = [place for place in places if place.kind == Kind.TEMP]
+    targets = {instr.dst for instr in tac if instr.is_jump}
+    # states: the entry and every jump target, numbered in code order
+    states = {label: number for number, label in
+              enumerate([instr.a for instr in tac if instr.op == Op.BLOCK and instr.a in targets], 1)}
+
+    lines = [f"def {function_name(name)}({', '.join(params + ['globals_'])}):"]
+    for place in variables:
+        if python_name(place) not in params:
+            lines.append(f"{INDENT}{python_name(place)} = globals_.get({place.name!r}, 0)")
+    for place in temps:
+        lines.append(f"{INDENT}{python_name(place)} = 0")
+    result = ", ".join(f"{place.name!r}: {python_name(place)}" for place in variables)
+    returns = f"return {{{result}}}"
+
+    if not states:
+        body = [INDENT]
+    else:
+        lines.append(f"{INDENT}state = 0")
+        lines.append(f"{INDENT}while True:")
+        lines.append(f"{INDENT * 2}if state == 0:")
+        body = [INDENT * 3]
+
+    def emit(line: str):
+        lines.append(body[0] + line)
+
+    def goto(target: Operand):
+        emit(f"state = {states[target]}")
+        emit("continue")
+
+    for instr in tac:
+        op = instr.op
+        if op == Op.LABEL or op == Op.PARAMETER:
+            continue
+        elif op == Op.END:
+            emit(returns)
+        elif op == Op.DECLARE:
+            emit(f"{python_name(instr.a)} = 0")
+        elif op == Op.BLOCK:
+            if instr.a in states:
+                # fall into the next state unless the code before ends in a
+                # jump or return, then open it
+                if lines[-1] != body[0] + "continue" and not lines[-1].startswith(body[0] + "return"):
+                    emit(f"state = {states[instr.a]}")
+                    emit("continue")
+                lines.append(f"{INDENT * 2}if state == {states[instr.a]}:")
+        elif op == Op.JUMP:
+            goto(instr.dst)
+        elif instr.is_branch:
+            emit(f"if {python_name(instr.a)} {BRANCH_SYMBOL[op]} {python_name(instr.b)}:")
+            body[0] += INDENT
+            goto(instr.dst)
+            body[0] = body[0][:-len(INDENT)]
+        else:
+            for line in instruction_lines(instr):
+                emit(line)
+    if tac[-1].op != Op.END:
+        emit(returns)
+    return "\n".join(lines) + "\n"
+
+#Python source of a whole program: one function per region, top-level code
+#gathered into top_level()
+def module_source(tac: list) -> str:
+    functions = []
+    top_level: list[Instr] = []
+    for start, end in split_regions(tac):
+        first = tac[start]
+        if first.op == Op.LABEL:
+            functions.append(function_source(tac[start:end], first.a.name))
+        else:
+            top_level.extend(tac[start:end])
+    functions.append(function_source(top_level, TOP_LEVEL) if top_level
+                     else f"def {function_name(TOP_LEVEL)}(globals_):\n{INDENT}return {{}}\n")
+    return "\n".join(functions)
+
+#code object of source, compiled at most once per process
+def compile_source(source: str) -> CodeType:
+    key = hashlib.sha256(source.encode()).hexdigest()
+    code = CODE_CACHE.get(key)
+    if code is None:
+        code = CODE_CACHE[key] = compile(source, f"<tac {key[:12]}>", "exec")
+    return code
+
+class PythonProgram:
+    def __init__(self, tac: list):
+        self.source = module_source(tac)
+        self.namespace = dict(RUNTIME)
+        exec(compile_source(self.source), self.namespace)
+        self.globals: Optional[dict[str, int]] = None
+
+    #run a function with integer arguments; returns the values of its
+    #variables when it ends, like VM.call
+    def call(self, name: str, *args: int) -> dict[str, int]:
+        if self.globals is None:
+            self.globals = self.namespace[function_name(TOP_LEVEL)]({})
+        function = self.namespace.get(function_name(name))
+        if function is None:
+            raise VMError(f"No function named {name}")
+        if len(args) != function.__code__.co_argcount - 1:
+            raise VMError(f"{name} takes {function.__code__.co_argcount - 1} arguments, got {len(args)}")
+        return function(*args, self.globals)
@@ -0,0 +1,133 @@
+from dataclasses import dataclass
+from typing import Optional
+from ir import Op, Kind, Operand, Instr, uses_of, defined_by
+from cfg import split_regions, build_blocks, liveness
+
+# Linear-scan register allocation (Poletto & Sarkar) for to_assembly. The
+# TAC is split into regions, one per function plus the top-level code
+# between them. Each operand gets one live interval per region, covering
+# every position where liveness over the region's control flow graph finds
+# it live. A value carried around a loop therefore keeps its location for
+# the whole loop. A value live on entry to the region (a global read before
+# it is written) starts at position start - 1, and an exit_live value ends
+# at position end: both are live outside every instruction of the region,
+# so they never share a register with an interval that ends or starts
+# there. Intervals are scanned by start point. A register comes free again
+# once its interval has ended. When none is free, the interval that ends
+# last goes to an rbp-relative stack slot for its whole lifetime.
+
+# allocatable x86-64 general purpose registers. rsp and rbp hold the frame,
+# and the scratch registers load and store spilled operands.
+REGISTERS = ("rax", "rbx", "rcx", "rdx", "rsi", "rdi",
+             "r8", "r9", "r12", "r13", "r14", "r15")
+SCRATCH = ("r10", "r11")
+SLOT_SIZE = 8
+
+@dataclass
+class Interval:
+    place: Operand
+    start: int
+    end: int
+    register: Optional[str] = None
+    slot: Optional[int] = None
+
+    @property
+    def location(self) -> str:
+        return self.register if self.register is not None else f"[rbp-{self.slot}]"
+
+@dataclass
+class AllocStats:
+    name: str
+    intervals: int
+    spills: int
+    max_pressure: int
+    frame_size: int
+
+    def __str__(self):
+        return (f"{self.name}: {self.intervals} intervals, max pressure {self.max_pressure}, "
+                f"{self.spills} spilled ({self.frame_size} byte frame)")
+
+def place_order(place: Operand) -> tuple:
+    return (place.kind.value, place.name)
+
+#live intervals of the temps and variables in tac[start:end], sorted by start;
+#exit_live places are kept live past the end of the region
+def live_intervals(tac: list, start: int, end: int, exit_live=frozenset()) -> list[Interval]:
+    blocks = build_blocks(tac, start, end)
+    live_in, live_out = liveness(tac, blocks, exit_live)
+    intervals: dict[Operand, Interval] = {}
+
+    def extend(place: Operand, index: int):
+        interval = intervals.get(place)
+        if interval is None:
+            intervals[place] = Interval(place, index, index)
+        elif index < interval.start:
+            interval.start = index
+        elif index > interval.end:
+            interval.end = index
+
+    # live sets are walked in name order: intervals that start together keep
+    # that order, and so get the same registers in every process
+    for number, block in enumerate(blocks):
+        entry = start - 1 if number == 0 else block.start
+        for place in sorted(live_in[number], key=place_order):
+            extend(place, entry)
+        # the live-out set of an exit block is exit_live
+        exit = end if not block.successors else block.end - 1
+        for place in sorted(live_out[number], key=place_order):
+            extend(place, exit)
+        for index in range(block.start, block.end):
+            instr = tac[index]
+            for place in uses_of(instr):
+                if place.kind != Kind.IMM:
+                    extend(place, index)
+            target = defined_by(instr)
+            if target is not None:
+                extend(target, index)
+    return sorted(intervals.values(), key=lambda interval: interval.start)
+
+#assign a register or a stack slot to every interval of one region
+def allocate(tac: list, start: int, end: int, registers=REGISTERS,
+             exit_live=frozenset()) -> tuple[dict[Operand, str], AllocStats]:
+    if not registers:
+        raise ValueError("Register allocation needs at least one register")
+    intervals = live_intervals(tac, start, end, exit_live)
+    free = list(reversed(registers))
+    active: list[Interval] = []
+    spilled: list[Interval] = []
+    frame_size = 0
+    max_pressure = 0
+
+    def spill(interval: Interval):
+        nonlocal frame_size
+        frame_size += SLOT_SIZE
+        interval.register = None
+        interval.slot = frame_size
+        spilled.append(interval)
+
+    for current in intervals:
+        # operands read by the instruction that starts current are done with
+        # their registers by the time it writes its result
+        for interval in [interval for interval in active if interval.end <= current.start]:
+            active.remove(interval)
+            free.append(interval.register)
+        live_spills = sum(1 for interval in spilled if interval.end > current.start)
+        max_pressure = max(max_pressure, len(active) + live_spills + 1)
+
+        if free:
+            current.register = free.pop()
+        else:
+            victim = max(active, key=lambda interval: interval.end)
+            if victim.end > current.end:
+                current.register = victim.register
+                active.remove(victim)
+                spill(victim)
+            else:
+                spill(current)
+                continue
+        active.append(current)
+
+    first = tac[start] if start < end else None
+    name = str(first.a) if first is not None and first.op == Op.LABEL else "<top level>"
+    locations = {interval.place: interval.location for interval in intervals}
+    return locations, AllocStats(name, len(intervals), len(spilled), max_pressure, frame_size)
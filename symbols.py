@@ -0,0 +1,76 @@
+from dataclasses import dataclass
+from enum import Enum, auto
+from typing import Optional
+
+# Interned identifiers and the scoped symbol table. The lexer interns every
+# identifier to an integer symbol id once; tokens carry the id and the
+# shared name string, and the IR builds its operands from the same ids, so
+# later stages compare and hash ints instead of lexemes. Ids are only valid
+# in the process that interned them: anything pickled carries names and is
+# interned again when loaded.
+
+# interned names: id -> name and name -> id, shared by the whole process
+NAMES: list[str] = []
+NAME_IDS: dict[str, int] = {}
+
+def intern_name(name: str) -> int:
+    name_id = NAME_IDS.get(name)
+    if name_id is None:
+        name_id = len(NAMES)
+        NAMES.append(name)
+        NAME_IDS[name] = name_id
+    return name_id
+
+class SymbolKind(Enum):
+    VARIABLE = auto()
+    PARAMETER = auto()
+    FUNCTION = auto()
+
+@dataclass
+class Symbol:
+    name_id: int
+    kind: SymbolKind
+    line: int
+    # scope depth of the declaration, 0 for the globals
+    depth: int
+
+    @property
+    def name(self) -> str:
+        return NAMES[self.name_id]
+
+class SymbolTable:
+    # Nested scopes over one flat map from symbol id to the declaration
+    # currently visible, so a lookup is one dict access whatever the depth.
+    # Each scope remembers the bindings it replaced and puts them back when
+    # it is popped.
+
+    def __init__(self):
+        self.visible: dict[int, Symbol] = {}
+        self.scopes: list[list[tuple[int, Optional[Symbol]]]] = [[]]
+        self.declared = 0
+
+    @property
+    def depth(self) -> int:
+        return len(self.scopes) - 1
+
+    def push(self):
+        self.scopes.append([])
+
+    def pop(self):
+        for name_id, previous in reversed(self.scopes.pop()):
+            if previous is None:
+                del self.visible[name_id]
+            else:
+                self.visible[name_id] = previous
+
+    def lookup(self, name_id: int) -> Optional[Symbol]:
+        return self.visible.get(name_id)
+
+    #bind name_id in the innermost scope; the caller checks for conflicts
+    #with lookup first
+    def declare(self, name_id: int, kind: SymbolKind, line: int) -> Symbol:
+        symbol = Symbol(name_id, kind, line, self.depth)
+        self.scopes[-1].append((name_id, self.visible.get(name_id)))
+        self.visible[name_id] = symbol
+        self.declared += 1
+        return symbol
@@ -0,0 +1,68 @@
+import dataclasses
+import os
+import sys
+
+# the compiler is a set of top-level modules, not a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lexer import Token
+from parser import Parser
+
+SAMPLE = """int a = 5;
+int add(int x, int y) {
+  int z = x + y * 2;
+  z = z - (1 + x) / 2;
+  int w;
+  w = z * 4;
+}
+int total(int n, int k) {
+  int i = 0;
+  int s = 0;
+  while (i < n) {
+    int step = k * 4 + a;
+    if (i == 3) {
+      i = i + 1;
+      continue;
+    } else if (s > 100) {
+      break;
+    } else {
+      s = s + step;
+    }
+    i = i + 1;
+  }
+  if (s) { s = s - 1; }
+}
+int main() {
+  int q = 2 * 3 + a;
+  q = q >= 4;
+}
+"""
+
+def compile_tac(source: str, level: int = 0) -> list:
+    parser = Parser(source)
+    parser.parse()
+    parser.generate()
+    if level > 0:
+        parser.optimize(level)
+    return parser.tac
+
+def tac_text(tac) -> list[str]:
+    return [str(instr) for instr in tac]
+
+#(lexeme, line) of every token in an AST, in field order
+def token_lines(node) -> list:
+    found = []
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, Token):
+            found.append((node.lexeme, node.line))
+        elif isinstance(node, list):
+            stack.extend(reversed(node))
+        elif dataclasses.is_dataclass(node):
+            stack.extend(reversed([getattr(node, field.name) for field in dataclasses.fields(node)]))
+    return found
+
+#a function whose body is one expression of count chained terms
+def chain_source(count: int) -> str:
+    return "int f(int a) { int b = " + " - ".join(["a"] * count) + "; }\n"
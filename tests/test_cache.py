@@ -0,0 +1,69 @@
+import os
+import pytest
+from conftest import SAMPLE, chain_source, compile_tac, tac_text, token_lines
+from cache import CompileCache, flatten_ast, unflatten_ast
+from incremental import compile_source
+from parser import Parser
+
+@pytest.fixture
+def cache(tmp_path):
+    return CompileCache(str(tmp_path / "cache"))
+
+def parsed(source: str):
+    parser = Parser(source)
+    parser.parse()
+    return parser.root
+
+def test_flat_ast_round_trip():
+    root = parsed(SAMPLE)
+    assert str(unflatten_ast(flatten_ast(root))) == str(root)
+    assert token_lines(unflatten_ast(flatten_ast(root))) == token_lines(root)
+
+def comparable(value):
+    if isinstance(value, list):
+        return tac_text(value)
+    if hasattr(value, "lines"):
+        return [(value[index].token_type, value[index].lexeme, value[index].line) for index in range(len(value))]
+    return str(value)
+
+@pytest.mark.parametrize("stage", ["tokens", "ast", "tac", "asm"])
+def test_hit_matches_miss(cache, stage):
+    first = comparable(cache.compile(SAMPLE, stage))
+    second = comparable(cache.compile(SAMPLE, stage))
+    assert cache.hits >= 1
+    assert second == first
+
+def test_deep_chain_is_cached(cache):
+    source = chain_source(2000)
+    expected = tac_text(compile_tac(source))
+    for _ in range(2):
+        assert tac_text(cache.compile(source, "tac")) == expected
+        assert type(cache.compile(source, "ast")).__name__ == "Program"
+        assert tac_text(cache.compile_items(source)[1]) == expected
+
+def test_items_match_incremental_compile(cache):
+    # temps and labels are numbered per item, as in incremental
+    expected = tac_text(compile_source(SAMPLE).tac)
+    for _ in range(2):
+        program, tac = cache.compile_items(SAMPLE)
+        assert tac_text(tac) == expected
+        assert str(program) == str(parsed(SAMPLE))
+
+def test_moved_item_gets_its_new_lines(cache):
+    cache.compile_items(SAMPLE)
+    moved = "\n\n" + SAMPLE
+    program, _ = cache.compile_items(moved)
+    assert token_lines(program) == token_lines(parsed(moved))
+
+def test_items_are_resolved_on_hits(cache):
+    cache.compile_items("int g = 1;\nint f(int a) { a = g; }\n")
+    # the function item is unchanged and cached, but g is gone
+    with pytest.raises(SystemExit, match="Use of undeclared g on line 2"):
+        cache.compile_items("int h = 1;\nint f(int a) { a = g; }\n")
+
+def test_rejected_items_are_not_stored(cache):
+    with pytest.raises(SystemExit, match="Use of undeclared zz"):
+        cache.compile_items("int f(int a) { a = zz; }\n")
+    assert not any(name.endswith(".item") for name in os.listdir(cache.directory))
+    with pytest.raises(SystemExit, match="Redeclaration of a"):
+        cache.compile_items("int a;\nint a;\n")
@@ -0,0 +1,75 @@
+import os
+import tempfile
+import threading
+import pytest
+from conftest import SAMPLE
+from daemon import CompileDaemon, compile_artifacts, handle_compile, request_key
+import client
+
+def test_artifacts_match_main(tmp_path):
+    import main
+    source_path = tmp_path / "sample.c"
+    source_path.write_text(SAMPLE)
+    stages = ["tokens", "ast", "tac", "py", "x86", "asm"]
+    assert main.run_batch([str(source_path), "-O", "2", "--out-dir", str(tmp_path),
+                           *(flag for stage in stages for flag in ("--emit", stage))]) == 0
+    artifacts = compile_artifacts(SAMPLE, stages, level=2)
+    for stage in stages:
+        assert artifacts[stage] == (tmp_path / ("sample" + client.SUFFIX[stage])).read_text(), stage
+
+def test_only_requested_stages_come_back():
+    assert set(compile_artifacts(SAMPLE, ["tac"])) == {"tac"}
+    assert compile_artifacts(SAMPLE, []) == {}
+
+@pytest.mark.parametrize("request_", [
+    {"source": 5},
+    {"source": SAMPLE, "emit": 7},
+    {"source": SAMPLE, "emit": ["nothing"]},
+    {"source": SAMPLE, "registers": 0},
+    {"emit": ["asm"]},
+    {"source": "int f(int a) { a = zz; }", "emit": ["asm"]},
+])
+def test_bad_requests_are_errors(request_):
+    response = handle_compile(request_)
+    assert response["ok"] is False and response["error"]
+    request_key(request_)
+
+def test_compiler_bugs_are_errors(monkeypatch):
+    import daemon
+
+    def broken(*args, **kwargs):
+        raise RuntimeError("compiler bug")
+    monkeypatch.setattr(daemon, "compile_artifacts", broken)
+    assert handle_compile({"source": SAMPLE}) == {"ok": False, "error": "RuntimeError: compiler bug"}
+
+@pytest.fixture
+def server():
+    # Unix socket paths are short, so not under tmp_path
+    directory = tempfile.mkdtemp(prefix="cc-", dir="/tmp")
+    path = os.path.join(directory, "d.sock")
+    daemon = CompileDaemon(path, workers=1, tasks_per_worker=2)
+    thread = threading.Thread(target=daemon.serve_forever)
+    thread.start()
+    yield daemon
+    daemon.shutdown()
+    thread.join()
+    daemon.server_close()
+    os.rmdir(directory)
+
+def test_daemon_round_trip(server):
+    with client.connect(server.path) as sock:
+        for response in (client.request(sock, [1, 2]), client.request(sock, "compile")):
+            assert response == {"ok": False, "error": "Malformed request: expected a JSON object"}
+        # more compiles than a worker serves, so workers are replaced
+        expected = compile_artifacts(SAMPLE, ["asm"])
+        for level in range(3):
+            response = client.request(sock, {"command": "compile", "source": SAMPLE, "emit": ["asm"]})
+            assert response == {"ok": True, "artifacts": expected}
+            response = client.request(sock, {"command": "compile", "source": SAMPLE + " " * level,
+                                             "emit": ["tac"], "level": level})
+            assert response["ok"]
+        bad = {"command": "compile", "source": 5}
+        assert client.request(sock, bad)["ok"] is False
+        stats = client.request(sock, {"command": "stats"})["stats"]
+        assert stats["hits"] == 2 and stats["misses"] == 5
+        assert client.request(sock, {"command": "nothing"})["ok"] is False
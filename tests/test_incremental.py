@@ -0,0 +1,61 @@
+import random
+import pytest
+from conftest import SAMPLE, compile_tac, tac_text, token_lines
+from incremental import compile_source, recompile
+from parser import Parser
+
+def test_compile_source_matches_parser():
+    parser = Parser(SAMPLE)
+    parser.parse()
+    result = compile_source(SAMPLE)
+    assert str(result.program) == str(parser.root)
+    assert token_lines(result.program) == token_lines(parser.root)
+    # temps and labels restart in every item, so only the TAC size agrees
+    assert len(result.tac) == len(compile_tac(SAMPLE))
+
+def test_edits_match_a_full_compile():
+    rng = random.Random(5)
+    result = compile_source(SAMPLE)
+    for _ in range(40):
+        # blanks inserted between tokens, which move items and lines
+        spots = [index + 1 for index, char in enumerate(result.source) if char in ";{}\n"]
+        at = rng.choice(spots)
+        result = recompile(result, at, at, rng.choice(["\n", " ", "\n\n  "]))
+        full = compile_source(result.source)
+        # reused items keep their old token lines, so only the code is compared
+        assert tac_text(result.tac) == tac_text(full.tac)
+        assert str(result.program) == str(full.program)
+
+def test_edit_inside_a_function_reparses_one_item():
+    result = compile_source(SAMPLE)
+    at = SAMPLE.index("w = z * 4")
+    edited = recompile(result, at + 4, at + 5, "x")
+    assert edited.reparsed == 1
+    assert tac_text(edited.tac) == tac_text(compile_source(edited.source).tac)
+
+SOURCE = "int g = 1;\nint f(int a) { a = g; }\nint k(int b) { b = 3; }\n"
+
+@pytest.mark.parametrize("find, replace, message", [
+    ("= g;", "= zz;", "Use of undeclared zz on line 2"),
+    # the edit removes a global a later, unchanged item uses
+    ("int g", "int h", "Use of undeclared g"),
+    ("int k", "int f", "Redeclaration of f on line 3"),
+    ("b = 3", "b = f", "Function f used as a variable"),
+])
+def test_edits_are_resolved(find, replace, message):
+    result = compile_source(SOURCE)
+    at = SOURCE.index(find)
+    with pytest.raises(SystemExit, match=message):
+        recompile(result, at, at + len(find), replace)
+
+def test_full_compile_is_resolved():
+    with pytest.raises(SystemExit, match="Use of undeclared zz"):
+        compile_source("int f(int a) { a = zz; }")
+    with pytest.raises(SystemExit, match="Redeclaration of a"):
+        compile_source("int a;\nint a;\n")
+
+def test_valid_rename_is_accepted():
+    result = compile_source(SOURCE)
+    at = SOURCE.index("int k")
+    edited = recompile(result, at + 4, at + 5, "q")
+    assert tac_text(edited.tac) == tac_text(compile_source(edited.source).tac)
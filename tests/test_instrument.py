@@ -0,0 +1,75 @@
+import tracemalloc
+import pytest
+from conftest import SAMPLE
+from instrument import Instrumentation
+from parser import Parser
+import pycodegen
+
+def test_memory_is_off_by_default():
+    instrument = Instrumentation()
+    with instrument.stage("work", lambda: {"items": 3}):
+        assert not tracemalloc.is_tracing()
+    record, = instrument.records
+    assert record.peak_bytes is None and record.traced is False
+    assert record.counts == {"items": 3}
+
+def test_memory_stage_traces_and_stops():
+    instrument = Instrumentation(memory=True)
+    with instrument.stage("work"):
+        data = [0] * 100000
+    del data
+    record, = instrument.records
+    assert record.traced is True
+    assert record.peak_bytes >= 100000 * 8
+    assert not tracemalloc.is_tracing()
+
+def test_caller_session_keeps_its_peak():
+    instrument = Instrumentation(memory=True)
+    tracemalloc.start()
+    try:
+        data = [0] * 1000000
+        del data
+        peak = tracemalloc.get_traced_memory()[1]
+        with instrument.stage("small"):
+            small = [0] * 1000
+        with instrument.stage("large"):
+            large = [0] * 3000000
+        del small, large
+        assert tracemalloc.get_traced_memory()[1] >= peak
+        assert tracemalloc.is_tracing()
+    finally:
+        tracemalloc.stop()
+    small_record, large_record = instrument.records
+    # under the session's peak the stage's own peak is unknown
+    assert small_record.peak_bytes is None
+    assert large_record.peak_bytes >= 3000000 * 8
+
+def test_counts_are_skipped_when_a_stage_fails():
+    instrument = Instrumentation()
+
+    def counts():
+        raise AssertionError("counts of a failed stage")
+    with pytest.raises(RuntimeError, match="stage failed"):
+        with instrument.stage("work", counts):
+            raise RuntimeError("stage failed")
+    assert instrument.records[0].counts == {}
+
+def test_failing_codegen_keeps_its_error(monkeypatch):
+    parser = Parser(SAMPLE, instrument=Instrumentation())
+    parser.parse()
+    parser.generate()
+
+    def broken(tac):
+        raise RuntimeError("codegen bug")
+    monkeypatch.setattr(pycodegen, "module_source", broken)
+    with pytest.raises(RuntimeError, match="codegen bug"):
+        parser.to_python()
+
+def test_parser_stages_are_recorded():
+    instrument = Instrumentation()
+    parser = Parser(SAMPLE, instrument=instrument)
+    parser.parse()
+    parser.generate()
+    parser.optimize(2)
+    assert [record.name for record in instrument.records] == ["lex", "parse_program", "resolve", "eval_ir", "optimize"]
+    assert instrument.records[0].counts["tokens"] > 0
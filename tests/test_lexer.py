@@ -0,0 +1,79 @@
+import io
+import pytest
+from conftest import SAMPLE
+from lexer import Lexer, TableLexer, ArrayLexer, StreamLexer, MappedLexer, TokenType
+
+SOURCES = [
+    SAMPLE,
+    "int a;a=1+2;// x; y {  \n  b=a<=2; //z\n\n c = a  +  +b;// tail",
+    "x += 1; y -= 2; z = a >> 1 << 2; w == v;",
+    "int é = 3;\né = é + 1;\n",
+    "int 一 = 2;",
+    "",
+]
+
+def tokens_of(lexer) -> list:
+    lexer.scan_tokens()
+    tokens = lexer.tokens
+    return [(tokens[index].token_type, tokens[index].lexeme, tokens[index].line) for index in range(len(tokens))]
+
+def exit_or_tokens(make):
+    try:
+        return tokens_of(make())
+    except SystemExit as error:
+        return error.code
+
+@pytest.mark.parametrize("source", SOURCES)
+def test_table_lexers_match_lexer(source):
+    expected = tokens_of(Lexer(source))
+    assert tokens_of(TableLexer(source)) == expected
+    assert tokens_of(ArrayLexer(source)) == expected
+
+@pytest.mark.parametrize("source", SOURCES)
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, 64])
+def test_stream_lexer_matches_for_any_chunk_size(source, chunk_size):
+    assert tokens_of(StreamLexer(io.StringIO(source), chunk_size)) == tokens_of(TableLexer(source))
+
+def test_mapped_lexer_matches_on_ascii():
+    source = SOURCES[1]
+    expected = [(token_type, str(lexeme), line) for token_type, lexeme, line in tokens_of(ArrayLexer(source))]
+    mapped = [(token_type, str(lexeme), line) for token_type, lexeme, line in tokens_of(MappedLexer(source.encode()))]
+    assert mapped == expected
+
+@pytest.mark.parametrize("source, character", [("int x½ = 1;", "½"), ("int Ⅻ;", "Ⅻ"), ("a\n½", "½")])
+def test_numeric_characters_are_not_letters(source, character):
+    expected = f"Invalid Token: {character}"
+    assert exit_or_tokens(lambda: Lexer(source)) == expected
+    assert exit_or_tokens(lambda: TableLexer(source)) == expected
+    assert exit_or_tokens(lambda: ArrayLexer(source)) == expected
+    assert exit_or_tokens(lambda: StreamLexer(io.StringIO(source), 4)) == expected
+
+def test_superscript_digit_is_rejected():
+    for make in (TableLexer, ArrayLexer):
+        assert exit_or_tokens(lambda: make("x = y²;")) == "Invalid Token: ²"
+
+class CountingReader(io.StringIO):
+    def __init__(self, text):
+        super().__init__(text)
+        self.chars_read = 0
+
+    def read(self, size=-1):
+        chunk = super().read(size)
+        self.chars_read += len(chunk)
+        return chunk
+
+def test_stream_lexer_flushes_without_newlines():
+    source = "int a = 1; " + "a = a + 1; " * 20000
+    reader = CountingReader(source)
+    stream = StreamLexer(reader, 256).iter_stream()
+    # the first token comes out after a chunk or two, not after the whole input
+    first = next(stream)
+    assert first.token_type == TokenType.INT
+    assert reader.chars_read <= 512
+    tokens = [first, *stream]
+    assert [(token.token_type, token.lexeme) for token in tokens] == \
+        [(token_type, lexeme) for token_type, lexeme, _ in tokens_of(TableLexer(source))]
+
+def test_stream_lexer_keeps_open_comment_whole():
+    source = "a = 1; // one; two { three } four\nb = 2;"
+    assert tokens_of(StreamLexer(io.StringIO(source), 5)) == tokens_of(TableLexer(source))
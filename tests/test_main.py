@@ -0,0 +1,77 @@
+import json
+import pytest
+from conftest import SAMPLE
+import lexer
+import main
+
+STAGES = ["tokens", "ast", "tac", "asm"]
+
+def emit_flags(stages) -> list:
+    return [flag for stage in stages for flag in ("--emit", stage)]
+
+@pytest.fixture
+def sample(tmp_path):
+    path = tmp_path / "sample.c"
+    path.write_text(SAMPLE)
+    return path
+
+def outputs(directory) -> dict:
+    return {path.name: path.read_text() for path in sorted(directory.iterdir())}
+
+def test_mmap_matches_text_and_closes_the_map(sample, tmp_path, monkeypatch):
+    opened = []
+
+    def map_file(path):
+        mapped = lexer.map_file(path)
+        opened.append(mapped)
+        return mapped
+    monkeypatch.setattr(main, "map_file", map_file)
+    (tmp_path / "text").mkdir()
+    (tmp_path / "mapped").mkdir()
+    assert main.run_batch([str(sample), "-O", "2", "--out-dir", str(tmp_path / "text"), *emit_flags(STAGES)]) == 0
+    assert main.run_batch([str(sample), "-O", "2", "--mmap", "--out-dir", str(tmp_path / "mapped"),
+                           *emit_flags(STAGES)]) == 0
+    assert outputs(tmp_path / "mapped") == outputs(tmp_path / "text")
+    assert len(opened) == 1 and opened[0].closed
+
+def test_mmap_is_closed_after_an_error(tmp_path, monkeypatch):
+    opened = []
+
+    def map_file(path):
+        mapped = lexer.map_file(path)
+        opened.append(mapped)
+        return mapped
+    monkeypatch.setattr(main, "map_file", map_file)
+    bad = tmp_path / "bad.c"
+    bad.write_text("int f(int a) { a = zz; }\n")
+    with pytest.raises(SystemExit):
+        main.run_batch([str(bad), "--mmap"])
+    assert opened[0].closed
+
+def test_jobs_match_serial(sample, tmp_path):
+    (tmp_path / "serial").mkdir()
+    (tmp_path / "jobs").mkdir()
+    assert main.run_batch([str(sample), "-O", "2", "--out-dir", str(tmp_path / "serial"),
+                           "--emit", "tac"]) == 0
+    assert main.run_batch([str(sample), "-O", "2", "--jobs", "2", "--out-dir", str(tmp_path / "jobs"),
+                           "--emit", "tac"]) == 0
+    # units number their temps and labels from zero, so only sizes agree
+    serial = (tmp_path / "serial" / "sample.tac").read_text().splitlines()
+    assert len((tmp_path / "jobs" / "sample.tac").read_text().splitlines()) == len(serial)
+
+def test_run_prints_variables(sample, tmp_path, capsys):
+    assert main.run_batch([str(sample), "--run", "total", "--args", "5", "2", "--out-dir", str(tmp_path)]) == 0
+    assert "s = " in capsys.readouterr().out
+
+def test_instrument_times_without_tracing(sample, tmp_path):
+    log = tmp_path / "stages.jsonl"
+    assert main.run_batch([str(sample), "--instrument", str(log), "--out-dir", str(tmp_path)]) == 0
+    assert main.run_batch([str(sample), "--instrument", str(log), "--memory", "--out-dir", str(tmp_path)]) == 0
+    plain, traced = [json.loads(line) for line in log.read_text().splitlines()]
+    assert not any(stage["traced"] or stage["peak_bytes"] is not None for stage in plain["stages"])
+    assert all(stage["traced"] and stage["peak_bytes"] is not None for stage in traced["stages"])
+
+def test_memory_needs_instrument(sample):
+    with pytest.raises(SystemExit) as error:
+        main.run_batch([str(sample), "--memory"])
+    assert error.value.code == 2
@@ -0,0 +1,44 @@
+import pytest
+from conftest import SAMPLE, compile_tac
+from cfg import split_regions
+from ir import Op
+from progen import ProgramShape, generate_program
+from pycodegen import PythonProgram
+from vm import VM
+import x86
+
+#(function, arguments, result variable) of every function of tac that has one
+def calls(tac) -> list:
+    found = []
+    for start, end in split_regions(tac):
+        if tac[start].op != Op.LABEL:
+            continue
+        result = x86.default_result(tac[start:end])
+        if result is not None:
+            count = sum(1 for instr in tac[start:end] if instr.op == Op.PARAMETER)
+            found.append((tac[start].a.name, tuple(range(3, 3 + count)), result))
+    return found
+
+def results(tac, backend=VM) -> dict:
+    machine = backend(tac)
+    values = {}
+    for name, args, result in calls(tac):
+        called = machine.call(name, *args)
+        values[name] = (called[0] if backend is VM else called)[result]
+    return values
+
+@pytest.mark.parametrize("seed", range(6))
+def test_levels_agree(seed):
+    source = generate_program(ProgramShape(functions=4, seed=seed))
+    expected = results(compile_tac(source))
+    assert expected
+    for level in (1, 2):
+        assert results(compile_tac(source, level)) == expected
+
+def test_optimization_shrinks_sample():
+    assert len(compile_tac(SAMPLE, 2)) < len(compile_tac(SAMPLE))
+
+@pytest.mark.parametrize("level", [0, 2])
+def test_python_backend_agrees_with_vm(level):
+    tac = compile_tac(generate_program(ProgramShape(functions=4, seed=7)), level)
+    assert results(tac, PythonProgram) == results(tac)
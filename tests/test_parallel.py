@@ -0,0 +1,37 @@
+import pytest
+from conftest import SAMPLE
+from parallel import compile_parallel, make_chunks, split_items
+from pipeline import merged_assembly, merged_tac
+from progen import ProgramShape, generate_sized
+
+def test_items_cover_the_source():
+    items = split_items(SAMPLE)
+    assert items[0][0] == 0 and items[-1][1] == len(SAMPLE.rstrip())
+    assert all(previous[1] == following[0] for previous, following in zip(items, items[1:]))
+    # an item starts where the one before it ended, so its line is the line
+    # of that end
+    assert [line for _, _, line, _ in items] == [1, 1, 7, 24]
+    assert [is_function for *_, is_function in items] == [False, True, True, True]
+
+def test_chunks_end_at_item_boundaries():
+    source = generate_sized(20000, ProgramShape(seed=2))
+    ends = {end for _, end, _, _ in split_items(source)} | {len(source)}
+    chunks = make_chunks(source, 6)
+    assert chunks[0][0] == 0 and chunks[-1][1] == len(source)
+    assert all(end in ends for _, end, _ in chunks)
+
+@pytest.mark.parametrize("level", [0, 2])
+def test_output_does_not_depend_on_chunking(level):
+    source = generate_sized(20000, ProgramShape(seed=3))
+    whole = compile_parallel(source, 1, level, chunks_per_worker=1)
+    split = compile_parallel(source, 1, level, chunks_per_worker=8)
+    assert merged_assembly(split) == merged_assembly(whole)
+    assert [str(instr) for instr in merged_tac(split)] == [str(instr) for instr in merged_tac(whole)]
+
+@pytest.mark.parametrize("source, message", [
+    ("int f(int a) { a = zz; }\nint g(int b) { b = 1; }\n", "Use of undeclared zz"),
+    ("int f(int a) { a = 1; }\nint f(int b) { b = 1; }\n", "Redeclaration of f"),
+])
+def test_workers_check_scopes_across_chunks(source, message):
+    with pytest.raises(SystemExit, match=message):
+        compile_parallel(source, 1, chunks_per_worker=8)
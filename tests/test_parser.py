@@ -0,0 +1,47 @@
+import pytest
+from conftest import SAMPLE, chain_source, compile_tac, tac_text
+from parser import Parser
+from symbols import NAMES
+
+def parse_error(source: str) -> str:
+    parser = Parser(source)
+    with pytest.raises(SystemExit) as error:
+        parser.parse()
+        parser.generate()
+    return error.value.code
+
+def test_sample_compiles():
+    assert compile_tac(SAMPLE)
+
+@pytest.mark.parametrize("source", [
+    "int f(int a) { a = 1 = 2; }",
+    "int f(int a) { a = (a + 1) = 2; }",
+])
+def test_assignment_needs_a_variable(source):
+    assert parse_error(source).startswith("Left-hand side of assignment must be a variable")
+    assert all(isinstance(name, str) for name in NAMES)
+
+def test_lowering_checks_assignment_target_without_resolve():
+    # parallel and incremental lower items the caller resolved itself
+    parser = Parser("int f(int a) { a = 1 = 2; }")
+    parser.scan_tokens()
+    parser.root = parser.parse_program()
+    with pytest.raises(SystemExit, match="Left-hand side of assignment must be a variable"):
+        parser.generate()
+
+def test_chained_assignment():
+    assert tac_text(compile_tac("int f(int a) { int b; a = b = 2; }")) == \
+        ["LABEL f", "PARAMETER a", "DECLARE b", "b = 2", "a = b", "END f"]
+
+@pytest.mark.parametrize("source, message", [
+    ("int f(int a) { a = zz; }", "Use of undeclared zz on line 1"),
+    ("int a;\nint a;\n", "Redeclaration of a on line 2, first declared on line 1"),
+    ("int f(int a) { int b; int b; }", "Redeclaration of b"),
+    ("int g;\nint f(int a) { g = f; }", "Function f used as a variable"),
+])
+def test_scope_errors(source, message):
+    assert parse_error(source).startswith(message)
+
+def test_deep_expression_chain():
+    tac = compile_tac(chain_source(50000))
+    assert len(tac) > 50000
@@ -0,0 +1,89 @@
+import io
+import os
+import shutil
+import subprocess
+import pytest
+from conftest import SAMPLE, compile_tac
+from test_optimizer import calls
+from cfg import split_regions
+from ir import Op, Kind
+from parser import Parser
+from progen import ProgramShape, generate_program
+from regalloc import REGISTERS, allocate, live_intervals
+from vm import VM
+import x86
+
+needs_toolchain = pytest.mark.skipif(not (shutil.which("as") and shutil.which("ld")),
+                                     reason="needs the GNU assembler and linker")
+
+def exit_live(tac, start, end) -> frozenset:
+    if tac[start].op == Op.LABEL:
+        return frozenset()
+    return frozenset(place for instr in tac[start:end] for place in (instr.dst, instr.a, instr.b)
+                     if place is not None and place.kind == Kind.VAR)
+
+@pytest.mark.parametrize("count", [len(REGISTERS), 3, 1])
+@pytest.mark.parametrize("seed", range(4))
+def test_live_intervals_never_share_a_register(seed, count):
+    tac = compile_tac(generate_program(ProgramShape(functions=3, seed=seed)), 2)
+    for start, end in split_regions(tac):
+        live = exit_live(tac, start, end)
+        locations, _ = allocate(tac, start, end, REGISTERS[:count], live)
+        intervals = live_intervals(tac, start, end, live)
+        for number, first in enumerate(intervals):
+            for second in intervals[number + 1:]:
+                if locations[first.place] != locations[second.place]:
+                    continue
+                # a location is only reused once the interval holding it ended
+                assert first.end <= second.start or second.end <= first.start, (first, second)
+
+def test_globals_live_on_entry_and_exit():
+    tac = compile_tac("int ga = 3;\nint gb = 4;\nint f(int p) { int v; v = ga + gb; }\n")
+    regions = list(split_regions(tac))
+    top_start, top_end = regions[0]
+    intervals = {interval.place.name: interval
+                 for interval in live_intervals(tac, top_start, top_end, exit_live(tac, top_start, top_end))}
+    assert intervals["ga"].end == top_end and intervals["gb"].end == top_end
+    start, end = regions[1]
+    intervals = {interval.place.name: interval for interval in live_intervals(tac, start, end)}
+    assert intervals["ga"].start == start - 1 and intervals["gb"].start == start - 1
+
+def test_pseudo_assembly_loads_and_stores_globals():
+    parser = Parser("int ga = 3;\nint f(int p) { int v; v = ga + p; }\n")
+    parser.parse()
+    parser.generate()
+    out = io.StringIO()
+    parser.to_assembly(out, header=False)
+    assembly = out.getvalue()
+    assert "[ga]" in assembly.split("f:")[0]
+    assert "[ga]" in assembly.split("f:")[1]
+
+def run_native(tac, name, result, args, registers, directory) -> int:
+    source, _ = x86.program_source(tac, registers, {name: result}, name, args)
+    binary = os.path.join(directory, "check")
+    x86.link(source, binary)
+    return int(subprocess.run([binary], capture_output=True, text=True, check=True).stdout)
+
+@needs_toolchain
+def test_global_read_in_function_natively(tmp_path):
+    tac = compile_tac("int ga = 3;\nint gb = 4;\nint f(int p) { int v; v = ga + gb; }\n")
+    assert run_native(tac, "f", "v", (1,), REGISTERS, str(tmp_path)) == 7
+
+@needs_toolchain
+@pytest.mark.parametrize("level", [0, 2])
+@pytest.mark.parametrize("seed", range(3))
+def test_native_agrees_with_vm(seed, level, tmp_path):
+    tac = compile_tac(generate_program(ProgramShape(functions=3, seed=seed)), level)
+    machine = VM(tac)
+    for name, args, result in calls(tac):
+        expected = machine.call(name, *args)[0][result]
+        for count in (len(REGISTERS), 3):
+            assert run_native(tac, name, result, args, REGISTERS[:count], str(tmp_path)) == expected
+
+@needs_toolchain
+def test_sample_natively(tmp_path):
+    tac = compile_tac(SAMPLE, 2)
+    machine = VM(tac)
+    for name, args, result in calls(tac):
+        assert run_native(tac, name, result, args, REGISTERS[:3], str(tmp_path)) == \
+            machine.call(name, *args)[0][result]
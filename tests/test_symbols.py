@@ -0,0 +1,21 @@
+from symbols import NAMES, SymbolKind, SymbolTable, intern_name
+
+def test_intern_is_stable():
+    first = intern_name("interned_once")
+    assert intern_name("interned_once") == first
+    assert NAMES[first] == "interned_once"
+
+def test_scopes_restore_hidden_bindings():
+    table = SymbolTable()
+    name = intern_name("shadowed")
+    outer = table.declare(name, SymbolKind.VARIABLE, 1)
+    table.push()
+    inner = table.declare(name, SymbolKind.PARAMETER, 2)
+    assert table.lookup(name) is inner and inner.depth == 1
+    table.pop()
+    assert table.lookup(name) is outer
+    table.push()
+    table.declare(intern_name("local_only"), SymbolKind.VARIABLE, 3)
+    table.pop()
+    assert table.lookup(intern_name("local_only")) is None
+    assert table.declared == 3
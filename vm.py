@@ -0,0 +1,213 @@
+import time
+from dataclasses import dataclass, field
+from typing import Optional
+from ir import Op, Kind, Operand, Instr, WORD_BITS, imm, wrap
+from cfg import split_regions
+
+# Bytecode virtual machine for the TAC of Parser.generate(). Each function is
+# encoded as a flat tuple of ints, four per instruction (opcode, dst, a, b),
+# with every operand resolved to an index into the frame's slot list and
+# immediates preloaded into their own slots. Labels become instruction
+# offsets, so the dispatch loop never looks up a name. Top-level code runs
+# once as its own function; its variables are the globals every function
+# frame starts from.
+
+TOP_LEVEL = "<top level>"
+WIDTH = 4
+WORD_MIN = -(1 << (WORD_BITS - 1))
+WORD_MAX = (1 << (WORD_BITS - 1)) - 1
+
+class VMError(Exception):
+    pass
+
+@dataclass
+class BytecodeFunction:
+    name: str
+    code: tuple
+    # slot layout: names of variable slots, parameter slots in order, and the
+    # initial value of every slot (immediates filled in, the rest 0)
+    variables: dict[str, int]
+    params: list[int]
+    template: list[int]
+
+    @property
+    def size(self) -> int:
+        return len(self.code) // WIDTH
+
+@dataclass
+class ExecStats:
+    name: str
+    instructions: int
+    seconds: float
+    counts: dict[str, int] = field(default_factory=dict)
+
+    def __str__(self):
+        mix = ", ".join(f"{name} {count}" for name, count in sorted(self.counts.items(), key=lambda item: -item[1]))
+        return f"{self.name}: {self.instructions} instructions in {self.seconds * 1000:.3f} ms ({mix})"
+
+#encode one region of TAC (LABEL..END, or top-level code) as a BytecodeFunction
+def encode(tac: list, name: str) -> BytecodeFunction:
+    slots: dict[Operand, int] = {}
+    template: list[int] = []
+
+    def slot(place: Operand) -> int:
+        index = slots.get(place)
+        if index is None:
+            index = slots[place] = len(template)
+            template.append(place.id if place.kind == Kind.IMM else 0)
+        return index
+
+    zero = slot(imm(0))
+    params = []
+    targets: dict[Operand, int] = {}
+    body: list[Instr] = []
+    for instr in tac:
+        match instr.op:
+            case Op.LABEL | Op.END:
+                continue
+            case Op.PARAMETER:
+                params.append(slot(instr.a))
+            case Op.BLOCK:
+                targets[instr.a] = len(body)
+            case _:
+                body.append(instr)
+
+    code = []
+    for instr in body:
+        op = instr.op
+        if op == Op.DECLARE:
+            code.extend((Op.COPY, slot(instr.a), zero, 0))
+        elif op == Op.JUMP:
+            code.extend((Op.JUMP, 0, targets[instr.dst] * WIDTH, 0))
+        elif instr.is_branch:
+            code.extend((op, targets[instr.dst] * WIDTH, slot(instr.a), slot(instr.b)))
+        elif op == Op.COPY:
+            code.extend((op, slot(instr.dst), slot(instr.a), 0))
+        else:
+            code.extend((op, slot(instr.dst), slot(instr.a), slot(instr.b)))
+    code.extend((Op.END, 0, 0, 0))
+
+    variables = {place.name: index for place, index in slots.items() if place.kind == Kind.VAR}
+    return BytecodeFunction(name, tuple(int(word) for word in code), variables, params, template)
+
+class VM:
+    def __init__(self, tac: list):
+        self.functions: dict[str, BytecodeFunction] = {}
+        top_level: list[Instr] = []
+        for start, end in split_regions(tac):
+            first = tac[start]
+            if first.op == Op.LABEL:
+                self.functions[first.a.name] = encode(tac[start:end], first.a.name)
+            else:
+                top_level.extend(tac[start:end])
+        self.top_level = encode(top_level, TOP_LEVEL)
+        self.globals: Optional[dict[str, int]] = None
+
+    #run a function with integer arguments; returns the values of its
+    #variables when it ends and the execution statistics
+    def call(self, name: str, *args: int, limit: Optional[int] = None) -> tuple[dict[str, int], ExecStats]:
+        if self.globals is None:
+            self.globals, _ = self.execute(self.top_level, (), {}, None)
+        function = self.functions.get(name)
+        if function is None:
+            raise VMError(f"No function named {name}")
+        if len(args) != len(function.params):
+            raise VMError(f"{name} takes {len(function.params)} arguments, got {len(args)}")
+        return self.execute(function, args, self.globals, limit)
+
+    def execute(self, function: BytecodeFunction, args, global_values: dict, limit: Optional[int]):
+        slots = list(function.template)
+        for name, index in function.variables.items():
+            if name in global_values:
+                slots[index] = global_values[name]
+        for index, value in zip(function.params, args):
+            slots[index] = value
+
+        code = function.code
+        counts = [0] * len(Op)
+        # opcodes as locals so the dispatch compares against fast locals
+        COPY, ADD, SUB, MUL, DIV = Op.COPY.value, Op.ADD.value, Op.SUB.value, Op.MUL.value, Op.DIV.value
+        EQ, LT, LE, GT, GE = Op.EQ.value, Op.LT.value, Op.LE.value, Op.GT.value, Op.GE.value
+        SHL, SHR, END, JUMP = Op.SHL.value, Op.SHR.value, Op.END.value, Op.JUMP.value
+        JEQ, JNE, JLT, JLE, JGT, JGE = (Op.JEQ.value, Op.JNE.value, Op.JLT.value,
+                                        Op.JLE.value, Op.JGT.value, Op.JGE.value)
+        low, high = WORD_MIN, WORD_MAX
+        budget = limit if limit is not None else -1
+
+        pc = 0
+        start = time.perf_counter()
+        while True:
+            op = code[pc]
+            counts[op] += 1
+            if budget == 0:
+                raise VMError(f"{function.name} exceeded the instruction limit of {limit}")
+            budget -= 1
+            if op == COPY:
+                slots[code[pc + 1]] = slots[code[pc + 2]]
+            elif op == ADD:
+                value = slots[code[pc + 2]] + slots[code[pc + 3]]
+                slots[code[pc + 1]] = value if low <= value <= high else wrap(value)
+            elif op == SUB:
+                value = slots[code[pc + 2]] - slots[code[pc + 3]]
+                slots[code[pc + 1]] = value if low <= value <= high else wrap(value)
+            elif op == JUMP:
+                pc = code[pc + 2]
+                continue
+            elif op == JGE:
+                if slots[code[pc + 2]] >= slots[code[pc + 3]]:
+                    pc = code[pc + 1]
+                    continue
+            elif op == JLT:
+                if slots[code[pc + 2]] < slots[code[pc + 3]]:
+                    pc = code[pc + 1]
+                    continue
+            elif op == JEQ:
+                if slots[code[pc + 2]] == slots[code[pc + 3]]:
+                    pc = code[pc + 1]
+                    continue
+            elif op == JNE:
+                if slots[code[pc + 2]] != slots[code[pc + 3]]:
+                    pc = code[pc + 1]
+                    continue
+            elif op == JLE:
+                if slots[code[pc + 2]] <= slots[code[pc + 3]]:
+                    pc = code[pc + 1]
+                    continue
+            elif op == JGT:
+                if slots[code[pc + 2]] > slots[code[pc + 3]]:
+                    pc = code[pc + 1]
+                    continue
+            elif op == MUL:
+                value = slots[code[pc + 2]] * slots[code[pc + 3]]
+                slots[code[pc + 1]] = value if low <= value <= high else wrap(value)
+            elif op == DIV:
+                left, right = slots[code[pc + 2]], slots[code[pc + 3]]
+                if right == 0:
+                    raise VMError(f"Division by zero in {function.name}")
+                quotient = abs(left) // abs(right)
+                slots[code[pc + 1]] = wrap(quotient if (left < 0) == (right < 0) else -quotient)
+            elif op == LT:
+                slots[code[pc + 1]] = 1 if slots[code[pc + 2]] < slots[code[pc + 3]] else 0
+            elif op == LE:
+                slots[code[pc + 1]] = 1 if slots[code[pc + 2]] <= slots[code[pc + 3]] else 0
+            elif op == GT:
+                slots[code[pc + 1]] = 1 if slots[code[pc + 2]] > slots[code[pc + 3]] else 0
+            elif op == GE:
+                slots[code[pc + 1]] = 1 if slots[code[pc + 2]] >= slots[code[pc + 3]] else 0
+            elif op == EQ:
+                slots[code[pc + 1]] = 1 if slots[code[pc + 2]] == slots[code[pc + 3]] else 0
+            elif op == SHL or op == SHR:
+                left, right = slots[code[pc + 2]], slots[code[pc + 3]]
+                if not 0 <= right < WORD_BITS:
+                    raise VMError(f"Shift by {right} in {function.name}")
+                slots[code[pc + 1]] = wrap(left << right) if op == SHL else left >> right
+            elif op == END:
+                break
+            pc += WIDTH
+        seconds = time.perf_counter() - start
+
+        # END is bookkeeping, not an executed instruction of the program
+        counts[END] -= 1
+        mix = {Op(op).name: count for op, count in enumerate(counts) if count}
+        stats = ExecStats(function.name, sum(counts), seconds, mix)
+        return {name: slots[index] for name, index in function.variables.items()}, stats
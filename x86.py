@@ -0,0 +1,372 @@
+import os
+import subprocess
+import tempfile
+from typing import Optional
+from ir import Op, Kind, Operand, Instr
+from cfg import split_regions, build_blocks, liveness
+import regalloc
+from vm import TOP_LEVEL
+
+# x86-64 backend: AT&T-syntax GNU as source for the TAC, using the linear
+# scan allocation of regalloc. Every function is a global symbol that follows
+# the System V calling convention: integer parameters arrive in rdi, rsi,
+# rdx, rcx, r8 and r9 and then on the stack, rbx and r12-r15 are preserved,
+# and the value of one of the function's variables is returned in rax (by
+# default the variable assigned last in the code). Top-level code becomes
+# __cc_top_level, which stores its variables in .bss; a function reading a
+# variable before writing it starts from that global, or from 0, as in the
+# VM. r10 and r11 are the scratch registers. With an entry function the
+# source also gets a libc-free _start that runs the top-level code, calls
+# the entry argv[1] times (default once) with fixed arguments and prints the
+# last result, so ld alone links it into an executable. AT&T syntax keeps
+# function names such as fs or and from reading as registers or operators.
+
+ARGUMENT_REGISTERS = ("rdi", "rsi", "rdx", "rcx", "r8", "r9")
+CALLEE_SAVED = ("rbx", "r12", "r13", "r14", "r15")
+SCRATCH = ("%" + regalloc.SCRATCH[0], "%" + regalloc.SCRATCH[1])
+TOP_LEVEL_SYMBOL = "__cc_top_level"
+GLOBAL_PREFIX = "__cc_global_"
+
+ARITHMETIC = {Op.ADD: "addq", Op.SUB: "subq", Op.MUL: "imulq", Op.SHL: "salq", Op.SHR: "sarq"}
+SETCC = {Op.EQ: "sete", Op.LT: "setl", Op.LE: "setle", Op.GT: "setg", Op.GE: "setge"}
+JCC = {Op.JEQ: "je", Op.JNE: "jne", Op.JLT: "jl", Op.JLE: "jle", Op.JGT: "jg", Op.JGE: "jge"}
+
+class ToolchainError(Exception):
+    pass
+
+def fits_imm32(value: int) -> bool:
+    return -(1 << 31) <= value < (1 << 31)
+
+def symbol_for(name: str) -> str:
+    return TOP_LEVEL_SYMBOL if name == TOP_LEVEL else name
+
+#AT&T form of a regalloc location: rax -> %rax, [rbp-8] -> -8(%rbp)
+def att(where: str) -> str:
+    if where[0] == "[":
+        return f"{where[4:-1]}(%rbp)"
+    return "%" + where
+
+#emit callback that takes operands destination first, like the TAC, and
+#writes them in AT&T order
+def emitter(lines: list):
+    def emit(op: str, *operands: str):
+        lines.append(f"    {op} {', '.join(reversed(operands))}" if operands else f"    {op}")
+    return emit
+
+#variable the function returns by default: the one assigned last in the code
+def default_result(tac: list) -> Optional[str]:
+    for instr in reversed(tac):
+        if instr.op == Op.COPY or instr.is_binary:
+            if instr.dst.kind == Kind.VAR:
+                return instr.dst.name
+    return None
+
+#assembly lines of one region of TAC as a function; result names the
+#variable returned in rax, global_names the variables kept in .bss
+def function_lines(tac: list, name: str, global_names, registers=regalloc.REGISTERS,
+                   result: Optional[str] = None) -> tuple[list[str], regalloc.AllocStats]:
+    top_level = name == TOP_LEVEL
+    symbol = symbol_for(name)
+    variables = {place.name: place for instr in tac for place in (instr.dst, instr.a, instr.b)
+                 if place is not None and place.kind == Kind.VAR}
+    if top_level:
+        exit_live = frozenset(variables.values())
+    else:
+        exit_live = frozenset([variables[result]]) if result in variables else frozenset()
+    if tac:
+        locations, stats = regalloc.allocate(tac, 0, len(tac), registers, exit_live)
+        live_in, _ = liveness(tac, build_blocks(tac, 0, len(tac)), exit_live)
+    else:
+        locations, stats, live_in = {}, regalloc.AllocStats(name, 0, 0, 0, 0), [set()]
+
+    lines = []
+    emit = emitter(lines)
+
+    def location(place: Operand) -> str:
+        return att(locations[place])
+
+    def in_memory(place: Operand) -> bool:
+        return not place.is_imm and locations[place][0] == "["
+
+    def global_slot(place: Operand) -> str:
+        return f"{GLOBAL_PREFIX}{place.name}(%rip)"
+
+    # load any operand into a register
+    def load(register: str, place: Operand):
+        if place.is_imm:
+            emit("movq" if fits_imm32(place.id) else "movabsq", register, f"${place.id}")
+        elif location(place) != register:
+            emit("movq", register, location(place))
+
+    # an operand for the source side of add/cmp; wide immediates, and memory
+    # when the other side is in memory too, go through scratch
+    def source(place: Operand, scratch: str, memory_ok=True) -> str:
+        if place.is_imm and fits_imm32(place.id):
+            return f"${place.id}"
+        if place.is_imm or not memory_ok and in_memory(place):
+            load(scratch, place)
+            return scratch
+        return location(place)
+
+    def move(target: str, operand: str, target_in_memory: bool, operand_in_memory: bool):
+        if target == operand:
+            return
+        if target_in_memory and operand_in_memory:
+            emit("movq", SCRATCH[0], operand)
+            operand = SCRATCH[0]
+        emit("movq", target, operand)
+
+    # store a register into the location of place
+    def store(place: Operand, register: str):
+        move(location(place), register, in_memory(place), False)
+
+    def local_label(place: Operand) -> str:
+        return f".L{symbol}_{place.name}"
+
+    saved = sorted(set(locations.values()) & set(CALLEE_SAVED), key=CALLEE_SAVED.index)
+    frame_size = (stats.frame_size + 15) // 16 * 16
+    params = [instr.a for instr in tac if instr.op == Op.PARAMETER]
+
+    lines.append(f"    .globl {symbol}")
+    lines.append(f"    .type {symbol}, @function")
+    lines.append(f"{symbol}:")
+    emit("pushq", "%rbp")
+    emit("movq", "%rbp", "%rsp")
+    if frame_size:
+        emit("subq", "%rsp", f"${frame_size}")
+    for register in saved:
+        emit("pushq", "%" + register)
+
+    # parameters: push the argument registers first, so the moves into the
+    # allocated locations cannot overwrite an argument not yet read
+    pushed = min(len(params), len(ARGUMENT_REGISTERS))
+    for register in ARGUMENT_REGISTERS[:pushed]:
+        emit("pushq", "%" + register)
+    for number, place in enumerate(params):
+        if place not in locations:
+            continue
+        if number < pushed:
+            incoming = f"{8 * (pushed - 1 - number)}(%rsp)"
+        else:
+            incoming = f"{16 + 8 * (number - len(ARGUMENT_REGISTERS))}(%rbp)"
+        move(location(place), incoming, in_memory(place), True)
+    if pushed:
+        emit("addq", "%rsp", f"${8 * pushed}")
+
+    # values read before they are written start from the globals, or 0
+    for place in sorted(live_in[0], key=lambda place: place.name):
+        if place.kind == Kind.VAR and place.name in global_names and not top_level:
+            move(location(place), global_slot(place), in_memory(place), True)
+        else:
+            emit("movq", location(place), "$0")
+
+    def epilogue():
+        if top_level:
+            for place in variables.values():
+                move(global_slot(place), location(place), True, in_memory(place))
+            emit("xorl", "%eax", "%eax")
+        elif result in variables:
+            load("%rax", variables[result])
+        else:
+            emit("xorl", "%eax", "%eax")
+        for register in reversed(saved):
+            emit("popq", "%" + register)
+        emit("movq", "%rsp", "%rbp")
+        emit("popq", "%rbp")
+        emit("ret")
+
+    for instr in tac:
+        op = instr.op
+        if op == Op.LABEL or op == Op.PARAMETER:
+            continue
+        elif op == Op.END:
+            epilogue()
+        elif op == Op.DECLARE:
+            if instr.a in locations:
+                emit("movq", location(instr.a), "$0")
+        elif op == Op.BLOCK:
+            lines.append(f"{local_label(instr.a)}:")
+        elif op == Op.JUMP:
+            emit("jmp", local_label(instr.dst))
+        elif instr.is_branch or op in SETCC:
+            if instr.a.is_imm:
+                load(SCRATCH[0], instr.a)
+                left = SCRATCH[0]
+            else:
+                left = location(instr.a)
+            emit("cmpq", left, source(instr.b, SCRATCH[1], memory_ok=not in_memory(instr.a)))
+            if instr.is_branch:
+                emit(JCC[op], local_label(instr.dst))
+            else:
+                emit(SETCC[op], SCRATCH[0] + "b")
+                emit("movzbq", SCRATCH[0], SCRATCH[0] + "b")
+                store(instr.dst, SCRATCH[0])
+        elif op == Op.COPY:
+            if in_memory(instr.dst):
+                move(location(instr.dst), source(instr.a, SCRATCH[0]), True, in_memory(instr.a))
+            else:
+                load(location(instr.dst), instr.a)
+        elif op == Op.DIV:
+            # idivq works on rdx:rax, which may hold live values
+            load(SCRATCH[1], instr.b)
+            emit("pushq", "%rax")
+            emit("pushq", "%rdx")
+            load("%rax", instr.a)
+            emit("cqto")
+            emit("idivq", SCRATCH[1])
+            emit("movq", SCRATCH[1], "%rax")
+            emit("popq", "%rdx")
+            emit("popq", "%rax")
+            store(instr.dst, SCRATCH[1])
+        elif (op == Op.SHL or op == Op.SHR) and not instr.b.is_imm:
+            # a variable shift count has to be in cl
+            load(SCRATCH[0], instr.a)
+            load(SCRATCH[1], instr.b)
+            emit("pushq", "%rcx")
+            emit("movq", "%rcx", SCRATCH[1])
+            emit(ARITHMETIC[op], SCRATCH[0], "%cl")
+            emit("popq", "%rcx")
+            store(instr.dst, SCRATCH[0])
+        else:
+            target = location(instr.dst)
+            # two-operand form in place when the destination is a register
+            # the right operand does not live in
+            if not in_memory(instr.dst) and (instr.b.is_imm or location(instr.b) != target):
+                load(target, instr.a)
+                emit(ARITHMETIC[op], target, source(instr.b, SCRATCH[1]))
+            else:
+                load(SCRATCH[0], instr.a)
+                emit(ARITHMETIC[op], SCRATCH[0], source(instr.b, SCRATCH[1]))
+                store(instr.dst, SCRATCH[0])
+    if not tac or tac[-1].op != Op.END:
+        epilogue()
+    lines.append(f"    .size {symbol}, .-{symbol}")
+    return lines, stats
+
+#_start: run the top-level code, call entry argv[1] times and print the
+#last result in decimal
+def driver_lines(entry: str, args) -> list[str]:
+    lines = ["    .globl _start", "_start:"]
+    emit = emitter(lines)
+
+    emit("movq", "%r12", "$1")
+    emit("cmpq", "(%rsp)", "$2")
+    emit("jl", ".Lcc_run")
+    emit("movq", "%rsi", "16(%rsp)")
+    emit("xorl", "%r12d", "%r12d")
+    lines.append(".Lcc_parse:")
+    emit("movzbl", "%eax", "(%rsi)")
+    emit("testl", "%eax", "%eax")
+    emit("jz", ".Lcc_run")
+    emit("subl", "%eax", "$48")
+    emit("imulq", "%r12", "$10")
+    emit("addq", "%r12", "%rax")
+    emit("incq", "%rsi")
+    emit("jmp", ".Lcc_parse")
+    lines.append(".Lcc_run:")
+    emit("andq", "%rsp", "$-16")
+    emit("call", TOP_LEVEL_SYMBOL)
+    emit("xorl", "%r13d", "%r13d")
+    emit("testq", "%r12", "%r12")
+    emit("jz", ".Lcc_print")
+    lines.append(".Lcc_loop:")
+    stacked = list(args[len(ARGUMENT_REGISTERS):])
+    padding = 8 if len(stacked) % 2 else 0
+    if padding:
+        emit("subq", "%rsp", "$8")
+    for value in reversed(stacked):
+        emit("movabsq", SCRATCH[0], f"${value}")
+        emit("pushq", SCRATCH[0])
+    for register, value in zip(ARGUMENT_REGISTERS, args):
+        emit("movabsq", "%" + register, f"${value}")
+    emit("call", entry)
+    if stacked:
+        emit("addq", "%rsp", f"${8 * len(stacked) + padding}")
+    emit("movq", "%r13", "%rax")
+    emit("decq", "%r12")
+    emit("jnz", ".Lcc_loop")
+
+    # digits are written backwards from the end of the buffer; the unsigned
+    # divide also handles the most negative value
+    lines.append(".Lcc_print:")
+    emit("leaq", "%rdi", "__cc_buffer+31(%rip)")
+    emit("movb", "(%rdi)", "$10")
+    emit("movq", "%rax", "%r13")
+    emit("testq", "%rax", "%rax")
+    emit("jns", ".Lcc_digits")
+    emit("negq", "%rax")
+    lines.append(".Lcc_digits:")
+    emit("xorl", "%edx", "%edx")
+    emit("movq", "%rcx", "$10")
+    emit("divq", "%rcx")
+    emit("addb", "%dl", "$48")
+    emit("decq", "%rdi")
+    emit("movb", "(%rdi)", "%dl")
+    emit("testq", "%rax", "%rax")
+    emit("jnz", ".Lcc_digits")
+    emit("testq", "%r13", "%r13")
+    emit("jns", ".Lcc_write")
+    emit("decq", "%rdi")
+    emit("movb", "(%rdi)", "$45")
+    lines.append(".Lcc_write:")
+    emit("leaq", "%rdx", "__cc_buffer+32(%rip)")
+    emit("subq", "%rdx", "%rdi")
+    emit("movq", "%rsi", "%rdi")
+    emit("movl", "%edi", "$1")
+    emit("movl", "%eax", "$1")
+    emit("syscall")
+    emit("movl", "%eax", "$60")
+    emit("xorl", "%edi", "%edi")
+    emit("syscall")
+    return lines
+
+#GNU as source of a whole program and the allocation statistics of each
+#function; results maps a function name to the variable it returns
+def program_source(tac: list, registers=regalloc.REGISTERS, results: Optional[dict[str, str]] = None,
+                   entry: Optional[str] = None, args=()) -> tuple[str, list[regalloc.AllocStats]]:
+    functions: list[tuple[str, list[Instr]]] = []
+    top_level: list[Instr] = []
+    for start, end in split_regions(tac):
+        first = tac[start]
+        if first.op == Op.LABEL:
+            functions.append((first.a.name, tac[start:end]))
+        else:
+            top_level.extend(tac[start:end])
+    global_names = sorted({place.name for instr in top_level for place in (instr.dst, instr.a, instr.b)
+                           if place is not None and place.kind == Kind.VAR})
+    if entry is not None and entry not in {name for name, _ in functions}:
+        raise ValueError(f"No function named {entry}")
+
+    lines = ["    .text"]
+    stats = []
+    for name, code in functions + [(TOP_LEVEL, top_level)]:
+        result = (results or {}).get(name) or default_result(code)
+        function, function_stats = function_lines(code, name, global_names, registers, result)
+        lines.extend(function)
+        stats.append(function_stats)
+    if entry is not None:
+        lines.extend(driver_lines(entry, args))
+
+    lines.append("    .bss")
+    lines.append("    .p2align 3")
+    for name in global_names:
+        lines.append(f"{GLOBAL_PREFIX}{name}:")
+        lines.append("    .zero 8")
+    if entry is not None:
+        lines.append("__cc_buffer:")
+        lines.append("    .zero 32")
+    lines.append('    .section .note.GNU-stack,"",@progbits')
+    return "\n".join(lines) + "\n", stats
+
+#assemble source with as and link it with ld into the executable output
+def link(source: str, output: str, assembler="as", linker="ld"):
+    with tempfile.TemporaryDirectory() as directory:
+        object_path = os.path.join(directory, "program.o")
+        for command, text in (([assembler, "--64", "-o", object_path, "-"], source),
+                              ([linker, "-o", output, object_path], None)):
+            try:
+                done = subprocess.run(command, input=text, capture_output=True, text=True)
+            except FileNotFoundError:
+                raise ToolchainError(f"{command[0]} not found")
+            if done.returncode != 0:
+                raise ToolchainError(f"{command[0]} failed:\n{done.stderr.strip()}")